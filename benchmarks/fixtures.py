@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Synthetic, reproducible test data for the benchmarks.
+"""
+
+import random
+import uuid
+from xml.sax.saxutils import escape, quoteattr
+
+
+WORDS = (u"love night day heart time world life dream light fire rain song "
+         u"blue dance way home girl baby man moon star soul sun road river "
+         u"caf\xe9 stra\xdfe \xe9t\xe9 m\xfcde").split()
+
+
+def make_random(seed=0):
+    return random.Random(seed)
+
+
+def make_mbid(rnd):
+    return unicode(uuid.UUID(int=rnd.getrandbits(128), version=4))
+
+
+def make_title(rnd, min_words=1, max_words=4):
+    return u" ".join(rnd.choice(WORDS) for i in range(rnd.randint(min_words, max_words))).title()
+
+
+def _artist_credit(rnd, artists):
+    parts = [u'<artist-credit>']
+    for artist_id, name in rnd.sample(artists, rnd.randint(1, 2)):
+        parts.append(u'<name-credit joinphrase=" &amp; "><artist id="%s">'
+                     u'<name>%s</name><sort-name>%s</sort-name>'
+                     u'<alias-list count="1"><alias locale="en" sort-name=%s primary="primary">%s</alias></alias-list>'
+                     u'</artist></name-credit>' % (artist_id, escape(name), escape(name),
+                                                   quoteattr(name), escape(name)))
+    parts.append(u'</artist-credit>')
+    return u''.join(parts)
+
+
+def _relations(rnd, artists, count):
+    parts = [u'<relation-list target-type="artist">']
+    for i in range(count):
+        artist_id, name = rnd.choice(artists)
+        parts.append(u'<relation type="performer" type-id="%s"><target>%s</target>'
+                     u'<direction>backward</direction><attribute-list><attribute>guitar</attribute></attribute-list>'
+                     u'<artist id="%s"><name>%s</name><sort-name>%s</sort-name></artist></relation>'
+                     % (make_mbid(rnd), artist_id, artist_id, escape(name), escape(name)))
+    parts.append(u'</relation-list>')
+    parts.append(u'<relation-list target-type="work"><relation type="performance">'
+                 u'<target>%s</target><work id="%s"><title>%s</title><language>eng</language>'
+                 u'</work></relation></relation-list>'
+                 % ((make_mbid(rnd),) * 2 + (escape(make_title(rnd)),)))
+    return u''.join(parts)
+
+
+def generate_release_xml(media=4, tracks=25, relations=6, seed=0):
+    """Return a ws/2 release document with artist credits and relationships.
+
+    The default size is roughly what a box set with full relationships
+    looks like.
+    """
+    rnd = make_random(seed)
+    artists = [(make_mbid(rnd), make_title(rnd, 2, 3)) for i in range(20)]
+    parts = [u'<?xml version="1.0" encoding="UTF-8"?>'
+             u'<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#" xmlns:ext="http://musicbrainz.org/ns/ext#-2.0">'
+             u'<release id="%s"><title>%s</title><status>Official</status><quality>normal</quality>'
+             u'<text-representation><language>eng</language><script>Latn</script></text-representation>'
+             % (make_mbid(rnd), escape(make_title(rnd)))]
+    parts.append(_artist_credit(rnd, artists))
+    parts.append(u'<release-group id="%s" type="Album"><title>%s</title><first-release-date>1999</first-release-date>'
+                 u'<primary-type>Album</primary-type></release-group>' % (make_mbid(rnd), escape(make_title(rnd))))
+    parts.append(u'<date>1999-03-02</date><country>GB</country><barcode>012345678929</barcode>')
+    parts.append(u'<label-info-list count="1"><label-info><catalog-number>ABC 123</catalog-number>'
+                 u'<label id="%s"><name>Label</name><sort-name>Label</sort-name></label></label-info></label-info-list>'
+                 % make_mbid(rnd))
+    parts.append(_relations(rnd, artists, relations))
+    parts.append(u'<medium-list count="%d"><track-count>%d</track-count>' % (media, media * tracks))
+    for m in range(media):
+        parts.append(u'<medium><position>%d</position><format>CD</format><track-list count="%d" offset="0">'
+                     % (m + 1, tracks))
+        for t in range(tracks):
+            length = rnd.randint(60000, 600000)
+            parts.append(u'<track id="%s"><position>%d</position><number>%d</number><length>%d</length>'
+                         % (make_mbid(rnd), t + 1, t + 1, length))
+            parts.append(u'<recording id="%s"><title>%s</title><length>%d</length>'
+                         % (make_mbid(rnd), escape(make_title(rnd)), length))
+            parts.append(_artist_credit(rnd, artists))
+            parts.append(u'<isrc-list count="1"><isrc id="GBAAA%07d"/></isrc-list>' % (m * tracks + t))
+            parts.append(_relations(rnd, artists, relations))
+            parts.append(u'</recording></track>')
+        parts.append(u'</track-list></medium>')
+    parts.append(u'</medium-list></release></metadata>')
+    return u''.join(parts).encode('utf-8')
+
+
+NAMING_SCRIPTS = {
+    'default': u"$if2(%albumartist%,%artist%)/%album%/$if($gt(%totaldiscs%,1),%discnumber%-,)"
+               u"$num(%tracknumber%,2)$if(%compilation%, %artist% -,) %title%",
+    'regex': ur"$rreplace($if2(%albumartist%,%artist%),[^\\w\\s],_)/"
+             ur"$if(%date%,[$left(%date%,4)] ,)$rreplace(%album%,\\s*\\\(.*\\\)\$,)/"
+             ur"$num(%tracknumber%,2) - $rreplace(%title%,[:?*],_)",
+    'variables': u"$set(_a,$if2(%albumartist%,%artist%))$set(_d,$left(%date%,4))"
+                 u"$lower($left(%_a%,1))/%_a%/$if(%_d%,%_d% - ,)%album%/"
+                 u"$num(%discnumber%,1)$num(%tracknumber%,2) %title%",
+}
+
+
+def _noisy(rnd, text):
+    """Return a variant of `text` as found in badly tagged files."""
+    choice = rnd.random()
+    if choice < 0.6:
+        return text
+    elif choice < 0.7:
+        return text.lower()
+    elif choice < 0.8:
+        return text.upper()
+    elif choice < 0.9 and len(text) > 3:
+        # a typo
+        i = rnd.randrange(len(text) - 1)
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    else:
+        return text + rnd.choice((u" (Remastered)", u" [Disc 1]", u"!", u" - EP"))
+
+
+def generate_files_metadata(count, tracks_per_album=12, seed=0):
+    """Return `count` dicts with the tags of files from many albums.
+
+    Album and artist names get noise applied, like case changes, typos
+    and suffixes, as found in real collections.
+    """
+    rnd = make_random(seed)
+    files = []
+    album_count = max(1, count // tracks_per_album)
+    artists = [make_title(rnd, 1, 3) for i in range(max(1, album_count // 3))]
+    for a in range(album_count):
+        album = make_title(rnd, 1, 4)
+        albumartist = rnd.choice(artists)
+        date = u"%04d-%02d-%02d" % (rnd.randint(1960, 2013), rnd.randint(1, 12), rnd.randint(1, 28))
+        for t in range(tracks_per_album):
+            if len(files) >= count:
+                break
+            files.append({
+                'title': make_title(rnd),
+                'artist': _noisy(rnd, albumartist),
+                'albumartist': albumartist,
+                'album': _noisy(rnd, album),
+                'date': date,
+                'tracknumber': unicode(t + 1),
+                'totaltracks': unicode(tracks_per_album),
+                'discnumber': u'1',
+                'totaldiscs': u'1',
+                '~length': rnd.randint(60000, 600000),
+            })
+    while len(files) < count:
+        files.append(dict(rnd.choice(files)))
+    return files
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""Usage: python -m benchmarks [OPTIONS] [BENCHMARK] ...
+
+Runs the benchmarks (all by default) and reports operations per second and
+the peak memory of the process running the benchmark. Every benchmark runs
+in its own process, so the memory numbers don't influence each other.
+
+Options:
+    -l, --list              list the available benchmarks
+    -s, --scale=N           multiply the corpus sizes by N (default 1.0)
+    -t, --min-time=S        run each benchmark for at least S seconds (default 2)
+    --save=FILE             save the results as JSON baseline
+    --compare=FILE          compare the results to a JSON baseline, exits
+                            with an error if a benchmark got slower
+    --tolerance=F           allowed slowdown for --compare (default 0.15)
+"""
+
+import getopt
+import json
+import subprocess
+import sys
+import timeit
+
+
+def peak_memory():
+    """Peak resident memory of this process in KiB, None if unknown."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes instead of KiB
+        maxrss //= 1024
+    return maxrss
+
+
+def run_benchmark(name, scale, min_time):
+    """Run a single benchmark in this process and return its results."""
+    from benchmarks.suite import BENCHMARKS, setup_environment
+    setup_environment()
+    setup = dict(BENCHMARKS)[name]
+    func, ops = setup(scale)
+    timer = timeit.default_timer
+    # warm up caches and lazy imports
+    func()
+    times = []
+    total = 0.0
+    while total < min_time or len(times) < 3:
+        start = timer()
+        func()
+        elapsed = timer() - start
+        times.append(elapsed)
+        total += elapsed
+    best = min(times)
+    return {
+        "name": name,
+        "ops": ops,
+        "runs": len(times),
+        "best": best,
+        "ops_per_sec": ops / best if best > 0 else float("inf"),
+        "peak_memory_kib": peak_memory(),
+    }
+
+
+def run_in_subprocess(name, scale, min_time):
+    cmd = [sys.executable, "-m", "benchmarks", "--child", name,
+           "--scale", repr(scale), "--min-time", repr(min_time)]
+    output = subprocess.check_output(cmd)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def format_memory(kib):
+    if kib is None:
+        return "?"
+    return "%.1f MiB" % (kib / 1024.0)
+
+
+def compare(results, baseline, tolerance):
+    """Print the change compared to `baseline`, return the regressions."""
+    regressions = []
+    old_results = dict((r["name"], r) for r in baseline["results"])
+    print
+    print "%-24s %14s %14s %9s" % ("Compared to baseline", "old ops/sec", "new ops/sec", "change")
+    for result in results:
+        old = old_results.get(result["name"])
+        if old is None:
+            continue
+        change = result["ops_per_sec"] / old["ops_per_sec"] - 1.0
+        flag = ""
+        if change < -tolerance:
+            flag = "  SLOWER"
+            regressions.append(result["name"])
+        print "%-24s %14.1f %14.1f %+8.1f%%%s" % (
+            result["name"], old["ops_per_sec"], result["ops_per_sec"], change * 100, flag)
+    return regressions
+
+
+def main(argv):
+    try:
+        opts, args = getopt.getopt(argv, "hls:t:", [
+            "help", "list", "scale=", "min-time=", "save=", "compare=",
+            "tolerance=", "child="])
+    except getopt.GetoptError as e:
+        print >>sys.stderr, e
+        print >>sys.stderr, __doc__
+        return 2
+    scale = 1.0
+    min_time = 2.0
+    save = baseline = child = None
+    tolerance = 0.15
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print __doc__
+            return 0
+        elif opt in ("-l", "--list"):
+            from benchmarks.suite import BENCHMARKS
+            for name, setup in BENCHMARKS:
+                print name
+            return 0
+        elif opt in ("-s", "--scale"):
+            scale = float(arg)
+        elif opt in ("-t", "--min-time"):
+            min_time = float(arg)
+        elif opt == "--save":
+            save = arg
+        elif opt == "--compare":
+            baseline = arg
+        elif opt == "--tolerance":
+            tolerance = float(arg)
+        elif opt == "--child":
+            child = arg
+
+    if child is not None:
+        print json.dumps(run_benchmark(child, scale, min_time))
+        return 0
+
+    from benchmarks.suite import BENCHMARKS
+    names = [name for name, setup in BENCHMARKS]
+    for name in args:
+        if name not in names:
+            print >>sys.stderr, "Unknown benchmark: %s" % name
+            return 2
+    if args:
+        names = [name for name in names if name in args]
+
+    results = []
+    print "%-24s %10s %14s %12s" % ("Benchmark", "ops", "ops/sec", "peak memory")
+    for name in names:
+        result = run_in_subprocess(name, scale, min_time)
+        results.append(result)
+        print "%-24s %10d %14.1f %12s" % (name, result["ops"], result["ops_per_sec"],
+                                          format_memory(result["peak_memory_kib"]))
+        sys.stdout.flush()
+
+    if save:
+        with open(save, "w") as f:
+            json.dump({"scale": scale, "python": sys.version.split()[0], "results": results},
+                      f, indent=2, sort_keys=True)
+        print "Results saved to %s" % save
+
+    if baseline:
+        with open(baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != scale:
+            print "Warning: baseline was recorded with scale %s" % baseline.get("scale")
+        if compare(results, baseline, tolerance):
+            return 1
+    return 0
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Memory used by the embedded images of a loaded folder.
+
+Writes a synthetic folder of MP3 files, every album with its own cover
+embedded in all of its tracks, and loads it twice: keeping the bytes of
+the images in the image store, which holds every cover once, and with
+references that read them when needed.
+
+Usage: python -m benchmarks.image_memory [tracks] [cover size in KB]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+from mutagen import id3
+from PyQt4 import QtCore
+from picard import config
+from picard.util.imageref import image_data
+from benchmarks.fixtures import make_random, make_title
+from benchmarks.suite import SETTINGS
+from benchmarks.xmlnode_memory import deep_sizeof
+
+
+TRACKS_PER_ALBUM = 12
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, 'test', 'data', 'test.mp3')
+
+
+class FakeSignal(object):
+
+    def emit(self, *args):
+        pass
+
+
+class FakeTagger(object):
+
+    tag_cache = None
+    tagger_stats_changed = FakeSignal()
+
+
+def setup_environment():
+    config.setting = dict(SETTINGS,
+                          rating_steps=6,
+                          rating_user_email=u'users@musicbrainz.org')
+    QtCore.QObject.config = config
+    QtCore.QObject.tagger = FakeTagger()
+
+
+def generate_folder(path, tracks, cover_size, seed=0):
+    rnd = make_random(seed)
+    filenames = []
+    for i in range(tracks):
+        if i % TRACKS_PER_ALBUM == 0:
+            album = make_title(rnd)
+            cover = 'JFIF' + ('%0*x' % (cover_size * 2, rnd.getrandbits(cover_size * 8))).decode('hex')
+        filename = os.path.join(path, '%05d.mp3' % i)
+        shutil.copyfile(TEMPLATE, filename)
+        tags = id3.ID3()
+        tags.add(id3.TIT2(encoding=3, text=make_title(rnd)))
+        tags.add(id3.TALB(encoding=3, text=album))
+        tags.add(id3.TRCK(encoding=3, text=unicode(i % TRACKS_PER_ALBUM + 1)))
+        tags.add(id3.APIC(encoding=3, mime='image/jpeg', type=3, desc=u'', data=cover))
+        tags.save(filename)
+        filenames.append(filename)
+    return filenames
+
+
+def load_folder(filenames, lazy):
+    import picard.formats
+    files = []
+    for filename in filenames:
+        f = picard.formats.open(filename)
+        if lazy:
+            metadata = f._load_cached(filename)
+        else:
+            metadata = f._load(filename)
+        f._copy_loaded_metadata(metadata)
+        files.append(f)
+    return files
+
+
+def measure(filenames, lazy):
+    start = time.time()
+    files = load_folder(filenames, lazy)
+    elapsed = time.time() - start
+    size = deep_sizeof([(f.orig_metadata, f.orig_metadata.images, f.metadata, f.metadata.images)
+                        for f in files])
+    return files, size, elapsed
+
+
+def main(argv):
+    tracks = int(argv[1]) if len(argv) > 1 else 5000
+    cover_size = int(argv[2]) * 1024 if len(argv) > 2 else 100 * 1024
+    setup_environment()
+    path = tempfile.mkdtemp()
+    try:
+        filenames = generate_folder(path, tracks, cover_size)
+        files, eager, eager_time = measure(filenames, False)
+        del files
+        files, lazy, lazy_time = measure(filenames, True)
+        start = time.time()
+        image_data(files[0].metadata.images[0])
+        read_time = time.time() - start
+    finally:
+        shutil.rmtree(path)
+    print "Folder: %d tracks, %d KB cover per album" % (tracks, cover_size // 1024)
+    print "Image store:      %12d bytes (%d bytes per track), loaded in %.1f s" % (
+        eager, eager // tracks, eager_time)
+    print "Image references: %12d bytes (%d bytes per track), loaded in %.1f s" % (
+        lazy, lazy // tracks, lazy_time)
+    print "Saved:            %11.1f%%" % (100.0 * (eager - lazy) / eager)
+    print "Reading one cover on demand: %.1f ms" % (read_time * 1000)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
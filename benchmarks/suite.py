@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Benchmarks of the hot paths in matching, clustering, scripting and parsing.
+
+Every benchmark is a function taking the corpus scale and returning a
+callable that runs the benchmark once and the number of operations one
+run performs.
+"""
+
+from PyQt4 import QtCore
+from picard import config
+from benchmarks.fixtures import (
+    NAMING_SCRIPTS,
+    generate_files_metadata,
+    generate_release_xml,
+    )
+
+
+BENCHMARKS = []
+
+SETTINGS = {
+    'enabled_plugins': u'',
+    'preferred_release_countries': u'GB  US',
+    'preferred_release_formats': u'CD  Digital Media',
+    'release_type_scores': u'Album 0.5 Single 0.5 Other 0.5',
+    'standardize_artists': False,
+    'translate_artist_names': False,
+    'artist_locale': u'en',
+}
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return register
+
+
+class FakeReleaseGroup(object):
+
+    loaded_albums = set()
+
+
+class FakeTagger(object):
+
+    def get_release_group_by_id(self, id):
+        return FakeReleaseGroup()
+
+
+class FakeFile(object):
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+
+def setup_environment():
+    """Make picard usable without a running Tagger."""
+    config.setting = dict(SETTINGS)
+    QtCore.QObject.config = config
+    QtCore.QObject.tagger = FakeTagger()
+
+
+def make_metadata(tags):
+    from picard.metadata import Metadata
+    metadata = Metadata()
+    for name, value in tags.iteritems():
+        if name == '~length':
+            metadata.length = value
+        else:
+            metadata[name] = value
+    return metadata
+
+
+@benchmark("similarity2")
+def bench_similarity2(scale):
+    from picard.similarity import similarity2
+    files = generate_files_metadata(int(5000 * scale))
+    pairs = []
+    for a, b in zip(files, files[1:]):
+        pairs.append((a['album'], b['album']))
+        pairs.append((a['title'], b['title']))
+        pairs.append((a['artist'], b['albumartist']))
+
+    def run():
+        for a, b in pairs:
+            similarity2(a, b)
+    return run, len(pairs)
+
+
+@benchmark("cluster")
+def bench_cluster(scale):
+    from picard.cluster import Cluster
+    files = [FakeFile(make_metadata(tags))
+             for tags in generate_files_metadata(int(10000 * scale))]
+
+    def run():
+        for album, artist, album_files in Cluster.cluster(files, 1.0):
+            list(album_files)
+    return run, len(files)
+
+
+@benchmark("match_tracks")
+def bench_match_tracks(scale):
+    files = generate_files_metadata(int(200 * scale), tracks_per_album=int(200 * scale))
+    tracks = [make_metadata(tags) for tags in files]
+    for tags in files:
+        tags['title'] = tags['title'].lower()
+    files = [make_metadata(tags) for tags in reversed(files)]
+
+    def run():
+        for file in files:
+            for track in tracks:
+                file.compare(track)
+    return run, len(files) * len(tracks)
+
+
+@benchmark("compare_to_release")
+def bench_compare_to_release(scale):
+    from picard.cluster import Cluster
+    from picard.webservice import _read_xml
+    releases = [_read_xml(generate_release_xml(media=1, tracks=12, relations=0, seed=i)).metadata[0].release[0]
+                for i in range(25)]
+    files = [make_metadata(tags) for tags in generate_files_metadata(int(200 * scale))]
+    weights = Cluster.comparison_weights
+
+    def run():
+        for metadata in files:
+            for release in releases:
+                metadata.compare_to_release(release, weights)
+    return run, len(files) * len(releases)
+
+
+def _script_benchmark(script_name):
+    def bench_script(scale):
+        from picard.metadata import Metadata
+        from picard.script import ScriptParser
+        script = NAMING_SCRIPTS[script_name]
+        files = [make_metadata(tags) for tags in generate_files_metadata(int(2000 * scale))]
+
+        def run():
+            for metadata in files:
+                # Same as the file renaming code: evaluate on a copy
+                context = Metadata()
+                context.copy(metadata)
+                ScriptParser().eval(script, context)
+        return run, len(files)
+    return bench_script
+
+
+for _name in sorted(NAMING_SCRIPTS):
+    benchmark("script_" + _name)(_script_benchmark(_name))
+
+
+@benchmark("xml_parse")
+def bench_xml_parse(scale):
+    from picard.webservice import _read_xml
+    documents = [generate_release_xml(seed=i) for i in range(max(1, int(4 * scale)))]
+
+    def run():
+        for data in documents:
+            _read_xml(data)
+    return run, len(documents)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Memory used by a parsed release document.
+
+Compares the XmlNode tree with the previous layout, a plain object with
+three dicts and its own copy of every string.
+
+Usage: python -m benchmarks.xmlnode_memory [media] [tracks per medium]
+"""
+
+import sys
+from benchmarks.fixtures import generate_release_xml
+from picard.webservice import XmlNode, _read_xml
+
+
+class DictXmlNode(object):
+
+    def __init__(self):
+        self.text = u''
+        self.children = {}
+        self.attribs = {}
+
+
+def to_dict_nodes(node):
+    result = DictXmlNode()
+    result.text = u'%s' % node.text if node.text else u''
+    for name, children in node.children.iteritems():
+        result.children[u'%s' % name] = [to_dict_nodes(child) for child in children]
+    for name, value in node.attribs.iteritems():
+        result.attribs[u'%s' % name] = u'%s' % value
+    return result
+
+
+def deep_sizeof(obj):
+    """Size in bytes of `obj` and everything reachable from it."""
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.iterkeys())
+            stack.extend(obj.itervalues())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+        elif isinstance(obj, XmlNode):
+            stack.extend((obj.text, obj._children, obj._attribs))
+        elif hasattr(obj, '__dict__'):
+            stack.append(obj.__dict__)
+        elif hasattr(obj, '__slots__'):
+            stack.extend(getattr(obj, name) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child)
+                   for children in node.children.itervalues()
+                   for child in children)
+
+
+def main(argv):
+    media = int(argv[1]) if len(argv) > 1 else 4
+    tracks = int(argv[2]) if len(argv) > 2 else 25
+    data = generate_release_xml(media=media, tracks=tracks)
+    document = _read_xml(data)
+    # Measure first, walking the tree creates the lazy dicts
+    compact = deep_sizeof(document)
+    nodes = count_nodes(document)
+    legacy = deep_sizeof(to_dict_nodes(document))
+    print "Release document: %d bytes, %d nodes" % (len(data), nodes)
+    print "XmlNode tree:     %10d bytes (%d bytes per node)" % (compact, compact // nodes)
+    print "Dict based tree:  %10d bytes (%d bytes per node)" % (legacy, legacy // nodes)
+    print "Saved:            %9.1f%%" % (100.0 * (legacy - compact) / legacy)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -25,8 +25,6 @@ REQUEST_DELAY[(LASTFM_HOST, LASTFM_PORT)] = 200
 
 # Cache for Tags to avoid re-requesting tags within same Picard session
 _cache = {}
-# Keeps track of requests for tags made to webservice API but not yet returned (to avoid re-requesting the same URIs)
-_pending_xmlws_requests = {}
 
 # TODO: move this to an options page
 TRANSLATE_TAGS = {
@@ -68,13 +66,6 @@ def _tags_downloaded(album, metadata, min_usage, ignore, next, current, data, re
         _cache[url] = tags
         _tags_finalize(album, metadata, current + tags, next)
 
-        # Process any pending requests for the same URL
-        if url in _pending_xmlws_requests:
-            pending = _pending_xmlws_requests[url]
-            del _pending_xmlws_requests[url]
-            for delayed_call in pending:
-                delayed_call()
-
     except:
         album.tagger.log.error("Problem processing downloaded tags in last.fm plugin: %s", traceback.format_exc())
         raise
@@ -89,16 +80,12 @@ def get_tags(album, metadata, path, min_usage, ignore, next, current):
     if url in _cache:
         _tags_finalize(album, metadata, current + _cache[url], next)
     else:
-
-        # If we have already sent a request for this URL, delay this call until later
-        if url in _pending_xmlws_requests:
-            _pending_xmlws_requests[url].append(partial(get_tags, album, metadata, path, min_usage, ignore, next, current))
-        else:
-            _pending_xmlws_requests[url] = []
-            album._requests += 1
-            album.tagger.xmlws.get(LASTFM_HOST, LASTFM_PORT, path,
-                                   partial(_tags_downloaded, album, metadata, min_usage, ignore, next, current),
-                                   priority=True, important=True)
+        # Requests for an URL that is already being fetched are coalesced
+        # by the web service, all handlers get the same reply
+        album._requests += 1
+        album.tagger.xmlws.get(LASTFM_HOST, LASTFM_PORT, path,
+                               partial(_tags_downloaded, album, metadata, min_usage, ignore, next, current),
+                               priority=True, important=True)
 
 
 def encode_str(s):
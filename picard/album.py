@@ -32,6 +32,7 @@ from picard.track import Track
 from picard.script import ScriptParser
 from picard.ui.item import Item
 from picard.util import format_time, mbid_validate, asciipunct
+from picard.util.assignment import max_weight_assignment
 from picard.cluster import Cluster
 from picard.collection import Collection, user_collections, load_user_collections
 from picard.mbxml import (
@@ -53,6 +54,10 @@ class Album(DataObject, Item):
         DataObject.__init__(self, id)
         self.metadata = Metadata()
         self.tracks = []
+        self._tracks_by_trackid = {}
+        self._tracks_by_number = {}
+        self._indexed_tracks = []
+        self._track_index_stale = False
         self.loaded = False
         self.load_task = None
         self.release_group = None
@@ -238,27 +243,25 @@ class Album(DataObject, Item):
             if config.setting["enable_tagger_script"]:
                 script = config.setting["tagger_script"]
                 if script:
-                    parser = ScriptParser()
-                    for track in self._new_tracks:
-                        # Run tagger script for each track
-                        try:
-                            parser.eval(script, track.metadata)
-                        except:
-                            self.error_append(traceback.format_exc())
-                        # Strip leading/trailing whitespace
-                        track.metadata.strip_whitespace()
-                    # Run tagger script for the album itself
+                    # Run tagger script for each track and the album itself
+                    contexts = [track.metadata for track in self._new_tracks]
+                    contexts.append(self._new_metadata)
                     try:
-                        parser.eval(script, self._new_metadata)
+                        ScriptParser().eval_many(
+                            script, contexts,
+                            error=lambda context: self.error_append(traceback.format_exc()))
                     except:
                         self.error_append(traceback.format_exc())
-                    self._new_metadata.strip_whitespace()
+                    # Strip leading/trailing whitespace
+                    for metadata in contexts:
+                        metadata.strip_whitespace()
 
             for track in self.tracks:
                 for file in list(track.linked_files):
                     file.move(self.unmatched_files)
             self.metadata = self._new_metadata
             self.tracks = self._new_tracks
+            self._index_tracks()
             del self._new_metadata
             del self._new_tracks
             self.loaded = True
@@ -269,7 +272,7 @@ class Album(DataObject, Item):
                 func()
             self._after_load_callbacks = []
 
-    def load(self):
+    def load(self, refresh=False):
         if self._requests:
             log.info("Not reloading, some requests are still active.")
             return
@@ -304,7 +307,7 @@ class Album(DataObject, Item):
             inc += ['user-ratings']
         self.load_task = self.tagger.xmlws.get_release_by_id(
             self.id, self._release_request_finished, inc=inc,
-            mblogin=require_authentication)
+            mblogin=require_authentication, refresh=refresh)
 
     def run_when_loaded(self, func):
         if self.loaded:
@@ -330,30 +333,65 @@ class Album(DataObject, Item):
         self.update(update_tracks=False)
 
     def match_files(self, files, use_trackid=True):
-        """Match files to tracks on this album, based on metadata similarity or trackid."""
+        """Match files to tracks on this album, based on metadata similarity or trackid.
+
+        Files without a trackid match are assigned to the tracks so that the
+        total similarity is highest, with at most one file per track. Files
+        left over, e.g. a track in several formats, go to their best match.
+        """
+        threshold = config.setting['track_matching_threshold']
+        if use_trackid:
+            # Once per batch, this also finds tags changed by plugins
+            self._update_track_index()
+        claimed = set()
+        unmatched = []
         for file in list(files):
             if file.state == File.REMOVED:
                 continue
-            matches = []
             trackid = file.metadata['musicbrainz_trackid']
             if use_trackid and mbid_validate(trackid):
                 matches = self._get_trackid_matches(file, trackid)
-            if not matches:
-                for track in self.tracks:
-                    sim = track.metadata.compare(file.orig_metadata)
-                    if sim >= config.setting['track_matching_threshold']:
-                        matches.append((sim, track))
-            if matches:
-                matches.sort(reverse=True)
-                file.move(matches[0][1])
-            else:
+                if matches:
+                    matches.sort(reverse=True)
+                    claimed.add(matches[0][1])
+                    file.move(matches[0][1])
+                    continue
+            unmatched.append(file)
+        if not unmatched:
+            return
+
+        tracks = self.tracks
+        track_values = [track.metadata.comparison_values() for track in tracks]
+        compare = Metadata.compare_values
+        scores = []
+        for file in unmatched:
+            file_values = file.orig_metadata.comparison_values()
+            row = []
+            for values in track_values:
+                sim = compare(values, file_values, threshold)
+                row.append(sim if sim >= threshold else None)
+            scores.append(row)
+
+        free = [track not in claimed for track in tracks]
+        assignment = max_weight_assignment(
+            [[sim if is_free else None for sim, is_free in zip(row, free)]
+             for row in scores])
+        for file, row, index in zip(unmatched, scores, assignment):
+            if index is None:
+                candidates = [i for i, sim in enumerate(row) if sim is not None]
+                if candidates:
+                    index = max(candidates, key=row.__getitem__)
+            if index is None:
                 file.move(self.unmatched_files)
+            else:
+                file.move(tracks[index])
 
     def match_file(self, file, trackid=None):
         """Match the file on a track on this album, based on trackid or metadata similarity."""
         if file.state == File.REMOVED:
             return
         if trackid is not None:
+            self._check_track_index()
             matches = self._get_trackid_matches(file, trackid)
             if matches:
                 matches.sort(reverse=True)
@@ -361,21 +399,61 @@ class Album(DataObject, Item):
                 return
         self.match_files([file], use_trackid=False)
 
+    def _index_tracks(self):
+        """Rebuild the track lookups by trackid and by disc and track number."""
+        self._tracks_by_trackid = {}
+        self._tracks_by_number = {}
+        self._indexed_tracks = []
+        self._track_index_stale = False
+        for track in self.tracks:
+            self._index_track(track)
+
+    @staticmethod
+    def _track_key(track):
+        tm = track.metadata
+        return (tm['musicbrainz_trackid'], tm['discnumber'], tm['tracknumber'])
+
+    def _index_track(self, track):
+        key = self._track_key(track)
+        self._indexed_tracks.append((track, key))
+        trackid, discnumber, tracknumber = key
+        self._tracks_by_trackid.setdefault(trackid, []).append(track)
+        self._tracks_by_number.setdefault((discnumber, tracknumber), []).append(track)
+
+    def invalidate_track_index(self):
+        """Rebuild the track lookups before they are used next, e.g. because
+        the trackid, disc or track number of a track was edited."""
+        self._track_index_stale = True
+
+    def _check_track_index(self):
+        if self._track_index_stale or len(self._indexed_tracks) != len(self.tracks):
+            self._index_tracks()
+
+    def _update_track_index(self):
+        """Rebuild the track lookups if any track or its numbers changed."""
+        indexed = self._indexed_tracks
+        if (self._track_index_stale or len(indexed) != len(self.tracks) or
+                any(track is not t or self._track_key(track) != key
+                    for track, (t, key) in zip(self.tracks, indexed))):
+            self._index_tracks()
+
+    def get_tracks_by_trackid(self, trackid):
+        """Return the tracks with the given trackid, in album order."""
+        self._check_track_index()
+        return self._tracks_by_trackid.get(trackid, [])
+
     def _get_trackid_matches(self, file, trackid):
-        matches = []
         tracknumber = file.metadata['tracknumber']
         discnumber = file.metadata['discnumber']
-        for track in self.tracks:
-            tm = track.metadata
-            if trackid == tm['musicbrainz_trackid']:
-                if tracknumber == tm['tracknumber']:
-                    if discnumber == tm['discnumber']:
-                        matches.append((4.0, track))
-                        break
-                    else:
-                        matches.append((3.0, track))
-                else:
-                    matches.append((2.0, track))
+        for track in self._tracks_by_number.get((discnumber, tracknumber), ()):
+            if trackid == track.metadata['musicbrainz_trackid']:
+                return [(4.0, track)]
+        matches = []
+        for track in self._tracks_by_trackid.get(trackid, ()):
+            if tracknumber == track.metadata['tracknumber']:
+                matches.append((3.0, track))
+            else:
+                matches.append((2.0, track))
         return matches
 
     def can_save(self):
@@ -503,6 +581,21 @@ class NatAlbum(Album):
     def _finalize_loading(self, error):
         self.update()
 
+    def _index_track(self, track):
+        # The metadata of a NAT is only there once it is loaded, but its id
+        # is the recording id and doesn't change
+        self._indexed_tracks.append((track, track.id))
+        self._tracks_by_trackid.setdefault(track.id, []).append(track)
+
+    def _update_track_index(self):
+        # Tracks are only ever added and their ids don't change
+        self._check_track_index()
+
+    def add_track(self, track):
+        self._check_track_index()
+        self.tracks.append(track)
+        self._index_track(track)
+
     def can_refresh(self):
         return False
 
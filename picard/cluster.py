@@ -19,12 +19,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
 import re
+import threading
+from collections import deque
 from operator import itemgetter
-from heapq import heappush, heappop
 from PyQt4 import QtCore
 from picard import config
 from picard.metadata import Metadata
-from picard.similarity import similarity2, similarity
+from picard.similarity import similarity_matrix
 from picard.ui.item import Item
 from picard.util import format_time
 from picard.mbxml import artist_credit_from_node
@@ -179,52 +180,18 @@ class Cluster(QtCore.QObject, Item):
             self.lookup_task = None
 
     @staticmethod
-    def cluster(files, threshold):
-        artistDict = ClusterDict()
-        albumDict = ClusterDict()
-        tracks = []
-        for file in files:
-            album = file.metadata["album"]
-            # For each track, record the index of the artist and album within the clusters
-            tracks.append((artistDict.add(file.metadata["artist"]),
-                           albumDict.add(album)))
-
-        artist_cluster_engine = ClusterEngine(artistDict)
-        artist_cluster = artist_cluster_engine.cluster(threshold)
-
-        album_cluster_engine = ClusterEngine(albumDict)
-        album_cluster = album_cluster_engine.cluster(threshold)
-
-        # Arrange tracks into albums
-        albums = {}
-        for i in xrange(len(tracks)):
-            cluster = album_cluster_engine.getClusterFromId(tracks[i][1])
-            if cluster is not None:
-                albums.setdefault(cluster, []).append(i)
-
-        # Now determine the most prominent names in the cluster and build the
-        # final cluster list
-        for album_id, album in albums.items():
-            album_name = album_cluster_engine.getClusterTitle(album_id)
-
-            artist_max = 0
-            artist_id = None
-            artist_hist = {}
-            for track_id in album:
-                cluster = artist_cluster_engine.getClusterFromId(
-                     tracks[track_id][0])
-                cnt = artist_hist.get(cluster, 0) + 1
-                if cnt > artist_max:
-                    artist_max = cnt
-                    artist_id = cluster
-                artist_hist[cluster] = cnt
-
-            if artist_id is None:
-                artist_name = u"Various Artists"
-            else:
-                artist_name = artist_cluster_engine.getClusterTitle(artist_id)
+    def cluster(files, threshold, state=None):
+        """Group files by similar album and artist names.
 
-            yield album_name, artist_name, (files[i] for i in album)
+        Yields (album name, artist name, files) tuples. A `ClusterState`
+        passed as `state` keeps the comparisons for the next call, only
+        files added or changed since then are compared again.
+        """
+        if state is None:
+            state = ClusterState()
+        entries = [(file, file.metadata["artist"], file.metadata["album"])
+                   for file in files]
+        return iter(state.cluster(entries, threshold))
 
 
 class UnmatchedFiles(Cluster):
@@ -232,6 +199,7 @@ class UnmatchedFiles(Cluster):
 
     def __init__(self):
         super(UnmatchedFiles, self).__init__(_(u"Unmatched Files"), special=True)
+        self.cluster_state = ClusterState()
 
     def add_files(self, files):
         Cluster.add_files(self, files)
@@ -295,6 +263,8 @@ class ClusterDict(object):
         self.ids = {}
         # counter for new id generation
         self.id = 0
+        # number of words with a count above 0
+        self.live = 0
         self.regexp = re.compile(ur'\W', re.UNICODE)
         self.spaces = re.compile(ur'\s', re.UNICODE)
 
@@ -324,12 +294,28 @@ class ClusterDict(object):
            self.words[word] = (index, count + 1)
         except KeyError:
            index = self.id
+           count = 0
            self.words[word] = (self.id, 1)
            self.ids[index] = (word, token)
            self.id = self.id + 1
 
+        if count == 0:
+            self.live += 1
         return index
 
+    def remove(self, word):
+        """
+        Decrement the count of a word added before. The word keeps its
+        index, even if its count drops to 0.
+        """
+        try:
+            index, count = self.words[word]
+        except KeyError:
+            return
+        self.words[word] = (index, count - 1)
+        if count == 1:
+            self.live -= 1
+
     def getWord(self, index):
         word = None
         try:
@@ -358,6 +344,15 @@ class ClusterDict(object):
 
 
 class ClusterEngine(object):
+    """
+    Groups the words of a ClusterDict with a similarity of at least the
+    threshold, directly or through other words.
+
+    The groups are kept in a disjoint-set forest, so the engine can be kept
+    while words are added to the dictionary: only the new words are
+    compared. Words whose count dropped to 0 are left out. If that splits a
+    group, or such a word comes back, everything is compared again.
+    """
 
     def __init__(self, clusterDict):
         # the cluster dictionary we're using
@@ -368,6 +363,14 @@ class ClusterEngine(object):
         self.clusterBins = {}
         # Index the word ids -> clusters
         self.idClusterIndex = {}
+        # disjoint-set forest of the word ids
+        self.parent = []
+        self.size = []
+        # lowercase tokens and whether the word had a count above 0 when
+        # it was compared last
+        self.tokens = []
+        self.alive = []
+        self.threshold = None
 
     def getClusterFromId(self, id):
         return self.idClusterIndex.get(id)
@@ -385,93 +388,251 @@ class ClusterEngine(object):
         if cluster < 0:
             return ""
 
+        # The most used word, the first one in sort order if there are
+        # several, so the title doesn't depend on the order of the files
         max = 0
         maxWord = u''
         for id in self.clusterBins[cluster]:
             word, count = self.clusterDict.getWordAndCount(id)
-            if count >= max:
+            if count > max or (count == max and word < maxWord):
                 maxWord = word
                 max = count
 
         return maxWord
 
+    def find(self, id):
+        """Return the representative word of the group of `id`."""
+        parent = self.parent
+        root = id
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression
+        while parent[id] != root:
+            parent[id], id = root, parent[id]
+        return root
+
+    def union(self, id1, id2):
+        root1 = self.find(id1)
+        root2 = self.find(id2)
+        if root1 == root2:
+            return
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size[root2]
+
+    def update(self, threshold):
+        """Compare the words added since the last update."""
+        size = self.clusterDict.getSize()
+        known = len(self.parent)
+        counts = [self.clusterDict.getWordAndCount(i)[1] for i in xrange(size)]
+
+        rebuild = threshold != self.threshold
+        if not rebuild:
+            died = []
+            for i in xrange(known):
+                if counts[i] > 0:
+                    if not self.alive[i]:
+                        rebuild = True
+                        break
+                elif self.alive[i]:
+                    died.append(i)
+            if died and not rebuild:
+                live_roots = set(self.find(i) for i in xrange(known) if counts[i] > 0)
+                rebuild = any(self.find(i) in live_roots for i in died)
+
+        if rebuild:
+            known = 0
+            del self.parent[:]
+            del self.size[:]
+        for i in xrange(known, size):
+            self.parent.append(i)
+            self.size.append(1)
+        for i in xrange(len(self.tokens), size):
+            self.tokens.append(self.clusterDict.getToken(i).lower())
+
+        old = [i for i in xrange(known) if counts[i] > 0]
+        new = [i for i in xrange(known, size) if counts[i] > 0]
+        if new:
+            tokens = self.tokens
+            new_tokens = [tokens[i] for i in new]
+            if old:
+                for x, y, c in similarity_matrix(new_tokens, [tokens[i] for i in old], threshold):
+                    self.union(new[x], old[y])
+            for x, y, c in similarity_matrix(new_tokens, None, threshold):
+                self.union(new[x], new[y])
+
+        self.alive = [count > 0 for count in counts]
+        self.threshold = threshold
+
     def cluster(self, threshold):
+        self.update(threshold)
 
-        # Keep the matches sorted in a heap
-        heap = []
-
-        for y in xrange(self.clusterDict.getSize()):
-            for x in xrange(y):
-                if x != y:
-                    c = similarity(self.clusterDict.getToken(x).lower(),
-                                   self.clusterDict.getToken(y).lower())
-                    #print "'%s' - '%s' = %f" % (
-                    #    self.clusterDict.getToken(x).encode('utf-8', 'replace').lower(),
-                    #    self.clusterDict.getToken(y).encode('utf-8', 'replace').lower(), c)
-
-                    if c >= threshold:
-                        heappush(heap, ((1.0 - c), [x, y]))
-            QtCore.QCoreApplication.processEvents()
-
-        for i in xrange(self.clusterDict.getSize()):
-            word, count = self.clusterDict.getWordAndCount(i)
-            if word and count > 1:
-                self.clusterBins[self.clusterCount] = [i]
-                self.idClusterIndex[i] = self.clusterCount
-                self.clusterCount = self.clusterCount + 1
-                #print "init ",
-                #self.printCluster(self.clusterCount - 1)
-
-        for i in xrange(len(heap)):
-            c, pair = heappop(heap)
-            c = 1.0 - c
-
-            try:
-                match0 = self.idClusterIndex[pair[0]]
-            except:
-                match0 = -1
-
-            try:
-                match1 = self.idClusterIndex[pair[1]]
-            except:
-                match1 = -1
-
-            # if neither item is in a cluster, make a new cluster
-            if match0 == -1 and match1 == -1:
-                self.clusterBins[self.clusterCount] = [pair[0], pair[1]]
-                self.idClusterIndex[pair[0]] = self.clusterCount
-                self.idClusterIndex[pair[1]] = self.clusterCount
-                self.clusterCount = self.clusterCount + 1
-                #print "new ",
-                #self.printCluster(self.clusterCount - 1)
-                continue
-
-            # If cluster0 is in a bin, stick the other match into that bin
-            if match0 >= 0 and match1 < 0:
-                self.clusterBins[match0].append(pair[1])
-                self.idClusterIndex[pair[1]] = match0
-                #print "add '%s' to cluster " % (self.clusterDict.getWord(pair[0])),
-                #self.printCluster(match0)
-                continue
-
-            # If cluster1 is in a bin, stick the other match into that bin
-            if match1 >= 0 and match0 < 0:
-                self.clusterBins[match1].append(pair[0])
-                self.idClusterIndex[pair[0]] = match1
-                #print "add '%s' to cluster " % (self.clusterDict.getWord(pair[1])),
-                #self.printCluster(match0)
-                continue
-
-            # If both matches are already in two different clusters, merge the clusters
-            if match1 != match0:
-                self.clusterBins[match0].extend(self.clusterBins[match1])
-                for match in self.clusterBins[match1]:
-                    self.idClusterIndex[match] = match0
-                #print "col cluster %d into cluster" % (match1),
-                #self.printCluster(match0)
-                del self.clusterBins[match1]
+        bins = {}
+        for i in xrange(len(self.parent)):
+            if self.alive[i]:
+                bins.setdefault(self.find(i), []).append(i)
 
+        # Groups of a single word are only a cluster if the word is used
+        # more than once
+        self.clusterBins = {}
+        self.idClusterIndex = {}
+        for root, ids in bins.iteritems():
+            if len(ids) > 1 or self.clusterDict.getWordAndCount(ids[0])[1] > 1:
+                self.clusterBins[root] = ids
+                for i in ids:
+                    self.idClusterIndex[i] = root
+        self.clusterCount = len(self.clusterBins)
         return self.clusterBins
 
     def can_refresh(self):
         return False
+
+
+class ClusterState(object):
+    """
+    The artist and album clusters of a set of files, kept between calls to
+    `cluster` so only the changes have to be processed.
+
+    Files are given as (key, artist, album) entries, the keys identify the
+    files between calls. A lock makes sure only one thread uses the state
+    at a time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # key -> ((artist, album), (artist id, album id))
+        self.files = {}
+        self.artistDict = ClusterDict()
+        self.albumDict = ClusterDict()
+        self.artistEngine = ClusterEngine(self.artistDict)
+        self.albumEngine = ClusterEngine(self.albumDict)
+
+    def _add(self, key, words):
+        artist, album = words
+        self.files[key] = (words, (self.artistDict.add(artist),
+                                   self.albumDict.add(album)))
+
+    def update(self, entries):
+        """Bring the dictionaries up to date with `entries`."""
+        current = {}
+        for key, artist, album in entries:
+            current[key] = (artist, album)
+
+        for key, (words, ids) in self.files.items():
+            if current.get(key) != words:
+                del self.files[key]
+                self.artistDict.remove(words[0])
+                self.albumDict.remove(words[1])
+
+        # Start over if most words in the dictionaries are not used anymore
+        if (self.artistDict.getSize() > 2 * self.artistDict.live + 100 or
+            self.albumDict.getSize() > 2 * self.albumDict.live + 100):
+            self.reset()
+
+        for key, words in current.iteritems():
+            if key not in self.files:
+                self._add(key, words)
+
+    def cluster(self, entries, threshold, cancelled=None):
+        """
+        Group the entries by similar album and artist names.
+
+        Returns a list of (album name, artist name, keys) tuples, or None if
+        `cancelled` returned True before the clustering was done. The state
+        stays usable after a cancellation.
+        """
+        with self.lock:
+            self.update(entries)
+            for engine in (self.artistEngine, self.albumEngine):
+                if cancelled is not None and cancelled():
+                    return None
+                engine.cluster(threshold)
+            return self._arrange(entries)
+
+    def _arrange(self, entries):
+        artist_cluster_engine = self.artistEngine
+        album_cluster_engine = self.albumEngine
+
+        # Arrange tracks into albums
+        albums = {}
+        for key, artist, album in entries:
+            cluster = album_cluster_engine.getClusterFromId(self.files[key][1][1])
+            if cluster is not None:
+                albums.setdefault(cluster, []).append(key)
+
+        # Now determine the most prominent names in the cluster and build the
+        # final cluster list
+        result = []
+        for album_id, album in albums.items():
+            album_name = album_cluster_engine.getClusterTitle(album_id)
+
+            artist_max = 0
+            artist_id = None
+            artist_hist = {}
+            for key in album:
+                cluster = artist_cluster_engine.getClusterFromId(self.files[key][1][0])
+                cnt = artist_hist.get(cluster, 0) + 1
+                if cnt > artist_max:
+                    artist_max = cnt
+                    artist_id = cluster
+                artist_hist[cluster] = cnt
+
+            if artist_id is None:
+                artist_name = u"Various Artists"
+            else:
+                artist_name = artist_cluster_engine.getClusterTitle(artist_id)
+
+            result.append((album_name, artist_name, album))
+        return result
+
+
+class ClusterTask(object):
+    """
+    Clusters a snapshot of the artist and album names of files, so it can
+    run in a worker thread while the files keep changing.
+    """
+
+    # Number of files moved to their clusters at once
+    batch_size = 200
+
+    def __init__(self, files, threshold, state=None):
+        self.threshold = threshold
+        self.state = state if state is not None else ClusterState()
+        # id -> (file, parent at the time of the snapshot)
+        self.files = {}
+        entries = []
+        for file in files:
+            self.files[id(file)] = (file, file.parent)
+            entries.append((id(file), file.metadata["artist"], file.metadata["album"]))
+        self.entries = tuple(entries)
+        self.cancelled = False
+        # (album name, artist name, files) left to move
+        self.pending = deque()
+        self.total = 0
+        self.moved = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        """Cluster the snapshot, called from a worker thread."""
+        return self.state.cluster(self.entries, self.threshold,
+                                  lambda: self.cancelled)
+
+    def unchanged(self, file):
+        """Whether the file is still where it was when the snapshot was taken."""
+        return file.parent is self.files[id(file)][1] and file.state != file.REMOVED
+
+    def set_result(self, result):
+        """Queue the files of the clusters, ordered by disc and track number."""
+        for album_name, artist_name, keys in result:
+            files = [self.files[key][0] for key in keys]
+            files = [file for file in files if self.unchanged(file)]
+            if files:
+                files.sort(key=lambda f: (f.discnumber, f.tracknumber, f.base_filename))
+                self.pending.append((album_name, artist_name, files))
+                self.total += len(files)
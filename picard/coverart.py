@@ -29,6 +29,7 @@ from functools import partial
 from picard import config, log
 from picard.metadata import Metadata, is_front_image
 from picard.util import mimetype, parse_amazon_url
+from picard.util.imageref import image_store
 from PyQt4.QtCore import QUrl, QObject
 
 # data transliterated from the perl stuff used to find cover art for the
@@ -96,6 +97,8 @@ def _coverart_downloaded(album, metadata, release, try_list, coverinfos, data, h
         QObject.tagger.window.set_statusbar_message(N_("Coverart %s downloaded"),
                 http.url().toString())
         mime = mimetype.get_from_data(data, default="image/jpeg")
+        # Hash the bytes only once for the album and all tracks
+        data = image_store.add(data)
         filename = None
         if not is_front_image(coverinfos) and config.setting["caa_image_type_as_filename"]:
             filename = coverinfos['type']
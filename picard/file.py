@@ -30,7 +30,7 @@ from collections import defaultdict
 from PyQt4 import QtCore
 from picard import config, log
 from picard.track import Track
-from picard.metadata import Metadata
+from picard.metadata import Metadata, MULTI_VALUED_JOINER, save_this_image_to_tags
 from picard.ui.item import Item
 from picard.script import ScriptParser
 from picard.similarity import similarity2
@@ -47,6 +47,68 @@ from picard.util import (
     mimetype,
     thread
 )
+from picard.util.imageref import ImageRef, image_data
+from picard.util.pathlock import path_locks
+
+
+class FilenameMetadata(object):
+    """Read-only view of metadata for file naming scripts.
+
+    Looks up the tags in `sources` in order, and joins and sanitizes the
+    values on access, same as a sanitized copy would have them.
+    """
+
+    def __init__(self, *sources):
+        self._sources = sources
+
+    def getall(self, name):
+        for source in self._sources:
+            if name in source:
+                values = source.getall(name)
+                if values:
+                    return [sanitize_filename(unicode(MULTI_VALUED_JOINER.join(values)))]
+                break
+        return []
+
+    def get(self, name, default=None):
+        values = self.getall(name)
+        if values:
+            return values[0]
+        return default
+
+    def __getitem__(self, name):
+        return self.get(name, u'')
+
+    def __contains__(self, name):
+        return bool(self.getall(name))
+
+    def values_for(self, names):
+        """Return the unsanitized values of the tags `names` as a tuple."""
+        values = []
+        for name in sorted(names):
+            for source in self._sources:
+                if name in source:
+                    values.append(tuple(source.getall(name)))
+                    break
+            else:
+                values.append(())
+        return tuple(values)
+
+    def keys(self):
+        names = set()
+        for source in self._sources:
+            names.update(source.iterkeys())
+        return [name for name in names if name in self]
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def iteritems(self):
+        for name in self.keys():
+            yield name, self.getall(name)[0]
+
+    def items(self):
+        return list(self.iteritems())
 
 
 class File(QtCore.QObject, Item):
@@ -58,6 +120,12 @@ class File(QtCore.QObject, Item):
     ERROR = 3
     REMOVED = 4
 
+    options = [
+        # Not in the options dialog, files are saved in parallel and only
+        # operations on the same paths wait for each other
+        config.IntOption("setting", "save_thread_count", 8),
+    ]
+
     comparison_weights = {
         "title": 13,
         "artist": 4,
@@ -79,19 +147,23 @@ class File(QtCore.QObject, Item):
 
         self.orig_metadata = Metadata()
         self.metadata = Metadata()
+        # Tags of orig_metadata taken from the filename, not from the file
+        self._derived_tags = set()
 
         self.similarity = 1.0
         self.parent = None
 
         self.lookup_task = None
         self.item = None
+        # Last file name by naming format, with the values it was made from
+        self._filenames = {}
 
     def __repr__(self):
         return '<File %r>' % self.base_filename
 
     def load(self, callback):
         thread.run_task(
-            partial(self._load, self.filename),
+            partial(self._load_cached, self.filename),
             partial(self._loading_finished, callback),
             priority=1)
 
@@ -111,8 +183,10 @@ class File(QtCore.QObject, Item):
     def _copy_loaded_metadata(self, metadata):
         filename, _ = os.path.splitext(self.base_filename)
         metadata['~length'] = format_time(metadata.length)
+        self._derived_tags = set()
         if 'title' not in metadata:
             metadata['title'] = filename
+            self._derived_tags.add('title')
         if 'tracknumber' not in metadata:
             match = re.match("(?:track)?\s*(?:no|nr)?\s*(\d+)", filename, re.I)
             if match:
@@ -122,6 +196,7 @@ class File(QtCore.QObject, Item):
                     pass
                 else:
                     metadata['tracknumber'] = str(tracknumber)
+                    self._derived_tags.add('tracknumber')
         self.orig_metadata = metadata
         self.metadata.copy(metadata)
 
@@ -152,6 +227,77 @@ class File(QtCore.QObject, Item):
         """Load metadata from the file."""
         raise NotImplementedError
 
+    def _load_cached(self, filename):
+        """Load metadata from the tag cache, or from the file if it changed.
+
+        The embedded images are replaced by references, their bytes are read
+        again when they are needed."""
+        cache = self.tagger.tag_cache
+        if cache is not None:
+            stat = os.stat(encode_filename(filename))
+            metadata = cache.get(filename, stat, self._read_image)
+            if metadata is not None:
+                return metadata
+        metadata = self._load(filename)
+        refs = self._reference_images(filename, metadata)
+        if cache is not None:
+            cache.put(filename, stat, metadata)
+        for ref in refs:
+            ref.unpin()
+        return metadata
+
+    def _reference_images(self, filename, metadata):
+        """Replace the image data in `metadata` with pinned references."""
+        refs = []
+        reader = self._read_image
+        for index, image in enumerate(metadata.images):
+            ref = ImageRef.from_data(filename, index, image["data"], reader)
+            image["data"] = ref
+            refs.append(ref)
+        return refs
+
+    def _read_image(self, ref):
+        """Read the bytes of the image `ref` from the tag cache or the file."""
+        cache = self.tagger.tag_cache
+        if cache is not None:
+            data = cache.read_image(ref.sha1)
+            if data is not None:
+                return data
+        images = self._load(ref.filename).images
+        if ref.index < len(images) and images[ref.index]["data"] == ref:
+            return image_data(images[ref.index])
+        for image in images:
+            if image["data"] == ref:
+                return image_data(image)
+        return None
+
+    def _own_image_refs(self, filename, metadata):
+        return [image["data"] for image in metadata.images
+                if isinstance(image["data"], ImageRef) and image["data"].filename == filename]
+
+    def _relocate_images(self, refs, filename, rewritten):
+        """Point the references to images of a saved file to its new name.
+
+        If the file was rewritten, references to images which were not
+        written to it again stay pinned."""
+        if rewritten:
+            try:
+                images = self._load(filename).images
+            except:
+                log.error("Couldn't read the images of %r again", filename, exc_info=True)
+                return
+            found = {}
+            for index, image in enumerate(images):
+                found.setdefault(image["data"], index)
+        for ref in refs:
+            if rewritten:
+                index = found.get(ref)
+                if index is None:
+                    continue
+                ref.index = index
+                ref.unpin()
+            ref.filename = filename
+
     def save(self):
         self.set_pending()
         metadata = Metadata()
@@ -165,18 +311,30 @@ class File(QtCore.QObject, Item):
     def _save_and_rename(self, old_filename, metadata):
         """Save the metadata."""
         new_filename = old_filename
-        if not config.setting["dont_write_tags"]:
-            encoded_old_filename = encode_filename(old_filename)
-            info = os.stat(encoded_old_filename)
-            self._save(old_filename, metadata)
-            if config.setting["preserve_timestamps"]:
-                try:
-                    os.utime(encoded_old_filename, (info.st_atime, info.st_mtime))
-                except OSError:
-                    log.warning("Couldn't preserve timestamp for %r", old_filename)
-        # Rename files
-        if config.setting["rename_files"] or config.setting["move_files"]:
-            new_filename = self._rename(old_filename, metadata)
+        refs = self._own_image_refs(old_filename, metadata)
+        with path_locks.locked(old_filename):
+            rewritten = (not config.setting["dont_write_tags"] and
+                         self._save_needed(old_filename, metadata))
+            if rewritten:
+                encoded_old_filename = encode_filename(old_filename)
+                info = os.stat(encoded_old_filename)
+                # Keep the images of the file around while it is rewritten
+                for ref in refs:
+                    ref.pin()
+                self._save(old_filename, metadata)
+                if self.tagger.tag_cache is not None:
+                    # The timestamp might be preserved, don't trust it
+                    self.tagger.tag_cache.remove(old_filename)
+                if config.setting["preserve_timestamps"]:
+                    try:
+                        os.utime(encoded_old_filename, (info.st_atime, info.st_mtime))
+                    except OSError:
+                        log.warning("Couldn't preserve timestamp for %r", old_filename)
+            # Rename files
+            if config.setting["rename_files"] or config.setting["move_files"]:
+                new_filename = self._rename(old_filename, metadata)
+        if refs:
+            self._relocate_images(refs, new_filename, rewritten)
         # Move extra files (images, playlists, etc.)
         if config.setting["move_files"] and config.setting["move_additional_files"]:
             self._move_additional_files(old_filename, new_filename)
@@ -204,10 +362,12 @@ class File(QtCore.QObject, Item):
     @staticmethod
     def _rmdir(dir):
         junk_files = (".DS_Store", "desktop.ini", "Desktop.ini", "Thumbs.db")
-        if not set(os.listdir(dir)) - set(junk_files):
-            shutil.rmtree(dir, False)
-        else:
-            raise OSError
+        # Files might be moved into the directory by other saving threads
+        with path_locks.locked(dir), path_locks.tree:
+            if not set(os.listdir(dir)) - set(junk_files):
+                shutil.rmtree(dir, False)
+            else:
+                raise OSError
 
     def _saving_finished(self, result=None, error=None):
         old_filename = new_filename = self.filename
@@ -231,6 +391,8 @@ class File(QtCore.QObject, Item):
             self.orig_metadata['~length'] = format_time(length)
             for k, v in temp_info.items():
                 self.orig_metadata[k] = v
+            if not config.setting["dont_write_tags"]:
+                self._derived_tags.difference_update(self.metadata.iterkeys())
             self.error = None
             self.clear_pending()
             self._add_path_to_metadata(self.orig_metadata)
@@ -242,19 +404,67 @@ class File(QtCore.QObject, Item):
         """Save the metadata."""
         raise NotImplementedError
 
-    def _script_to_filename(self, format, file_metadata, settings=config.setting):
-        metadata = Metadata()
+    def _save_needed(self, filename, metadata):
+        """Return if saving `metadata` would change the tags of the file.
+
+        Compares the tags and images `_save` would write with the ones loaded
+        from the file. Formats extend this for settings that change how the
+        tags are stored."""
         if config.setting["clear_existing_tags"]:
-            metadata.copy(file_metadata)
-        else:
-            metadata.copy(self.orig_metadata)
-            metadata.update(file_metadata)
-        # make sure every metadata can safely be used in a path name
-        for name in metadata.keys():
-            if isinstance(metadata[name], basestring):
-                metadata[name] = sanitize_filename(metadata[name])
+            # Tags that weren't loaded would be removed
+            return True
+        orig_metadata = self.orig_metadata
+        for name in metadata.iterkeys():
+            if not self._writes_tag(name):
+                continue
+            if name in self._derived_tags:
+                # Taken from the filename, the file doesn't have it yet
+                return True
+            if metadata.getall(name) != orig_metadata.getall(name):
+                return True
+        if config.setting["save_images_to_tags"] and metadata.images:
+            # The images in the file are replaced with the ones to save
+            key = itemgetter("data", "mime", "type", "desc")
+            new_images = [key(image) for image in metadata.images
+                          if save_this_image_to_tags(image)]
+            if new_images != map(key, orig_metadata.images):
+                return True
+        return False
+
+    def _writes_tag(self, name):
+        """Return if `_save` writes the tag `name` to the file."""
+        return not name.startswith("~") or name == "~rating"
+
+    def _script_to_filename(self, format, file_metadata, settings=config.setting):
         format = format.replace("\t", "").replace("\n", "")
-        filename = ScriptParser().eval(format, metadata, self)
+        parser = ScriptParser()
+        script = parser.compile(format)
+        clear_existing_tags = config.setting["clear_existing_tags"]
+        if clear_existing_tags:
+            sources = (file_metadata,)
+        else:
+            sources = (file_metadata, self.orig_metadata)
+        key = None
+        if script.reads is not None:
+            # The file name only changes if the tags the script reads do
+            key = (clear_existing_tags, settings["ascii_filenames"],
+                   settings["windows_compatible_filenames"],
+                   FilenameMetadata(*sources).values_for(script.reads))
+            last = self._filenames.get(format)
+            if last is not None and last[0] == key:
+                return last[1]
+        if script.writes_context:
+            metadata = Metadata()
+            for source in reversed(sources):
+                metadata.update(source)
+            # make sure every metadata can safely be used in a path name
+            for name in metadata.keys():
+                if isinstance(metadata[name], basestring):
+                    metadata[name] = sanitize_filename(metadata[name])
+        else:
+            # Nothing to protect the metadata from, don't copy it
+            metadata = FilenameMetadata(*sources)
+        filename = parser.eval(format, metadata, self)
         if settings["ascii_filenames"]:
             if isinstance(filename, unicode):
                 filename = unaccent(filename)
@@ -264,6 +474,10 @@ class File(QtCore.QObject, Item):
             filename = replace_win32_incompat(filename)
         # remove null characters
         filename = filename.replace("\x00", "")
+        if key is not None:
+            if len(self._filenames) >= 8:
+                self._filenames.clear()
+            self._filenames[format] = (key, filename)
         return filename
 
     def _make_filename(self, filename, metadata, settings=config.setting):
@@ -304,17 +518,18 @@ class File(QtCore.QObject, Item):
             return old_filename
 
         new_dirname = os.path.dirname(new_filename)
-        if not os.path.isdir(encode_filename(new_dirname)):
-            os.makedirs(new_dirname)
-        tmp_filename = new_filename
-        i = 1
-        while (not pathcmp(old_filename, new_filename + ext) and
-               os.path.exists(encode_filename(new_filename + ext))):
-            new_filename = "%s (%d)" % (tmp_filename, i)
-            i += 1
-        new_filename = new_filename + ext
-        log.debug("Moving file %r => %r", old_filename, new_filename)
-        shutil.move(encode_filename(old_filename), encode_filename(new_filename))
+        # Files saved at the same time might get the same name
+        with path_locks.locked(new_dirname):
+            path_locks.makedirs(encode_filename(new_dirname))
+            tmp_filename = new_filename
+            i = 1
+            while (not pathcmp(old_filename, new_filename + ext) and
+                   os.path.exists(encode_filename(new_filename + ext))):
+                new_filename = "%s (%d)" % (tmp_filename, i)
+                i += 1
+            new_filename = new_filename + ext
+            log.debug("Moving file %r => %r", old_filename, new_filename)
+            shutil.move(encode_filename(old_filename), encode_filename(new_filename))
         return new_filename
 
     def _make_image_filename(self, image_filename, dirname, metadata):
@@ -339,6 +554,7 @@ class File(QtCore.QObject, Item):
         counters = defaultdict(lambda: 0)
         for image in metadata.images:
             filename = image["filename"]
+            # Only the size is compared before writing, don't read the bytes yet
             data = image["data"]
             mime = image["mime"]
             if filename is None:
@@ -350,27 +566,27 @@ class File(QtCore.QObject, Item):
             if counters[filename] > 0:
                 image_filename = "%s (%d)" % (filename, counters[filename])
             counters[filename] = counters[filename] + 1
-            while os.path.exists(image_filename + ext) and not overwrite:
-                if os.path.getsize(image_filename + ext) == len(data):
-                    log.debug("Identical file size, not saving %r", image_filename)
-                    break
-                image_filename = "%s (%d)" % (filename, counters[filename])
-                counters[filename] = counters[filename] + 1
-            else:
-                new_filename = image_filename + ext
-                # Even if overwrite is enabled we don't need to write the same
-                # image multiple times
-                if (os.path.exists(new_filename) and
-                    os.path.getsize(new_filename) == len(data)):
+            # The other tracks of the album save the same images
+            with path_locks.locked(os.path.dirname(filename)):
+                while os.path.exists(image_filename + ext) and not overwrite:
+                    if os.path.getsize(image_filename + ext) == len(data):
                         log.debug("Identical file size, not saving %r", image_filename)
-                        continue
-                log.debug("Saving cover images to %r", image_filename)
-                new_dirname = os.path.dirname(image_filename)
-                if not os.path.isdir(new_dirname):
-                    os.makedirs(new_dirname)
-                f = open(image_filename + ext, "wb")
-                f.write(data)
-                f.close()
+                        break
+                    image_filename = "%s (%d)" % (filename, counters[filename])
+                    counters[filename] = counters[filename] + 1
+                else:
+                    new_filename = image_filename + ext
+                    # Even if overwrite is enabled we don't need to write the same
+                    # image multiple times
+                    if (os.path.exists(new_filename) and
+                        os.path.getsize(new_filename) == len(data)):
+                            log.debug("Identical file size, not saving %r", image_filename)
+                            continue
+                    log.debug("Saving cover images to %r", image_filename)
+                    path_locks.makedirs(os.path.dirname(image_filename))
+                    f = open(image_filename + ext, "wb")
+                    f.write(image_data(image))
+                    f.close()
 
     def _move_additional_files(self, old_filename, new_filename):
         """Move extra files, like playlists..."""
@@ -378,17 +594,19 @@ class File(QtCore.QObject, Item):
         new_path = encode_filename(os.path.dirname(new_filename))
         patterns = encode_filename(config.setting["move_additional_files_pattern"])
         patterns = filter(bool, [p.strip() for p in patterns.split()])
-        for pattern in patterns:
-            # FIXME glob1 is not documented, maybe we need our own implemention?
-            for old_file in glob.glob1(old_path, pattern):
-                new_file = os.path.join(new_path, old_file)
-                old_file = os.path.join(old_path, old_file)
-                # FIXME we shouldn't do this from a thread!
-                if self.tagger.files.get(decode_filename(old_file)):
-                    log.debug("File loaded in the tagger, not moving %r", old_file)
-                    continue
-                log.debug("Moving %r to %r", old_file, new_file)
-                shutil.move(old_file, new_file)
+        # The other files of the directory might move the same files
+        with path_locks.locked(old_path, new_path):
+            for pattern in patterns:
+                # FIXME glob1 is not documented, maybe we need our own implemention?
+                for old_file in glob.glob1(old_path, pattern):
+                    new_file = os.path.join(new_path, old_file)
+                    old_file = os.path.join(old_path, old_file)
+                    # FIXME we shouldn't do this from a thread!
+                    if self.tagger.files.get(decode_filename(old_file)):
+                        log.debug("File loaded in the tagger, not moving %r", old_file)
+                        continue
+                    log.debug("Moving %r to %r", old_file, new_file)
+                    shutil.move(old_file, new_file)
 
     def remove(self, from_parent=True):
         if from_parent and self.parent:
@@ -27,6 +27,7 @@ from picard import config, log
 from picard.file import File
 from picard.metadata import Metadata, save_this_image_to_tags
 from picard.util import encode_filename, sanitize_date, mimetype
+from picard.util.imageref import image_data
 from os.path import isfile
 
 
@@ -148,7 +149,7 @@ class APEv2File(File):
                     continue
                 cover_filename = 'Cover Art (Front)'
                 cover_filename += mimetype.get_extension(image["mime"], '.jpg')
-                tags['Cover Art (Front)'] = mutagen.apev2.APEValue(cover_filename + '\0' + image["data"], mutagen.apev2.BINARY)
+                tags['Cover Art (Front)'] = mutagen.apev2.APEValue(cover_filename + '\0' + image_data(image), mutagen.apev2.BINARY)
                 break  # can't save more than one item with the same name
                        # (mp3tags does this, but it's against the specs)
         tags.save(encode_filename(filename))
@@ -21,6 +21,7 @@ from picard import config, log
 from picard.file import File
 from picard.formats.id3 import image_type_from_id3_num, image_type_as_id3_num
 from picard.util import encode_filename
+from picard.util.imageref import image_data
 from picard.metadata import Metadata, save_this_image_to_tags
 from mutagen.asf import ASF, ASFByteArrayAttribute
 import struct
@@ -165,7 +166,7 @@ class ASFFile(File):
             for image in metadata.images:
                 if not save_this_image_to_tags(image):
                     continue
-                tag_data = pack_image(image["mime"], image["data"],
+                tag_data = pack_image(image["mime"], image_data(image),
                                       image_type_as_id3_num(image['type']),
                                       image['desc'])
                 cover.append(ASFByteArrayAttribute(tag_data))
@@ -185,3 +186,6 @@ class ASFFile(File):
 
     def supports_tag(self, name):
         return name in self.__TRANS
+
+    def _writes_tag(self, name):
+        return name in self.__TRANS or name.startswith('lyrics:')
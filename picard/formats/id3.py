@@ -27,6 +27,7 @@ from picard.metadata import Metadata, save_this_image_to_tags, MULTI_VALUED_JOIN
 from picard.file import File
 from picard.formats.mutagenext import compatid3
 from picard.util import encode_filename, sanitize_date
+from picard.util.imageref import image_data
 from urlparse import urlparse
 
 
@@ -317,7 +318,7 @@ class ID3File(File):
                                   mime=image["mime"],
                                   type=image_type_as_id3_num(image['type']),
                                   desc=desctag,
-                                  data=image["data"]))
+                                  data=image_data(image)))
 
         tmcl = mutagen.id3.TMCL(encoding=encoding, people=[])
         tipl = mutagen.id3.TIPL(encoding=encoding, people=[])
@@ -418,6 +419,33 @@ class ID3File(File):
             or name.startswith('lyrics:')\
             or name in self.__other_supported_tags
 
+    def _writes_tag(self, name):
+        return File._writes_tag(self, name) or name.startswith('~id3:')
+
+    def _save_needed(self, filename, metadata):
+        if File._save_needed(self, filename, metadata):
+            return True
+        # The tags are the same, but they might be stored differently
+        try:
+            f = open(encode_filename(filename), 'rb')
+            try:
+                header = f.read(10)
+                f.seek(0, 2)
+                f.seek(max(0, f.tell() - 160))
+                trailer = f.read()
+            finally:
+                f.close()
+        except IOError:
+            return True
+        version = 3 if config.setting['write_id3v23'] else 4
+        if header[:3] != 'ID3' or ord(header[3]) != version:
+            return True
+        if (trailer[-128:-125] == 'TAG') != config.setting['write_id3v1']:
+            return True
+        if self._IsMP3 and config.setting['remove_ape_from_mp3'] and 'APETAGEX' in trailer:
+            return True
+        return False
+
 
 class MP3File(ID3File):
     """MP3 file."""
@@ -22,6 +22,7 @@ from picard import config, log
 from picard.file import File
 from picard.metadata import Metadata, save_this_image_to_tags
 from picard.util import encode_filename
+from picard.util.imageref import image_data
 
 
 class MP4File(File):
@@ -193,9 +194,9 @@ class MP4File(File):
                     continue
                 mime = image["mime"]
                 if mime == "image/jpeg":
-                    covr.append(MP4Cover(image["data"], MP4Cover.FORMAT_JPEG))
+                    covr.append(MP4Cover(image_data(image), MP4Cover.FORMAT_JPEG))
                 elif mime == "image/png":
-                    covr.append(MP4Cover(image["data"], MP4Cover.FORMAT_PNG))
+                    covr.append(MP4Cover(image_data(image), MP4Cover.FORMAT_PNG))
             if covr:
                 file.tags["covr"] = covr
 
@@ -206,3 +207,7 @@ class MP4File(File):
             or name in self.__r_freeform_tags\
             or name in self.__other_supported_tags\
             or name.startswith('lyrics:')
+
+    def _writes_tag(self, name):
+        return self.supports_tag(name) or name in self.__r_int_tags\
+            or name == "musicip_fingerprint"
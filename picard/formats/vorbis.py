@@ -35,6 +35,7 @@ from picard.file import File
 from picard.formats.id3 import image_type_from_id3_num, image_type_as_id3_num
 from picard.metadata import Metadata, save_this_image_to_tags
 from picard.util import encode_filename, sanitize_date
+from picard.util.imageref import image_data
 
 
 class VCommentFile(File):
@@ -164,7 +165,7 @@ class VCommentFile(File):
                 if not save_this_image_to_tags(image):
                     continue
                 picture = mutagen.flac.Picture()
-                picture.data = image["data"]
+                picture.data = image_data(image)
                 picture.mime = image["mime"]
                 picture.desc = image['desc']
                 picture.type = image_type_as_id3_num(image['type'])
@@ -193,6 +194,25 @@ class FLACFile(VCommentFile):
         super(FLACFile, self)._info(metadata, file)
         metadata['~format'] = self.NAME
 
+    def _save_needed(self, filename, metadata):
+        if VCommentFile._save_needed(self, filename, metadata):
+            return True
+        if not config.setting["remove_id3_from_flac"]:
+            return False
+        # Saving removes the ID3 tags in front of and after the stream
+        try:
+            f = open(encode_filename(filename), 'rb')
+            try:
+                header = f.read(3)
+                f.seek(0, 2)
+                f.seek(max(0, f.tell() - 128))
+                trailer = f.read(3)
+            finally:
+                f.close()
+        except IOError:
+            return True
+        return header == 'ID3' or trailer == 'TAG'
+
 
 class OggFLACFile(VCommentFile):
     """FLAC file."""
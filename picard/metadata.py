@@ -23,6 +23,7 @@ from picard.plugin import ExtensionPoint
 from picard.similarity import similarity2
 from picard.util import load_release_type_scores
 from picard.mbxml import artist_credit_from_node
+from picard.util.imageref import image_store
 
 MULTI_VALUED_JOINER = '; '
 
@@ -65,7 +66,7 @@ class Metadata(dict):
 
         Arguments:
         mime -- The mimetype of the image
-        data -- The image data
+        data -- The image data, bytes are kept in the image store
         filename -- The image filename, without an extension
         extras -- extra informations about image as dict
             'desc' : image description or comment, default to ''
@@ -73,7 +74,7 @@ class Metadata(dict):
             'front': if set, CAA front flag is true for this image
         """
         imagedict = {'mime': mime,
-                     'data': data,
+                     'data': image_store.add(data),
                      'filename': filename,
                      'type': 'front',
                      'desc': ''}
@@ -84,31 +85,59 @@ class Metadata(dict):
     def remove_image(self, index):
         self.images.pop(index)
 
-    def compare(self, other):
+    def compare(self, other, threshold=0.0):
+        """Compare the metadata to `other`, returns a similarity between 0.0 and 1.0.
+
+        If `threshold` is given, the comparison stops as soon as the result
+        can't reach it anymore and 0.0 is returned.
+        """
+        return self.compare_values(self.comparison_values(),
+                                   other.comparison_values(), threshold)
+
+    def comparison_values(self):
+        """The values used by `compare`, to fetch them only once when
+        comparing with many other objects."""
+        return self.length, [self[name] for name, weight in self.__weights]
+
+    @classmethod
+    def compare_values(cls, values, other_values, threshold=0.0):
+        """Same as `compare`, for values from `comparison_values`."""
         parts = []
         total = 0
 
-        if self.length and other.length:
-            score = 1.0 - min(abs(self.length - other.length), 30000) / 30000.0
+        length, values = values
+        other_length, other_values = other_values
+        if length and other_length:
+            score = 1.0 - min(abs(length - other_length), 30000) / 30000.0
             parts.append((score, 8))
             total += 8
 
-        for name, weight in self.__weights:
-            a = self[name]
-            b = other[name]
+        fields = []
+        for (name, weight), a, b in zip(cls.__weights, values, other_values):
             if a and b:
-                if name in ('tracknumber', 'totaltracks'):
-                    try:
-                        ia = int(a)
-                        ib = int(b)
-                    except ValueError:
-                        ia = a
-                        ib = b
-                    score = 1.0 - abs(cmp(ia, ib))
-                else:
-                    score = similarity2(a, b)
-                parts.append((score, weight))
+                fields.append((name, a, b, weight))
                 total += weight
+
+        # Weighted score reached so far and still possible with the
+        # remaining fields
+        reached = sum(score * weight for score, weight in parts)
+        remaining = total - sum(weight for score, weight in parts)
+        for name, a, b, weight in fields:
+            if reached + remaining < threshold * total - 1e-9:
+                return 0.0
+            if name in ('tracknumber', 'totaltracks'):
+                try:
+                    ia = int(a)
+                    ib = int(b)
+                except ValueError:
+                    ia = a
+                    ib = b
+                score = 1.0 - abs(cmp(ia, ib))
+            else:
+                score = similarity2(a, b)
+            parts.append((score, weight))
+            reached += score * weight
+            remaining -= weight
         return reduce(lambda x, y: x + y[0] * y[1] / total, parts, 0.0)
 
     def compare_to_release(self, release, weights, return_parts=False):
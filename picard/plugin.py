@@ -30,6 +30,7 @@ from picard.const import USER_PLUGIN_DIR
 _suffixes = [s[0] for s in imp.get_suffixes()]
 _package_entries = ["__init__.py", "__init__.pyc", "__init__.pyo"]
 _extension_points = []
+_enabled_plugins = None
 
 
 def _plugin_name_from_path(path):
@@ -48,6 +49,23 @@ def _plugin_name_from_path(path):
         return None
 
 
+def enabled_plugins():
+    """Return the names of the enabled plugins.
+
+    The value is read from the settings once and then kept until the plugins
+    are toggled with `set_enabled_plugins`."""
+    global _enabled_plugins
+    if _enabled_plugins is None:
+        _enabled_plugins = frozenset(config.setting["enabled_plugins"].split())
+    return _enabled_plugins
+
+
+def set_enabled_plugins(names):
+    global _enabled_plugins
+    config.setting["enabled_plugins"] = " ".join(names)
+    _enabled_plugins = frozenset(names)
+
+
 def _unregister_module_extensions(module):
     for ep in _extension_points:
         ep.unregister_module(module)
@@ -57,6 +75,8 @@ class ExtensionPoint(object):
 
     def __init__(self):
         self.__items = []
+        # Changes whenever items are added or removed
+        self.generation = 0
         _extension_points.append(self)
 
     def register(self, module, item):
@@ -65,14 +85,16 @@ class ExtensionPoint(object):
         else:
             module = None
         self.__items.append((module, item))
+        self.generation += 1
 
     def unregister_module(self, name):
         self.__items = filter(lambda i: i[0] != name, self.__items)
+        self.generation += 1
 
     def __iter__(self):
-        enabled_plugins = config.setting["enabled_plugins"].split()
+        enabled = enabled_plugins()
         for module, item in self.__items:
-            if module is None or module in enabled_plugins:
+            if module is None or module in enabled:
                 yield item
 
 
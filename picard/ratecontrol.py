@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Per host request rate control.
+"""
+
+import time
+from email.utils import parsedate_tz, mktime_tz
+
+
+# Slowing down is done by multiplying the request interval, this is the
+# largest factor we go to after repeated 503/429 responses
+MAX_SLOWDOWN = 64.0
+# Interval used for backing off from hosts without a configured delay
+MIN_BACKOFF_DELAY = 250
+
+
+def parse_retry_after(value, now=None):
+    """Parse the value of a Retry-After header into a delay in seconds.
+
+    The header can either contain the number of seconds or a HTTP date.
+    Returns None if the value could not be parsed.
+    """
+    value = value.strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(0, mktime_tz(date) - now)
+
+
+class TokenBucket(object):
+    """Rate limiter for the requests to a single host.
+
+    Requests are allowed at most every `delay` milliseconds on average, but
+    up to `burst` requests can be started at once after an idle period. At
+    most `concurrency` requests run at the same time, a value of 0 means
+    there is no limit.
+
+    When the server answers with 503 or 429 the request interval is doubled
+    and a Retry-After header is honoured. Every successful response brings
+    the interval back towards the configured value.
+    """
+
+    def __init__(self, delay, burst=1, concurrency=0, now=None):
+        self.delay = delay
+        self.burst = max(1, burst)
+        self.concurrency = concurrency
+        self.active = 0
+        self.slowdown = 1.0
+        self.blocked_until = 0.0
+        self.tokens = float(self.burst)
+        self._last_update = time.time() if now is None else now
+
+    @property
+    def interval(self):
+        """Current interval between requests in milliseconds."""
+        if self.slowdown > 1.0:
+            return max(self.delay, MIN_BACKOFF_DELAY) * self.slowdown
+        return self.delay
+
+    def _refill(self, now):
+        elapsed = (now - self._last_update) * 1000
+        self._last_update = now
+        interval = self.interval
+        if interval <= 0:
+            self.tokens = float(self.burst)
+        elif elapsed > 0:
+            self.tokens = min(float(self.burst), self.tokens + elapsed / interval)
+
+    def acquire(self, now=None):
+        """Try to start a request.
+
+        Returns 0 if the request can be started right away, otherwise the
+        number of milliseconds to wait before trying again. None means that
+        the concurrency limit has been reached and a running request has to
+        finish first.
+        """
+        if now is None:
+            now = time.time()
+        if self.concurrency and self.active >= self.concurrency:
+            return None
+        if now < self.blocked_until:
+            return int((self.blocked_until - now) * 1000) + 1
+        self._refill(now)
+        if self.tokens < 1.0:
+            return int((1.0 - self.tokens) * self.interval) + 1
+        self.tokens -= 1.0
+        self.active += 1
+        return 0
+
+    def release(self, status=0, retry_after=None, now=None):
+        """Mark a request as finished.
+
+        `status` is the HTTP status code of the response and `retry_after`
+        the delay in seconds the server asked us to wait, if any.
+        """
+        if now is None:
+            now = time.time()
+        self.active = max(0, self.active - 1)
+        if status in (429, 503):
+            self._refill(now)
+            self.slowdown = min(MAX_SLOWDOWN, self.slowdown * 2)
+            self.tokens = 0.0
+            wait = self.interval / 1000.0
+            if retry_after is not None:
+                wait = max(wait, retry_after)
+            self.blocked_until = max(self.blocked_until, now + wait)
+        elif self.slowdown > 1.0 and 0 < status < 400:
+            self._refill(now)
+            self.slowdown = max(1.0, self.slowdown * 0.75)
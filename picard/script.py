@@ -21,9 +21,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
 import re
+import threading
+import timeit
+from collections import defaultdict
 from picard.metadata import Metadata
 from picard.metadata import MULTI_VALUED_JOINER
-from picard.plugin import ExtensionPoint
+from picard.plugin import ExtensionPoint, enabled_plugins
+from picard.util.lrucache import LRUCache
 from inspect import getargspec
 
 
@@ -52,6 +56,16 @@ class ScriptText(unicode):
     def eval(self, state):
         return self
 
+    def compile(self, parser):
+        text = self
+        return lambda parser: text
+
+
+def _variable_name(name):
+    if name.startswith(u"_"):
+        return u"~" + name[1:]
+    return name
+
 
 class ScriptVariable(object):
 
@@ -62,15 +76,16 @@ class ScriptVariable(object):
         return '<ScriptVariable %%%s%%>' % self.name
 
     def eval(self, state):
-        name = self.name
-        if name.startswith(u"_"):
-            name = u"~" + name[1:]
-        return state.context.get(name, u"")
+        return state.context.get(_variable_name(self.name), u"")
+
+    def compile(self, parser):
+        name = _variable_name(self.name)
+        return lambda parser: parser.context.get(name, u"")
 
 
 class ScriptFunction(object):
 
-    def __init__(self, name, args, parser):
+    def __init__(self, name, args, parser, line=None):
         try:
             expected_args = parser.functions[name][2]
             if expected_args and (len(args) not in expected_args):
@@ -89,6 +104,7 @@ class ScriptFunction(object):
 
         self.name = name
         self.args = args
+        self.line = line
 
     def __repr__(self):
         return "<ScriptFunction $%s(%r)>" % (self.name, self.args)
@@ -101,15 +117,210 @@ class ScriptFunction(object):
             args = self.args
         return function(parser, *args)
 
+    def compile(self, parser):
+        compiled = self._compile(parser)
+        if parser.profile is not None:
+            compiled = parser.profile.wrap(compiled, self.name, self.line)
+        return compiled
+
+    def _compile(self, parser):
+        function, eval_args, num_args = parser.functions[self.name]
+        if not eval_args:
+            # The function evaluates the arguments itself, compile them so
+            # that ScriptExpression.eval is fast
+            args = self.args
+            for arg in args:
+                arg.compile(parser)
+            return lambda parser: function(parser, *args)
+        args = [arg.compile(parser) for arg in self.args]
+        if len(args) == 1:
+            arg0, = args
+            return lambda parser: function(parser, arg0(parser))
+        elif len(args) == 2:
+            arg0, arg1 = args
+            return lambda parser: function(parser, arg0(parser), arg1(parser))
+        elif len(args) == 3:
+            arg0, arg1, arg2 = args
+            return lambda parser: function(parser, arg0(parser), arg1(parser), arg2(parser))
+        return lambda parser: function(parser, *[arg(parser) for arg in args])
+
 
 class ScriptExpression(list):
 
+    _compiled = None
+
     def eval(self, state):
+        if self._compiled is not None:
+            return self._compiled(state)
         result = []
         for item in self:
             result.append(item.eval(state))
         return "".join(result)
 
+    def compile(self, parser):
+        """Return the expression as a function of the parser."""
+        if all(isinstance(item, ScriptText) for item in self):
+            text = "".join(self)
+            compiled = lambda parser: text
+        else:
+            items = [item.compile(parser) for item in self]
+            if len(items) == 1:
+                item, = items
+                compiled = lambda parser: "".join((item(parser),))
+            else:
+                compiled = lambda parser: "".join([item(parser) for item in items])
+        self._compiled = compiled
+        return compiled
+
+
+def _walk(expression):
+    """Yield the variables and function calls of a parsed expression."""
+    for item in expression:
+        if isinstance(item, ScriptFunction):
+            yield item
+            for arg in item.args:
+                for node in _walk(arg):
+                    yield node
+        elif isinstance(item, ScriptVariable):
+            yield item
+
+
+def _constant(expression):
+    """Return the text of an expression without variables or functions."""
+    if all(isinstance(item, ScriptText) for item in expression):
+        return u"".join(expression)
+    return None
+
+
+# Built-in functions that access variables by name, with the positions of
+# the arguments naming variables they read and write
+_CONTEXT_FUNCTIONS = {
+    "get": ((0,), ()),
+    "set": ((), (0,)),
+    "setmulti": ((), (0,)),
+    "unset": ((), (0,)),
+    "copy": ((1,), (0,)),
+    "copymerge": ((0, 1), (0,)),
+}
+
+# Built-in functions that depend on more than their arguments
+_OPAQUE_FUNCTIONS = frozenset(["performer", "matchedtracks"])
+
+
+class CompiledScript(object):
+    """A compiled script, call it with the parser to evaluate it.
+
+    `reads` and `writes` are the variables the script reads and writes, or
+    None if that isn't known, e.g. because it calls a plugin function. A
+    script with known `reads` returns the same result as long as these
+    variables don't change.
+    """
+
+    def __init__(self, expression, parser):
+        self._function = expression.compile(parser)
+        functions = set()
+        reads = set()
+        writes = set()
+        reads_unknown = writes_unknown = False
+        for node in _walk(expression):
+            if isinstance(node, ScriptVariable):
+                reads.add(_variable_name(node.name))
+                continue
+            name = node.name
+            functions.add(name)
+            if parser.functions[name][0].__module__ != __name__:
+                # Functions from plugins might do anything to the context
+                reads_unknown = writes_unknown = True
+            elif name in _OPAQUE_FUNCTIONS:
+                reads_unknown = True
+            elif name in _CONTEXT_FUNCTIONS:
+                read_args, write_args = _CONTEXT_FUNCTIONS[name]
+                for index in read_args:
+                    reads_unknown |= not self._add_name(reads, node.args, index)
+                for index in write_args:
+                    writes_unknown |= not self._add_name(writes, node.args, index)
+        self.functions = frozenset(functions)
+        self.reads = None if reads_unknown else frozenset(reads)
+        self.writes = None if writes_unknown else frozenset(writes)
+        self.writes_context = self.writes is None or bool(self.writes)
+
+    @staticmethod
+    def _add_name(names, args, index):
+        """Add the variable named by an argument, False if it's not constant."""
+        if index < len(args):
+            name = _constant(args[index])
+            if name is None:
+                return False
+            names.add(_variable_name(name))
+        return True
+
+    def __call__(self, parser):
+        return self._function(parser)
+
+
+class ScriptProfile(object):
+    """Counts the calls and time spent per script function and line.
+
+    Set it as `profile` of a `ScriptParser` to profile the scripts the
+    parser evaluates. The time of a call doesn't include the time of the
+    functions called in its arguments, so the times add up.
+    """
+
+    def __init__(self):
+        self.functions = defaultdict(lambda: [0, 0.0])
+        self.lines = defaultdict(lambda: [0, 0.0])
+        # Compiled scripts of this profile by script text and function table
+        self.scripts = {}
+        self._local = threading.local()
+
+    def wrap(self, function, name, line):
+        """Return the compiled `function` so that its calls are counted."""
+        timer = timeit.default_timer
+        local = self._local
+
+        def profiled(parser):
+            try:
+                stack = local.stack
+            except AttributeError:
+                stack = local.stack = []
+            stack.append(0.0)
+            start = timer()
+            try:
+                return function(parser)
+            finally:
+                elapsed = timer() - start
+                own = elapsed - stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.add(name, line, own)
+        return profiled
+
+    def add(self, name, line, time):
+        stats = self.functions[name]
+        stats[0] += 1
+        stats[1] += time
+        stats = self.lines[line]
+        stats[0] += 1
+        stats[1] += time
+
+    def top_functions(self, limit=None):
+        """Return (name, calls, time) of the slowest functions."""
+        return self._top(self.functions, limit)
+
+    def top_lines(self, limit=None):
+        """Return (line, calls, time) of the slowest lines."""
+        return self._top(self.lines, limit)
+
+    @staticmethod
+    def _top(stats, limit):
+        result = sorted(((key, calls, time) for key, (calls, time) in stats.iteritems()),
+                        key=lambda item: item[2], reverse=True)
+        return result[:limit] if limit is not None else result
+
+    def clear(self):
+        self.functions.clear()
+        self.lines.clear()
+
 
 def isidentif(ch):
     return ch.isalnum() or ch == '_'
@@ -129,7 +340,12 @@ Grammar:
 """
 
     _function_registry = ExtensionPoint()
-    _cache = {}
+    # ScriptProfile to record the evaluated scripts in, if any
+    profile = None
+    _functions = None
+    _functions_key = None
+    # Compiled scripts by script text and function table
+    _cache = LRUCache(200)
 
     def __raise_eof(self):
         raise EndOfFile("Unexpected end of script at position %d, line %d" % (self._x, self._y))
@@ -172,13 +388,14 @@ Grammar:
 
     def parse_function(self):
         start = self._pos
+        line = self._y
         while True:
             ch = self.read()
             if ch == '(':
                 name = self._text[start:self._pos-1]
                 if name not in self.functions:
                     raise UnknownFunction("Unknown function '%s'" % name)
-                return ScriptFunction(name, self.parse_arguments(), self)
+                return ScriptFunction(name, self.parse_arguments(), self, line)
             elif ch is None:
                 self.__raise_eof()
             elif not isidentif(ch):
@@ -241,9 +458,16 @@ Grammar:
         return (tokens, ch)
 
     def load_functions(self):
-        self.functions = {}
-        for name, function, eval_args, num_args in ScriptParser._function_registry:
-            self.functions[name] = (function, eval_args, num_args)
+        registry = ScriptParser._function_registry
+        key = (registry.generation, enabled_plugins())
+        if key != ScriptParser._functions_key:
+            functions = {}
+            for name, function, eval_args, num_args in registry:
+                functions[name] = (function, eval_args, num_args)
+            ScriptParser._functions = functions
+            ScriptParser._functions_key = key
+        self.functions = ScriptParser._functions
+        self._functions_key = key
 
     def parse(self, script, functions=False):
         """Parse the script."""
@@ -256,15 +480,58 @@ Grammar:
             self.load_functions()
         return self.parse_expression(True)[0]
 
+    def compile(self, script):
+        """Parse the script and compile it to a `CompiledScript`.
+
+        Compiled scripts are cached until the script functions change.
+        """
+        self.load_functions()
+        key = (script, self._functions_key)
+        if self.profile is not None:
+            # Profiled scripts are compiled separately
+            compiled = self.profile.scripts.get(key)
+            if compiled is None:
+                compiled = CompiledScript(self.parse(script, True), self)
+                self.profile.scripts[key] = compiled
+            return compiled
+        compiled = ScriptParser._cache.get(key)
+        if compiled is None:
+            compiled = CompiledScript(self.parse(script, True), self)
+            ScriptParser._cache[key] = compiled
+        return compiled
+
+    @staticmethod
+    def cache_info():
+        """Return the hits, misses and size of the compiled script cache."""
+        return ScriptParser._cache.info()
+
     def eval(self, script, context=None, file=None):
         """Parse and evaluate the script."""
         self.context = context if context is not None else Metadata()
         self.file = file
-        self.load_functions()
-        key = hash(script)
-        if key not in ScriptParser._cache:
-            ScriptParser._cache[key] = self.parse(script, True)
-        return ScriptParser._cache[key].eval(self)
+        return self.compile(script)(self)
+
+    def eval_many(self, script, contexts, file=None, error=None):
+        """Evaluate the script on each of the contexts, return the results.
+
+        The script is only compiled once. If `error` is given, it is called
+        with the context instead of raising if evaluating the script fails,
+        and the result is None.
+        """
+        compiled = self.compile(script)
+        self.file = file
+        results = []
+        for context in contexts:
+            self.context = context
+            if error is None:
+                results.append(compiled(self))
+                continue
+            try:
+                results.append(compiled(self))
+            except:
+                error(context)
+                results.append(None)
+        return results
 
 
 def register_script_function(function, name=None, eval_args=True,
@@ -357,12 +624,23 @@ def func_inmulti(parser, text, value, separator=MULTI_VALUED_JOINER):
     return func_in(parser, text.split(separator) if separator else [text], value)
 
 
+_regex_cache = LRUCache(100)
+
+
+def _compile_regex(pattern):
+    regex = _regex_cache.get(pattern)
+    if regex is None:
+        regex = re.compile(pattern)
+        _regex_cache[pattern] = regex
+    return regex
+
+
 def func_rreplace(parser, text, old, new):
-    return re.sub(old, new, text)
+    return _compile_regex(old).sub(new, text)
 
 
 def func_rsearch(parser, text, pattern):
-    match = re.search(pattern, text)
+    match = _compile_regex(pattern).search(text)
     if match:
         try:
             return match.group(1)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Pool of MusicBrainz server replicas.
+"""
+
+import re
+import time
+from picard import log
+
+
+ROUTING_ROUND_ROBIN = "round-robin"
+ROUTING_LEAST_OUTSTANDING = "least-outstanding"
+
+# A failed server is not used for FAILURE_COOLDOWN seconds, the time doubles
+# with every further failure up to MAX_FAILURE_COOLDOWN
+FAILURE_COOLDOWN = 5
+MAX_FAILURE_COOLDOWN = 300
+
+_server_re = re.compile(r'^([^:/\s]+)(?::(\d+))?(?:/(\d+))?$')
+
+
+class Server(object):
+
+    def __init__(self, host, port=80, weight=1):
+        self.host = host
+        self.port = port
+        self.weight = weight
+        self.current_weight = 0
+        self.failures = 0
+        self.down_until = 0.0
+
+    @property
+    def key(self):
+        return (self.host, self.port)
+
+    def is_available(self, now):
+        return self.down_until <= now
+
+    def __repr__(self):
+        return "Server(%r, %d, %d)" % (self.host, self.port, self.weight)
+
+
+def parse_servers(text, default_port=80):
+    """Parse a list of servers.
+
+    Entries are separated by whitespace or commas and have the form
+    ``host[:port][/weight]``. Invalid entries are skipped.
+    """
+    servers = []
+    for entry in re.split(r'[\s,]+', text.strip()):
+        if not entry:
+            continue
+        match = _server_re.match(entry)
+        if match is None:
+            log.warning("Invalid server pool entry %r", entry)
+            continue
+        host, port, weight = match.groups()
+        port = int(port) if port else default_port
+        weight = int(weight) if weight else 1
+        if weight < 1:
+            log.warning("Invalid weight for server pool entry %r", entry)
+            continue
+        servers.append(Server(host, port, weight))
+    return servers
+
+
+class ServerPool(object):
+    """Routes requests to a set of equivalent servers.
+
+    Servers are chosen by smooth weighted round-robin or by the lowest
+    number of outstanding requests relative to their weight. Servers that
+    fail are put on hold for an exponentially growing cooldown period and
+    are retried afterwards.
+    """
+
+    def __init__(self, servers, routing=ROUTING_ROUND_ROBIN):
+        self.servers = servers
+        self.routing = routing
+
+    def __len__(self):
+        return len(self.servers)
+
+    def choose(self, outstanding=None, exclude=(), now=None):
+        """Choose a server for the next request.
+
+        `outstanding` is a function returning the number of queued and
+        running requests of a server, it is required for least-outstanding
+        routing. Servers in `exclude` are only used if there is nothing
+        else left. Returns None if the pool is empty.
+        """
+        if not self.servers:
+            return None
+        if now is None:
+            now = time.time()
+        servers = [s for s in self.servers if s not in exclude] or self.servers
+        candidates = [s for s in servers if s.is_available(now)]
+        if not candidates:
+            # Everything is down, try the server that will recover first
+            return min(servers, key=lambda s: s.down_until)
+        if self.routing == ROUTING_LEAST_OUTSTANDING and outstanding is not None:
+            return min(candidates, key=lambda s: float(outstanding(s) + 1) / s.weight)
+        total = 0
+        best = None
+        for server in candidates:
+            server.current_weight += server.weight
+            total += server.weight
+            if best is None or server.current_weight > best.current_weight:
+                best = server
+        best.current_weight -= total
+        return best
+
+    def mark_failed(self, server, now=None):
+        if now is None:
+            now = time.time()
+        if not server.is_available(now):
+            # Already known to be down, e.g. reported by several requests
+            return
+        server.failures += 1
+        cooldown = min(MAX_FAILURE_COOLDOWN, FAILURE_COOLDOWN * 2 ** (server.failures - 1))
+        server.down_until = now + cooldown
+        log.warning("Server %s:%d failed, not using it for %d seconds",
+                    server.host, server.port, cooldown)
+
+    def mark_ok(self, server):
+        if server.failures:
+            log.info("Server %s:%d is available again", server.host, server.port)
+        server.failures = 0
+        server.down_until = 0.0
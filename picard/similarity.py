@@ -19,7 +19,8 @@
 
 import re
 from picard.util import strip_non_alnum
-from picard.util.astrcmp import astrcmp
+from picard.util.astrcmp import astrcmp, astrcmp_bounded, astrcmp_matrix
+from picard.util.lrucache import LRUCache
 
 
 _replace_words = {
@@ -42,32 +43,66 @@ def normalize(orig_string):
     return string
 
 
-def similarity(a1, b1):
-    """Calculates similarity of single words as a function of their edit distance."""
+def similarity(a1, b1, threshold=None):
+    """Calculates similarity of single words as a function of their edit distance.
+
+    If `threshold` is given, similarities below it are returned as 0.0,
+    which is a lot faster for dissimilar words.
+    """
     a2 = normalize(a1)
     if a2:
         b2 = normalize(b1)
     else:
-        b2 = ""
-    return astrcmp(a2, b2)
+        b2 = u""
+    if threshold is None:
+        return astrcmp(a2, b2)
+    return astrcmp_bounded(a2, b2, threshold)
+
+
+def similarity_matrix(strings_a, strings_b=None, threshold=0.0):
+    """Calculates the similarity of all pairs of words in one native call.
+
+    Every word of `strings_a` is compared to every word of `strings_b`, or
+    if `strings_b` is None, to the following words of `strings_a`. Returns a
+    list of (index_a, index_b, similarity) tuples for the pairs with a
+    similarity of at least `threshold`, same as `similarity` would.
+    """
+    strings_a = map(normalize, strings_a)
+    if strings_b is not None:
+        strings_b = map(normalize, strings_b)
+    return astrcmp_matrix(strings_a, strings_b, threshold)
 
 
 _split_words_re = re.compile('\W+', re.UNICODE)
+# The same titles and artists get compared to a lot of tracks and releases
+_words_cache = LRUCache(10000)
+
+
+def split_words(string):
+    """Returns the lowercase words of a string as a tuple."""
+    words = _words_cache.get(string)
+    if words is None:
+        words = tuple(filter(bool, _split_words_re.split(string.lower())))
+        _words_cache[string] = words
+    return words
 
 
 def similarity2(a, b):
     """Calculates similarity of a multi-word strings."""
-    alist = filter(bool, _split_words_re.split(a.lower()))
-    blist = filter(bool, _split_words_re.split(b.lower()))
+    alist = split_words(a)
+    blist = split_words(b)
     total = 0
     score = 0.0
     if len(alist) > len(blist):
         alist, blist = blist, alist
+    # Matched words get removed
+    blist = list(blist)
     for a in alist:
         ms = 0.0
         mp = None
         for position, b in enumerate(blist):
-            s = astrcmp(a, b)
+            # Only words better than the best match so far are of interest
+            s = astrcmp_bounded(a, b, ms)
             if s > ms:
                 ms = s
                 mp = position
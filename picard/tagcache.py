@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Persistent cache for the metadata read from files.
+
+Files are identified by their normalized path, and an entry is only used
+while the size and modification time of the file are the same as when it
+was read. Embedded images are stored once per SHA-1 digest, since all
+tracks of an album usually carry the same cover, and are only read from
+the cache when their bytes are needed.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from picard import PICARD_VERSION_STR, config, log
+from picard.metadata import Metadata
+from picard.util.imageref import ImageHandle, ImageRef
+
+
+class TagCache(object):
+
+    options = [
+        config.BoolOption("setting", "tag_cache_enabled", True),
+        config.IntOption("setting", "tag_cache_size_in_mb", 500),
+    ]
+
+    # Number of changes to collect before writing them to the database
+    commit_interval = 100
+
+    def __init__(self, filename, max_size=500 * 1024 * 1024):
+        self.filename = filename
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        # Files are loaded from several threads
+        self._lock = threading.Lock()
+        self._changes = 0
+        self._accessed = {}
+        try:
+            self._connect()
+        except sqlite3.DatabaseError as e:
+            # The cache is disposable, start from scratch if it got corrupted
+            log.warning("Tag cache %s is unusable (%s), recreating it", filename, e)
+            if os.path.exists(filename):
+                os.remove(filename)
+            self._connect()
+
+    def _connect(self):
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(self.filename, check_same_thread=False)
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS file (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            settings TEXT NOT NULL,
+            accessed REAL NOT NULL,
+            data BLOB NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS file_accessed ON file (accessed)")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS image (
+            sha1 TEXT PRIMARY KEY,
+            data BLOB NOT NULL)""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS file_image (
+            path TEXT NOT NULL,
+            sha1 TEXT NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS file_image_path ON file_image (path)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS file_image_sha1 ON file_image (sha1)")
+        self._db.commit()
+        self._size = self._total_size()
+
+    def _total_size(self):
+        return (self._db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM file").fetchone()[0] +
+                self._db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM image").fetchone()[0])
+
+    @staticmethod
+    def make_key(filename):
+        return os.path.normcase(os.path.abspath(filename))
+
+    @staticmethod
+    def _settings():
+        # Everything besides the file itself that changes what is read from it
+        return u"%s\n%s\n%s" % (PICARD_VERSION_STR, config.setting["rating_steps"],
+                                config.setting["rating_user_email"])
+
+    def get(self, filename, stat, reader=None):
+        """Return the cached metadata of `filename` or None.
+
+        `stat` is the current `os.stat` result of the file. The images are
+        references that are read with `reader`, from the cache by default.
+        """
+        key = self.make_key(filename)
+        with self._lock:
+            try:
+                row = self._db.execute(
+                    "SELECT size, mtime, settings, data FROM file WHERE path = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                self._failed("reading", filename, e, rollback=False)
+                row = None
+            if (row is None or row[0] != stat.st_size or row[1] != stat.st_mtime or
+                    row[2] != self._settings()):
+                self.misses += 1
+                return None
+            try:
+                metadata = self._decode(filename, row[3], reader or self._read_image)
+            except (zlib.error, ValueError, KeyError, TypeError) as e:
+                log.warning("Tag cache entry of %r is corrupt: %s", filename, e)
+                try:
+                    self._remove(key)
+                    self._changed()
+                except sqlite3.Error as e:
+                    self._failed("removing", filename, e)
+                self.misses += 1
+                return None
+            self._accessed[key] = time.time()
+            self.hits += 1
+            return metadata
+
+    @staticmethod
+    def _decode(filename, data, read_image):
+        record = json.loads(zlib.decompress(str(data)))
+        metadata = Metadata()
+        for name, values in record["tags"]:
+            metadata.set(name, values)
+        metadata.length = record["length"]
+        for index, image in enumerate(record["images"]):
+            image["data"] = ImageRef(filename, index, image.pop("sha1"),
+                                     image.pop("size"), read_image)
+            metadata.images.append(image)
+        return metadata
+
+    def put(self, filename, stat, metadata):
+        """Store the metadata read from `filename` with its `os.stat` result."""
+        images = []
+        image_data = {}
+        for image in metadata.images:
+            image = dict(image)
+            data = image.pop("data")
+            if isinstance(data, ImageHandle):
+                # Free if a reference is still pinned after loading
+                image["sha1"] = data.sha1
+                data = data.read()
+            else:
+                image["sha1"] = hashlib.sha1(data).hexdigest()
+            image["size"] = len(data)
+            image_data[image["sha1"]] = data
+            images.append(image)
+        try:
+            data = zlib.compress(json.dumps({
+                "tags": metadata.rawitems(),
+                "length": metadata.length,
+                "images": images,
+            }))
+        except (TypeError, ValueError) as e:
+            log.debug("Not caching the tags of %r: %s", filename, e)
+            return
+        key = self.make_key(filename)
+        now = time.time()
+        with self._lock:
+            try:
+                self._remove(key)
+                self._db.execute(
+                    "INSERT INTO file (path, size, mtime, settings, accessed, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, stat.st_size, stat.st_mtime, self._settings(), now, sqlite3.Binary(data)))
+                self._size += len(data)
+                for sha1, image in image_data.iteritems():
+                    self._db.execute("INSERT INTO file_image (path, sha1) VALUES (?, ?)", (key, sha1))
+                    if self._db.execute("SELECT 1 FROM image WHERE sha1 = ?", (sha1,)).fetchone() is None:
+                        self._db.execute("INSERT INTO image (sha1, data) VALUES (?, ?)",
+                                         (sha1, sqlite3.Binary(image)))
+                        self._size += len(image)
+                if self._size > self.max_size:
+                    self._evict()
+                self._changed()
+            except sqlite3.Error as e:
+                self._failed("writing", filename, e)
+
+    def read_image(self, sha1):
+        """Return the bytes of the image with the digest `sha1` or None."""
+        with self._lock:
+            try:
+                row = self._db.execute("SELECT data FROM image WHERE sha1 = ?", (sha1,)).fetchone()
+            except sqlite3.Error as e:
+                self._failed("reading image", sha1, e, rollback=False)
+                return None
+        if row is None:
+            return None
+        return str(row[0])
+
+    def _read_image(self, ref):
+        return self.read_image(ref.sha1)
+
+    def remove(self, filename):
+        """Forget the metadata of `filename`, e.g. because it was saved."""
+        with self._lock:
+            try:
+                self._remove(self.make_key(filename))
+                self._changed()
+            except sqlite3.Error as e:
+                self._failed("removing", filename, e)
+
+    def _remove(self, key):
+        row = self._db.execute("SELECT LENGTH(data) FROM file WHERE path = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM file WHERE path = ?", (key,))
+            self._db.execute("DELETE FROM file_image WHERE path = ?", (key,))
+            self._size -= row[0]
+        self._accessed.pop(key, None)
+
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= self.commit_interval:
+            self._commit()
+
+    def _commit(self):
+        if self._accessed:
+            self._db.executemany("UPDATE file SET accessed = ? WHERE path = ?",
+                                 [(accessed, key) for key, accessed in self._accessed.iteritems()])
+            self._accessed = {}
+        self._db.commit()
+        self._changes = 0
+
+    def _evict(self):
+        # Drop the least recently used files until we are 10% below the limit
+        self._commit()
+        target = self.max_size * 9 // 10
+        cursor = self._db.execute("SELECT accessed, LENGTH(data) FROM file ORDER BY accessed")
+        removed = 0
+        cutoff = None
+        for accessed, size in cursor:
+            removed += size
+            cutoff = accessed
+            if self._size - removed <= target:
+                break
+        cursor.close()
+        if cutoff is not None:
+            self._db.execute("DELETE FROM file_image WHERE path IN "
+                             "(SELECT path FROM file WHERE accessed <= ?)", (cutoff,))
+            self._db.execute("DELETE FROM file WHERE accessed <= ?", (cutoff,))
+        self._db.execute("DELETE FROM image WHERE sha1 NOT IN (SELECT sha1 FROM file_image)")
+        self._size = self._total_size()
+        log.debug("Tag cache size after eviction: %d bytes", self._size)
+
+    def _failed(self, action, name, error, rollback=True):
+        # The cache must never break loading or saving files, e.g. when
+        # another instance holds a lock or the disk is full
+        log.warning("Tag cache error %s %r: %s", action, name, error)
+        if not rollback:
+            return
+        # Drop the partly written changes
+        try:
+            self._db.rollback()
+            self._size = self._total_size()
+        except sqlite3.Error:
+            pass
+        self._accessed = {}
+        self._changes = 0
+
+    def flush(self):
+        with self._lock:
+            try:
+                self._commit()
+            except sqlite3.Error as e:
+                self._failed("writing", self.filename, e)
+
+    def clear(self):
+        with self._lock:
+            try:
+                self._db.execute("DELETE FROM file")
+                self._db.execute("DELETE FROM file_image")
+                self._db.execute("DELETE FROM image")
+                self._accessed = {}
+                self._db.commit()
+                self._changes = 0
+                self._size = 0
+            except sqlite3.Error as e:
+                self._failed("clearing", self.filename, e)
+
+    def close(self):
+        with self._lock:
+            try:
+                self._commit()
+            except sqlite3.Error as e:
+                self._failed("writing", self.filename, e)
+            self._db.close()
@@ -49,7 +49,7 @@ from picard import PICARD_VERSION_STR, log, acoustid, config
 from picard.album import Album, NatAlbum
 from picard.browser.browser import BrowserIntegration
 from picard.browser.filelookup import FileLookup
-from picard.cluster import Cluster, ClusterList, UnmatchedFiles
+from picard.cluster import Cluster, ClusterList, ClusterTask, UnmatchedFiles
 from picard.const import USER_DIR, USER_PLUGIN_DIR
 from picard.disc import Disc
 from picard.file import File
@@ -70,6 +70,7 @@ from picard.util import (
     uniqify
     )
 from picard.webservice import XmlWebService
+from picard.tagcache import TagCache
 
 
 class Tagger(QtGui.QApplication):
@@ -94,10 +95,10 @@ class Tagger(QtGui.QApplication):
         # It's a valid reference, but its start() method doesn't work.
         self.thread_pool = QtCore.QThreadPool(self)
 
-        # Use a separate thread pool for file saving, with a thread count of 1,
-        # to avoid race conditions in File._save_and_rename.
+        # Use a separate thread pool for file saving. Conflicting operations
+        # in File._save_and_rename are serialized with path locks.
         self.save_thread_pool = QtCore.QThreadPool(self)
-        self.save_thread_pool.setMaxThreadCount(1)
+        self.save_thread_pool.setMaxThreadCount(max(1, config.setting["save_thread_count"]))
 
         # Setup logging
         if debug or "PICARD_DEBUG" in os.environ:
@@ -130,6 +131,10 @@ class Tagger(QtGui.QApplication):
 
         self.xmlws = XmlWebService()
 
+        self.tag_cache = None
+        if config.setting["tag_cache_enabled"]:
+            self.setup_tag_cache()
+
         load_user_collections()
 
         # Initialize fingerprinting
@@ -157,6 +162,7 @@ class Tagger(QtGui.QApplication):
         self.mbid_redirects = {}
         self.unmatched_files = UnmatchedFiles()
         self.nats = None
+        self._cluster_task = None
         self.window = MainWindow()
 
     def _upgrade_config(self):
@@ -237,10 +243,26 @@ class Tagger(QtGui.QApplication):
 
     def exit(self):
         self.stopping = True
+        self.cancel_clustering()
         self._acoustid.done()
         self.thread_pool.waitForDone()
+        self.save_thread_pool.waitForDone()
         self.browser_integration.stop()
         self.xmlws.stop()
+        if self.tag_cache is not None:
+            self.tag_cache.close()
+
+    def setup_tag_cache(self):
+        location = QtGui.QDesktopServices.storageLocation(QtGui.QDesktopServices.CacheLocation)
+        filename = os.path.join(unicode(location), u'tag_cache.sqlite')
+        try:
+            self.tag_cache = TagCache(
+                filename, max_size=config.setting["tag_cache_size_in_mb"] * 1024 * 1024)
+        except Exception as e:
+            log.error("Unable to open tag cache %s: %s", filename, e)
+            self.tag_cache = None
+        else:
+            log.debug("Tag cache: %s", filename)
 
     def _run_init(self):
         if self._args:
@@ -401,7 +423,7 @@ class Tagger(QtGui.QApplication):
         if nat:
             return nat
         nat = NonAlbumTrack(id)
-        self.nats.tracks.append(nat)
+        self.nats.add_track(nat)
         self.nats.update(True)
         if node:
             nat._parse_recording(node)
@@ -411,9 +433,9 @@ class Tagger(QtGui.QApplication):
 
     def get_nat_by_id(self, id):
         if self.nats is not None:
-            for nat in self.nats.tracks:
-                if nat.id == id:
-                    return nat
+            nats = self.nats.get_tracks_by_trackid(id)
+            if nats:
+                return nats[0]
 
     def get_release_group_by_id(self, id):
         return self.release_groups.setdefault(id, ReleaseGroup(id))
@@ -515,21 +537,68 @@ class Tagger(QtGui.QApplication):
     # =======================================================================
 
     def cluster(self, objs):
-        """Group files with similar metadata to 'clusters'."""
+        """Group files with similar metadata to 'clusters'.
+
+        The clustering runs in a worker thread on a snapshot of the file
+        names. Afterwards the files are moved in batches.
+        """
         log.debug("Clustering %r", objs)
         if len(objs) <= 1 or self.unmatched_files in objs:
             files = list(self.unmatched_files.files)
+            state = self.unmatched_files.cluster_state
         else:
             files = self.get_files_from_objects(objs)
-        fcmp = lambda a, b: (
-            cmp(a.discnumber, b.discnumber) or
-            cmp(a.tracknumber, b.tracknumber) or
-            cmp(a.base_filename, b.base_filename))
-        for name, artist, files in Cluster.cluster(files, 1.0):
-            QtCore.QCoreApplication.processEvents()
+            state = None
+        self.cancel_clustering()
+        task = ClusterTask(files, 1.0, state)
+        self._cluster_task = task
+        self.window.set_statusbar_message(N_("Clustering %d files, press Esc to cancel..."), len(files))
+        thread.run_task(task.run, partial(self._clustering_finished, task))
+
+    def cancel_clustering(self):
+        """Abort a running clustering, returns whether there was one."""
+        task = self._cluster_task
+        if task is None:
+            return False
+        task.cancel()
+        self._cluster_task = None
+        self.window.set_statusbar_message(N_("Clustering cancelled"), timeout=3000)
+        return True
+
+    def _clustering_finished(self, task, result=None, error=None):
+        if task is not self._cluster_task:
+            return
+        if error is not None:
+            self._cluster_task = None
+            self.window.set_statusbar_message(N_("Clustering failed: %s"), error, timeout=3000)
+            return
+        task.set_result(result)
+        self._move_clustered_files(task)
+
+    def _move_clustered_files(self, task):
+        if task is not self._cluster_task:
+            return
+        moved = 0
+        while task.pending and moved < task.batch_size:
+            name, artist, files = task.pending.popleft()
+            batch = files[:task.batch_size - moved]
+            if len(batch) < len(files):
+                task.pending.appendleft((name, artist, files[len(batch):]))
             cluster = self.load_cluster(name, artist)
-            for file in sorted(files, fcmp):
-                file.move(cluster)
+            for file in batch:
+                if task.unchanged(file):
+                    file.move(cluster)
+            moved += len(batch)
+        task.moved += moved
+        if task.pending:
+            self.window.set_statusbar_message(N_("Clustering: %d of %d files moved, press Esc to cancel"),
+                                              task.moved, task.total)
+            # Let the event loop update the views before the next batch
+            thread.to_main(self._move_clustered_files, task)
+        else:
+            self._cluster_task = None
+            self.window.set_statusbar_message(N_("Clustering finished, %d files moved"),
+                                              task.moved, timeout=3000)
 
     def load_cluster(self, name, artist):
         for cluster in self.clusters:
@@ -556,7 +625,7 @@ class Tagger(QtGui.QApplication):
 
     def refresh(self, objs):
         for obj in objs:
-            obj.load()
+            obj.load(refresh=True)
 
     @classmethod
     def instance(cls):
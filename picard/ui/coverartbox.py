@@ -25,6 +25,7 @@ from picard.track import Track
 from picard.file import File
 from picard.metadata import is_front_image
 from picard.util import webbrowser2, encode_filename
+from picard.util.imageref import image_data, image_store
 
 
 class ActiveLabel(QtGui.QLabel):
@@ -101,7 +102,10 @@ class CoverArtBox(QtGui.QGroupBox):
         if self.data:
             if pixmap is None:
                 pixmap = QtGui.QPixmap()
-                pixmap.loadFromData(self.data["data"])
+                try:
+                    pixmap.loadFromData(image_data(self.data))
+                except IOError as e:
+                    log.warning("Can't read image: %s", e)
             if not pixmap.isNull():
                 offx, offy, w, h = (1, 1, 121, 121)
                 cover = QtGui.QPixmap(self.shadow)
@@ -176,6 +180,7 @@ class CoverArtBox(QtGui.QGroupBox):
             log.warning("Can't load image")
             return
         self.__set_data([mime, data], pixmap=pixmap)
+        data = image_store.add(data)
         if isinstance(self.item, Album):
             album = self.item
             album.metadata.add_image(mime, data)
@@ -19,7 +19,9 @@
 
 import os.path
 from PyQt4 import QtGui, QtCore
+from picard import log
 from picard.util import format_time, encode_filename, bytes2human
+from picard.util.imageref import image_data
 from picard.ui.ui_infodialog import Ui_InfoDialog
 
 
@@ -47,7 +49,11 @@ class InfoDialog(QtGui.QDialog):
             return
 
         for image in images:
-            data = image["data"]
+            try:
+                data = image_data(image)
+            except IOError as e:
+                log.warning("Can't read image: %s", e)
+                continue
             size = len(data)
             item = QtGui.QListWidgetItem()
             pixmap = QtGui.QPixmap()
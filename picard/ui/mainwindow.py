@@ -131,6 +131,9 @@ class MainWindow(QtGui.QMainWindow):
                 self.metadata_box.remove_selected_tags()
             else:
                 self.remove()
+        elif event.key() == QtCore.Qt.Key_Escape:
+            if not self.tagger.cancel_clustering():
+                QtGui.QMainWindow.keyPressEvent(self, event)
         else:
             QtGui.QMainWindow.keyPressEvent(self, event)
 
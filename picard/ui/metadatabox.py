@@ -281,6 +281,8 @@ class MetadataBox(QtGui.QTableWidget):
         if values != [""] or self.tag_is_removable(tag):
             for obj in objects:
                 obj.metadata[tag] = values
+                if isinstance(obj, Track) and obj.album is not None:
+                    obj.album.invalidate_track_index()
                 obj.update()
         self.update()
         self.parent.ignore_selection_changes = False
@@ -22,6 +22,7 @@ import os.path
 import sys
 from PyQt4 import QtCore, QtGui
 from picard import config
+from picard.plugin import set_enabled_plugins
 from picard.util import encode_filename
 from picard.ui.options import OptionsPage, register_options_page
 from picard.ui.ui_options_plugins import Ui_PluginsOptionsPage
@@ -107,7 +108,7 @@ class PluginsOptionsPage(OptionsPage):
         for item, plugin in self.items.iteritems():
             if item.checkState(0) == QtCore.Qt.Checked:
                 enabled_plugins.append(plugin.module_name)
-        config.setting["enabled_plugins"] = " ".join(enabled_plugins)
+        set_enabled_plugins(enabled_plugins)
 
     def change_details(self):
         plugin = self.items[self.ui.plugins.selectedItems()[0]]
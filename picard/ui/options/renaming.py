@@ -27,7 +27,11 @@ from picard.file import File
 from picard.script import ScriptParser, SyntaxError, UnknownFunction
 from picard.ui.options import OptionsPage, OptionsCheckError, register_options_page
 from picard.ui.ui_options_renaming import Ui_RenamingOptionsPage
-from picard.ui.options.scripting import TaggerScriptSyntaxHighlighter
+from picard.ui.options.scripting import (
+    TaggerScriptSyntaxHighlighter,
+    format_script_profile,
+    profile_script,
+)
 
 
 class RenamingOptionsPage(OptionsPage):
@@ -111,6 +115,7 @@ class RenamingOptionsPage(OptionsPage):
                                                 )
         self.ui.file_naming_format.textChanged.connect(self.check_formats)
         self.ui.file_naming_format_default.clicked.connect(self.set_file_naming_format_default)
+        self.ui.profile_naming_format.clicked.connect(self.profile_naming_format)
         self.highlighter = TaggerScriptSyntaxHighlighter(self.ui.file_naming_format.document())
         self.ui.move_files_to_browse.clicked.connect(self.move_files_to_browse)
 
@@ -200,6 +205,17 @@ class RenamingOptionsPage(OptionsPage):
     def display_error(self, error):
         pass
 
+    def profile_naming_format(self):
+        # Keep the line breaks, so the lines in the profile match the editor
+        format = unicode(self.ui.file_naming_format.toPlainText())
+        contexts = [(file.metadata, file) for file in (self.example_1(), self.example_2())]
+        try:
+            profile = profile_script(format, contexts)
+        except Exception, e:
+            self.ui.naming_format_profile.setText(QtCore.Qt.escape(str(e)))
+            return
+        self.ui.naming_format_profile.setText(format_script_profile(profile))
+
     def set_file_naming_format_default(self):
         self.ui.file_naming_format.setText(self.options[3].default)
 #        self.ui.file_naming_format.setCursorPosition(0)
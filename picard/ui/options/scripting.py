@@ -19,7 +19,8 @@
 
 from PyQt4 import QtCore, QtGui
 from picard import config
-from picard.script import ScriptParser
+from picard.metadata import Metadata
+from picard.script import ScriptParser, ScriptProfile
 from picard.ui.options import OptionsPage, OptionsCheckError, register_options_page
 from picard.ui.ui_options_script import Ui_ScriptingOptionsPage
 
@@ -57,6 +58,37 @@ class TaggerScriptSyntaxHighlighter(QtGui.QSyntaxHighlighter):
                 index = expr.indexIn(text, index + length + b)
 
 
+def profile_script(script, contexts, runs=100):
+    """Evaluate `script` about `runs` times on copies of the metadata.
+
+    `contexts` is a list of (metadata, file) pairs. Returns the
+    `ScriptProfile` of the runs.
+    """
+    parser = ScriptParser()
+    parser.profile = ScriptProfile()
+    for i in xrange(max(1, runs // len(contexts))):
+        for metadata, file in contexts:
+            copy = Metadata()
+            copy.copy(metadata)
+            parser.eval(script, copy, file)
+    return parser.profile
+
+
+def format_script_profile(profile, limit=5):
+    """Return the slowest functions and lines of `profile` as HTML."""
+    rows = [u"<tr><th align='left'>%s</th><th>%s</th><th>%s</th></tr>" % (
+        _("Function"), _("Calls"), _("Time"))]
+    for name, calls, time in profile.top_functions(limit):
+        rows.append(u"<tr><td>$%s</td><td align='right'>%d</td><td align='right'>%.2f ms</td></tr>" % (
+            unicode(QtCore.Qt.escape(name)), calls, time * 1000))
+    rows.append(u"<tr><th align='left'>%s</th><th>%s</th><th>%s</th></tr>" % (
+        _("Line"), _("Calls"), _("Time")))
+    for line, calls, time in profile.top_lines(limit):
+        rows.append(u"<tr><td>%d</td><td align='right'>%d</td><td align='right'>%.2f ms</td></tr>" % (
+            line, calls, time * 1000))
+    return u"<table cellspacing='4'>%s</table>" % u"".join(rows)
+
+
 class ScriptingOptionsPage(OptionsPage):
 
     NAME = "scripting"
@@ -78,6 +110,7 @@ class ScriptingOptionsPage(OptionsPage):
         self.ui.setupUi(self)
         self.highlighter = TaggerScriptSyntaxHighlighter(self.ui.tagger_script.document())
         self.ui.tagger_script.textChanged.connect(self.live_checker)
+        self.ui.profile_script.clicked.connect(self.profile)
 
     def live_checker(self):
         self.ui.script_error.setStyleSheet("")
@@ -96,6 +129,16 @@ class ScriptingOptionsPage(OptionsPage):
         except Exception, e:
             raise OptionsCheckError(_("Script Error"), str(e))
 
+    def profile(self):
+        files = self.tagger.get_files_from_objects(self.tagger.window.selected_objects)
+        contexts = [(file.metadata, file) for file in files] or [(Metadata(), None)]
+        try:
+            profile = profile_script(unicode(self.ui.tagger_script.toPlainText()), contexts)
+        except Exception, e:
+            self.ui.script_profile.setText(QtCore.Qt.escape(str(e)))
+            return
+        self.ui.script_profile.setText(format_script_profile(profile))
+
     def load(self):
         self.ui.enable_tagger_script.setChecked(config.setting["enable_tagger_script"])
         self.ui.tagger_script.document().setPlainText(config.setting["tagger_script"])
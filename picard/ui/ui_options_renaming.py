@@ -93,6 +93,14 @@ class Ui_RenamingOptionsPage(object):
         self.renaming_error.setAlignment(QtCore.Qt.AlignCenter)
         self.renaming_error.setObjectName(_fromUtf8("renaming_error"))
         self.horizontalLayout.addWidget(self.renaming_error)
+        self.profile_naming_format = QtGui.QPushButton(self.groupBox_2)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Fixed, QtGui.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.profile_naming_format.sizePolicy().hasHeightForWidth())
+        self.profile_naming_format.setSizePolicy(sizePolicy)
+        self.profile_naming_format.setObjectName(_fromUtf8("profile_naming_format"))
+        self.horizontalLayout.addWidget(self.profile_naming_format)
         self.file_naming_format_default = QtGui.QPushButton(self.groupBox_2)
         sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Fixed, QtGui.QSizePolicy.Fixed)
         sizePolicy.setHorizontalStretch(0)
@@ -103,6 +111,11 @@ class Ui_RenamingOptionsPage(object):
         self.file_naming_format_default.setObjectName(_fromUtf8("file_naming_format_default"))
         self.horizontalLayout.addWidget(self.file_naming_format_default)
         self.verticalLayout_2.addLayout(self.horizontalLayout)
+        self.naming_format_profile = QtGui.QLabel(self.groupBox_2)
+        self.naming_format_profile.setText(_fromUtf8(""))
+        self.naming_format_profile.setTextFormat(QtCore.Qt.RichText)
+        self.naming_format_profile.setObjectName(_fromUtf8("naming_format_profile"))
+        self.verticalLayout_2.addWidget(self.naming_format_profile)
         self.verticalLayout_5.addWidget(self.groupBox_2)
         self.groupBox = QtGui.QGroupBox(RenamingOptionsPage)
         self.groupBox.setObjectName(_fromUtf8("groupBox"))
@@ -144,6 +157,8 @@ class Ui_RenamingOptionsPage(object):
 "p, li { white-space: pre-wrap; }\n"
 "</style></head><body style=\" font-family:\'Monospace\'; font-size:9pt; font-weight:400; font-style:normal;\">\n"
 "<p style=\"-qt-paragraph-type:empty; margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px; font-size:10pt;\"><br /></p></body></html>", None, QtGui.QApplication.UnicodeUTF8))
+        self.profile_naming_format.setToolTip(_("Run the format on the examples and show the slowest functions and lines"))
+        self.profile_naming_format.setText(_("Profile"))
         self.file_naming_format_default.setText(_("Default"))
         self.groupBox.setTitle(_("Examples"))
 
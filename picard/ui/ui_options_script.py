@@ -40,6 +40,23 @@ class Ui_ScriptingOptionsPage(object):
         self.script_error.setAlignment(QtCore.Qt.AlignCenter)
         self.script_error.setObjectName(_fromUtf8("script_error"))
         self.verticalLayout.addWidget(self.script_error)
+        self.horizontalLayout = QtGui.QHBoxLayout()
+        self.horizontalLayout.setObjectName(_fromUtf8("horizontalLayout"))
+        self.script_profile = QtGui.QLabel(self.enable_tagger_script)
+        self.script_profile.setText(_fromUtf8(""))
+        self.script_profile.setTextFormat(QtCore.Qt.RichText)
+        self.script_profile.setAlignment(QtCore.Qt.AlignLeading|QtCore.Qt.AlignLeft|QtCore.Qt.AlignTop)
+        self.script_profile.setObjectName(_fromUtf8("script_profile"))
+        self.horizontalLayout.addWidget(self.script_profile)
+        self.profile_script = QtGui.QPushButton(self.enable_tagger_script)
+        sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Fixed, QtGui.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.profile_script.sizePolicy().hasHeightForWidth())
+        self.profile_script.setSizePolicy(sizePolicy)
+        self.profile_script.setObjectName(_fromUtf8("profile_script"))
+        self.horizontalLayout.addWidget(self.profile_script)
+        self.verticalLayout.addLayout(self.horizontalLayout)
         self.vboxlayout.addWidget(self.enable_tagger_script)
 
         self.retranslateUi(ScriptingOptionsPage)
@@ -47,4 +64,6 @@ class Ui_ScriptingOptionsPage(object):
 
     def retranslateUi(self, ScriptingOptionsPage):
         self.enable_tagger_script.setTitle(_("Tagger Script"))
+        self.profile_script.setToolTip(_("Run the script on the selected files and show the slowest functions and lines"))
+        self.profile_script.setText(_("Profile"))
 
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Assignment of rows to columns of a score matrix with the highest total
+score (Hungarian method).
+"""
+
+
+def max_weight_assignment(scores):
+    """
+    Assign every row of `scores` at most one column and every column at
+    most one row, so the sum of the scores of the assigned pairs is as high
+    as possible.
+
+    `scores` is a list of rows of equal length. Pairs with a score of None
+    or not above 0 are never assigned. Returns a list with the assigned
+    column index or None for every row.
+    """
+    num_rows = len(scores)
+    result = [None] * num_rows
+    if not num_rows:
+        return result
+    # Only admissible pairs matter. Rows and columns connected by them are
+    # solved separately, which keeps the problems small for sparse matrices.
+    edges = [[(j, s) for j, s in enumerate(row) if s is not None and s > 0]
+             for row in scores]
+    for rows, cols in _components(edges):
+        col_index = dict((j, k) for k, j in enumerate(cols))
+        sub = [[None] * len(cols) for i in rows]
+        for sub_row, i in zip(sub, rows):
+            for j, s in edges[i]:
+                sub_row[col_index[j]] = s
+        if len(rows) <= len(cols):
+            for i, k in zip(rows, _solve(sub)):
+                if k is not None:
+                    result[i] = cols[k]
+        else:
+            # The run time grows with the square of the number of rows
+            transposed = [list(col) for col in zip(*sub)]
+            for j, k in zip(cols, _solve(transposed)):
+                if k is not None:
+                    result[rows[k]] = j
+    return result
+
+
+def _components(edges):
+    """
+    Return the connected components of the bipartite graph with the
+    admissible pairs `edges` of every row, as lists of rows and columns.
+    Rows and columns without any admissible pair are left out.
+    """
+    # Union-find over the rows, joined through the columns they share
+    parent = range(len(edges))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    col_owner = {}
+    for i, row in enumerate(edges):
+        for j, s in row:
+            other = col_owner.setdefault(j, i)
+            a, b = find(i), find(other)
+            if a != b:
+                parent[a] = b
+    components = {}
+    for i, row in enumerate(edges):
+        if row:
+            components.setdefault(find(i), ([], []))[0].append(i)
+    for j in sorted(col_owner):
+        components[find(col_owner[j])][1].append(j)
+    return components.values()
+
+
+def _solve(scores):
+    """Hungarian method for `scores` with no more rows than columns."""
+    num_rows = len(scores)
+    size = len(scores[0])
+
+    # Costs to minimize, 1-based with a dummy row and column 0
+    costs = [None]
+    for row in scores:
+        costs.append([0.0] + [-s if s is not None else 0.0 for s in row])
+
+    inf = float("inf")
+    u = [0.0] * (num_rows + 1)
+    v = [0.0] * (size + 1)
+    # p[j]: row assigned to column j, way[j]: previous column on the path
+    p = [0] * (size + 1)
+    way = [0] * (size + 1)
+    columns = range(1, size + 1)
+    for i in xrange(1, num_rows + 1):
+        # Find the shortest augmenting path from row i to a free column
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (size + 1)
+        used = [False] * (size + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = costs[i0]
+            ui0 = u[i0]
+            delta = inf
+            j1 = 0
+            for j in columns:
+                if not used[j]:
+                    cur = row[j] - ui0 - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in xrange(size + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        # Flip the assignments along the path
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    result = [None] * num_rows
+    for j in columns:
+        i = p[j]
+        if i and costs[i][j] < 0.0:
+            result[i - 1] = j - 1
+    return result
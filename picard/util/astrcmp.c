@@ -44,6 +44,7 @@
 #include <stdio.h>
 #include <string.h>
 #include <stdlib.h>
+#include <limits.h>
 
 
 /***
@@ -142,31 +143,581 @@ float LevenshteinDistance(const Py_UNICODE * s1, int len1,
 	return result;
 }
 
+/***
+ * Same as LevenshteinDistance, but only interested in results of at least
+ * min_similarity. Anything below is reported as 0.0.
+ *
+ * The maximum edit distance k for min_similarity is known up front, so
+ * only a band of 2k+1 cells around the diagonal has to be computed
+ * (Ukkonen). The band of every row is checked and the computation stops as
+ * soon as the distance can't get below k anymore. The transposition step
+ * needs the rows i-1 and i-2, so three rows of the length of the shorter
+ * string are kept instead of the full matrix.
+ ***/
+
+#define STACK_ROW_SIZE 256
+
+float BoundedLevenshteinDistance(const Py_UNICODE * s1, int len1,
+                                 const Py_UNICODE * s2, int len2,
+                                 double min_similarity)
+{
+	int stack_rows[3 * (STACK_ROW_SIZE + 1)];
+	int *rows, *row, *prev, *prev2, *tmp;
+	int index1, index2, lo, hi, k, inf, row_min, prev_min, distance, maxlen;
+	float result;
+
+	if (len1 == 0 || len2 == 0)
+		return 0.0f;
+
+	/* Iterate over the longer string, keep rows of the shorter one */
+	if (len2 > len1)
+	{
+		const Py_UNICODE *s = s1;
+		int len = len1;
+		s1 = s2; len1 = len2;
+		s2 = s; len2 = len;
+	}
+	maxlen = len1;
+
+	/* Largest distance that can still reach min_similarity, plus one for
+	   rounding. Cells outside of the band count as inf. */
+	if (min_similarity <= 0.0)
+		k = maxlen;
+	else
+		k = MIN(maxlen, (int)((1.0 - min_similarity) * maxlen) + 1);
+	inf = k + 1;
+
+	if (len1 - len2 > k)
+		return 0.0f;
+
+	if (len2 + 1 <= STACK_ROW_SIZE + 1)
+		rows = stack_rows;
+	else
+	{
+		rows = malloc(sizeof(int) * 3 * (len2 + 1));
+		if (rows == NULL)
+			return -1.0f;
+	}
+	prev2 = rows;
+	prev = rows + (len2 + 1);
+	row = rows + 2 * (len2 + 1);
+
+	for (index2 = 0; index2 <= len2; index2++)
+		prev[index2] = MIN(index2, inf);
+	prev_min = 0;
+
+	for (index1 = 1; index1 <= len1; index1++)
+	{
+		Py_UNICODE s1_current = s1[index1 - 1];
+
+		lo = MAX(1, index1 - k);
+		hi = MIN(len2, index1 + k);
+		row[0] = MIN(index1, inf);
+		if (lo > 1)
+			row[lo - 1] = inf;
+		row_min = lo > 1 ? inf : row[0];
+
+		for (index2 = lo; index2 <= hi; index2++)
+		{
+			Py_UNICODE s2_current = s2[index2 - 1];
+			int cost = (s1_current == s2_current) ? 0 : 1;
+			int cell = MIN(MIN(prev[index2] + 1, row[index2 - 1] + 1),
+			               prev[index2 - 1] + cost);
+
+			if (index1 > 2 && index2 > 2)
+			{
+				int trans = prev2[index2 - 2] + 1;
+				if (s1[index1 - 2] != s2_current)
+					trans++;
+				if (s1_current != s2[index2 - 2])
+					trans++;
+				if (cell > trans)
+					cell = trans;
+			}
+
+			row[index2] = cell;
+			if (cell < row_min)
+				row_min = cell;
+		}
+		if (hi < len2)
+			row[hi + 1] = inf;
+
+		/* Every following cell builds on one of the last two rows */
+		if (row_min > k && prev_min > k)
+			break;
+		prev_min = row_min;
+
+		tmp = prev2;
+		prev2 = prev;
+		prev = row;
+		row = tmp;
+	}
+
+	if (index1 <= len1)
+		distance = inf;
+	else
+		distance = prev[len2];
+
+	if (rows != stack_rows)
+		free(rows);
+
+	if (distance > k)
+		return 0.0f;
+	result = ((float)1 - ((float)distance / (float)maxlen));
+	return result >= min_similarity ? result : 0.0f;
+}
+
 static PyObject *
 astrcmp(PyObject *self, PyObject *args)
 {
-    PyObject *s1, *s2;
+	PyObject *s1, *s2;
 	float d;
 	const Py_UNICODE *us1, *us2;
 	int len1, len2;
-    PyThreadState *_save;
+	PyThreadState *_save;
 
-    if (!PyArg_ParseTuple(args, "UU", &s1, &s2))
-        return NULL;
+	if (!PyArg_ParseTuple(args, "UU", &s1, &s2))
+		return NULL;
 
 	us1 = PyUnicode_AS_UNICODE(s1);
 	us2 = PyUnicode_AS_UNICODE(s2);
 	len1 = PyUnicode_GetSize(s1);
 	len2 = PyUnicode_GetSize(s2);
 
-    Py_UNBLOCK_THREADS
+	Py_UNBLOCK_THREADS
 	d = LevenshteinDistance(us1, len1, us2, len2);
-    Py_BLOCK_THREADS
-    return Py_BuildValue("f", d);
+	Py_BLOCK_THREADS
+	return Py_BuildValue("f", d);
+}
+
+static PyObject *
+astrcmp_bounded(PyObject *self, PyObject *args)
+{
+	PyObject *s1, *s2;
+	float d;
+	double min_similarity;
+	const Py_UNICODE *us1, *us2;
+	int len1, len2;
+	PyThreadState *_save;
+
+	if (!PyArg_ParseTuple(args, "UUd", &s1, &s2, &min_similarity))
+		return NULL;
+
+	us1 = PyUnicode_AS_UNICODE(s1);
+	us2 = PyUnicode_AS_UNICODE(s2);
+	len1 = PyUnicode_GetSize(s1);
+	len2 = PyUnicode_GetSize(s2);
+
+	Py_UNBLOCK_THREADS
+	d = BoundedLevenshteinDistance(us1, len1, us2, len2, min_similarity);
+	Py_BLOCK_THREADS
+	if (d < 0.0f)
+		return PyErr_NoMemory();
+	return Py_BuildValue("f", d);
+}
+
+typedef struct {
+	int index1, index2;
+	float similarity;
+} Match;
+
+typedef struct {
+	Match *matches;
+	Py_ssize_t count, allocated;
+} MatchList;
+
+static int
+add_match(MatchList *list, int index1, int index2, float similarity)
+{
+	Match *tmp;
+	Py_ssize_t allocated;
+
+	if (list->count == list->allocated)
+	{
+		allocated = list->allocated ? list->allocated * 2 : 64;
+		tmp = realloc(list->matches, sizeof(Match) * allocated);
+		if (tmp == NULL)
+			return 0;
+		list->matches = tmp;
+		list->allocated = allocated;
+	}
+	list->matches[list->count].index1 = index1;
+	list->matches[list->count].index2 = index2;
+	list->matches[list->count].similarity = similarity;
+	list->count++;
+	return 1;
+}
+
+/***
+ * Candidate pairs for a minimum similarity are found with an inverted index
+ * of q-grams (substrings of length q) instead of comparing all pairs.
+ *
+ * A pair with edit distance d, the longer string having maxlen characters,
+ * shares at least maxlen - q + 1 - (q + 1) * d q-grams: substitutions,
+ * insertions and deletions destroy at most q q-grams, transpositions q + 1.
+ * Pairs that share fewer q-grams or whose length difference alone is above
+ * the maximum distance can't reach the minimum similarity and are skipped.
+ * Pairs of strings too short for this bound are always compared.
+ ***/
+
+#define QGRAM_SIZE 2
+#define MIN_COMMON_QGRAMS(maxlen, k) ((maxlen) - QGRAM_SIZE + 1 - (QGRAM_SIZE + 1) * (k))
+
+typedef struct {
+	unsigned PY_LONG_LONG qgram;
+	int length;
+	int index;
+	int count;
+} QGram;
+
+static int
+compare_qgrams(const void *a, const void *b)
+{
+	const QGram *qa = a, *qb = b;
+
+	if (qa->qgram != qb->qgram)
+		return qa->qgram < qb->qgram ? -1 : 1;
+	if (qa->length != qb->length)
+		return qa->length - qb->length;
+	return qa->index - qb->index;
+}
+
+static int
+compare_ints(const void *a, const void *b)
+{
+	return *(const int *)a - *(const int *)b;
+}
+
+/* Store the distinct q-grams of s with their number of occurrences in
+   qgrams, which must have room for len - 1 entries. Returns the number of
+   distinct q-grams. */
+static int
+get_qgrams(const Py_UNICODE *s, int len, int index, QGram *qgrams)
+{
+	int i, n = 0;
+
+	if (len < QGRAM_SIZE)
+		return 0;
+	for (i = 0; i <= len - QGRAM_SIZE; i++)
+	{
+		qgrams[i].qgram = ((unsigned PY_LONG_LONG)s[i] << 32) | (unsigned PY_LONG_LONG)s[i + 1];
+		qgrams[i].length = len;
+		qgrams[i].index = index;
+		qgrams[i].count = 1;
+	}
+	qsort(qgrams, len - QGRAM_SIZE + 1, sizeof(QGram), compare_qgrams);
+	for (i = 1; i <= len - QGRAM_SIZE; i++)
+	{
+		if (qgrams[i].qgram == qgrams[n].qgram)
+			qgrams[n].count++;
+		else
+			qgrams[++n] = qgrams[i];
+	}
+	return n + 1;
+}
+
+/* Largest edit distance at which a pair whose longer string has maxlen
+   characters can still reach min_similarity, with room for rounding */
+static int
+max_distance(int maxlen, double min_similarity)
+{
+	int k = (int)((1.0 - min_similarity + 1e-6) * maxlen);
+	return MIN(k, maxlen);
+}
+
+/* First entry of the sorted index not less than (qgram, length) */
+static int
+find_qgram(const QGram *qgrams, int size, unsigned PY_LONG_LONG qgram, int length)
+{
+	int lo = 0, hi = size, mid;
+
+	while (lo < hi)
+	{
+		mid = lo + (hi - lo) / 2;
+		if (qgrams[mid].qgram < qgram ||
+		    (qgrams[mid].qgram == qgram && qgrams[mid].length < length))
+			lo = mid + 1;
+		else
+			hi = mid;
+	}
+	return lo;
+}
+
+/***
+ * Compare the strings of a to the strings of b (to the following strings of
+ * a if self_join is set), only looking at the candidates from the q-gram
+ * index. Returns 0 if out of memory.
+ ***/
+static int
+match_indexed(const Py_UNICODE **strings_a, const int *lengths_a, int len_a,
+              const Py_UNICODE **strings_b, const int *lengths_b, int len_b,
+              int self_join, double min_similarity, MatchList *result)
+{
+	QGram *index = NULL, *query = NULL;
+	int *common = NULL, *touched = NULL, *candidates = NULL;
+	int *by_length = NULL, *length_start = NULL;
+	int i, j, g, e, n, len, maxlen, k, ok = 0;
+	int index_size = 0, max_len_a = 1, max_len_b = 0, num_touched, num_candidates;
+	Py_ssize_t total = 0;
+	float d;
+
+	for (j = 0; j < len_b; j++)
+	{
+		max_len_b = MAX(max_len_b, lengths_b[j]);
+		total += MAX(0, lengths_b[j] - QGRAM_SIZE + 1);
+	}
+	for (i = 0; i < len_a; i++)
+		max_len_a = MAX(max_len_a, lengths_a[i]);
+
+	index = malloc(sizeof(QGram) * (total + 1));
+	query = malloc(sizeof(QGram) * max_len_a);
+	common = calloc(len_b + 1, sizeof(int));
+	touched = malloc(sizeof(int) * (len_b + 1));
+	candidates = malloc(sizeof(int) * (len_b + 1));
+	by_length = malloc(sizeof(int) * (len_b + 1));
+	length_start = calloc(max_len_b + 2, sizeof(int));
+	if (index == NULL || query == NULL || common == NULL || touched == NULL ||
+	    candidates == NULL || by_length == NULL || length_start == NULL)
+		goto done;
+
+	for (j = 0; j < len_b; j++)
+		index_size += get_qgrams(strings_b[j], lengths_b[j], j, index + index_size);
+	qsort(index, index_size, sizeof(QGram), compare_qgrams);
+
+	/* Strings of b by length, the ones of length len are
+	   by_length[length_start[len]] to by_length[length_start[len + 1] - 1] */
+	for (j = 0; j < len_b; j++)
+		length_start[lengths_b[j] + 1]++;
+	for (len = 1; len <= max_len_b + 1; len++)
+		length_start[len] += length_start[len - 1];
+	for (j = 0; j < len_b; j++)
+		by_length[length_start[lengths_b[j]]++] = j;
+	for (len = max_len_b + 1; len > 0; len--)
+		length_start[len] = length_start[len - 1];
+	length_start[0] = 0;
+
+	for (i = 0; i < len_a; i++)
+	{
+		int len1 = lengths_a[i];
+		int first = self_join ? i + 1 : 0;
+		int min_len, max_len;
+
+		/* Lengths within the maximum distance */
+		min_len = len1 - max_distance(len1, min_similarity);
+		for (max_len = len1; max_len < max_len_b; max_len++)
+		{
+			if (max_len + 1 - len1 > max_distance(max_len + 1, min_similarity))
+				break;
+		}
+
+		/* Count the shared q-grams */
+		num_touched = 0;
+		n = get_qgrams(strings_a[i], len1, i, query);
+		for (g = 0; g < n; g++)
+		{
+			for (e = find_qgram(index, index_size, query[g].qgram, min_len);
+			     e < index_size && index[e].qgram == query[g].qgram &&
+			     index[e].length <= max_len; e++)
+			{
+				j = index[e].index;
+				if (j < first)
+					continue;
+				if (common[j] == 0)
+					touched[num_touched++] = j;
+				common[j] += MIN(query[g].count, index[e].count);
+			}
+		}
+
+		num_candidates = 0;
+		for (e = 0; e < num_touched; e++)
+		{
+			j = touched[e];
+			maxlen = MAX(len1, lengths_b[j]);
+			k = max_distance(maxlen, min_similarity);
+			if (MIN_COMMON_QGRAMS(maxlen, k) > 0 && common[j] >= MIN_COMMON_QGRAMS(maxlen, k))
+				candidates[num_candidates++] = j;
+			common[j] = 0;
+		}
+
+		/* Lengths for which the count filter doesn't work */
+		for (len = MAX(0, min_len); len <= MIN(max_len, max_len_b); len++)
+		{
+			maxlen = MAX(len1, len);
+			k = max_distance(maxlen, min_similarity);
+			if (MIN_COMMON_QGRAMS(maxlen, k) > 0)
+				continue;
+			for (e = length_start[len]; e < length_start[len + 1]; e++)
+			{
+				if (by_length[e] >= first)
+					candidates[num_candidates++] = by_length[e];
+			}
+		}
+
+		qsort(candidates, num_candidates, sizeof(int), compare_ints);
+		for (e = 0; e < num_candidates; e++)
+		{
+			j = candidates[e];
+			d = BoundedLevenshteinDistance(strings_a[i], len1,
+			                               strings_b[j], lengths_b[j],
+			                               min_similarity);
+			if (d < 0.0f)
+				goto done;
+			if (d >= min_similarity && !add_match(result, i, j, d))
+				goto done;
+		}
+	}
+	ok = 1;
+
+done:
+	free(index);
+	free(query);
+	free(common);
+	free(touched);
+	free(candidates);
+	free(by_length);
+	free(length_start);
+	return ok;
+}
+
+/* Compare all pairs, returns 0 if out of memory */
+static int
+match_all(const Py_UNICODE **strings_a, const int *lengths_a, int len_a,
+          const Py_UNICODE **strings_b, const int *lengths_b, int len_b,
+          int self_join, double min_similarity, MatchList *result)
+{
+	int i, j;
+	float d;
+
+	for (i = 0; i < len_a; i++)
+	{
+		for (j = self_join ? i + 1 : 0; j < len_b; j++)
+		{
+			d = BoundedLevenshteinDistance(strings_a[i], lengths_a[i],
+			                               strings_b[j], lengths_b[j],
+			                               min_similarity);
+			if (d < 0.0f)
+				return 0;
+			if (d >= min_similarity && !add_match(result, i, j, d))
+				return 0;
+		}
+	}
+	return 1;
+}
+
+/***
+ * Compare every string of list_a to every string of list_b (or every pair
+ * i < j of list_a if list_b is None) and return a list of
+ * (index1, index2, similarity) tuples for the pairs with a similarity of
+ * at least min_similarity. The strings are compared without the GIL.
+ ***/
+
+static PyObject *
+astrcmp_matrix(PyObject *self, PyObject *args)
+{
+	PyObject *list_a, *list_b = Py_None, *seq_a = NULL, *seq_b = NULL;
+	PyObject *result = NULL, *item;
+	double min_similarity = 0.0;
+	const Py_UNICODE **strings = NULL;
+	int *lengths = NULL;
+	MatchList matches = {NULL, 0, 0};
+	Py_ssize_t len_a, len_b, i, offset;
+	int self_join, ok;
+	PyThreadState *_save;
+
+	if (!PyArg_ParseTuple(args, "O|Od", &list_a, &list_b, &min_similarity))
+		return NULL;
+	self_join = (list_b == Py_None);
+
+	/* Copies, the lists could be modified while the GIL is released */
+	seq_a = PySequence_Tuple(list_a);
+	if (seq_a == NULL)
+		goto done;
+	if (self_join)
+	{
+		Py_INCREF(seq_a);
+		seq_b = seq_a;
+	}
+	else
+	{
+		seq_b = PySequence_Tuple(list_b);
+		if (seq_b == NULL)
+			goto done;
+	}
+	len_a = PyTuple_GET_SIZE(seq_a);
+	len_b = PyTuple_GET_SIZE(seq_b);
+	/* Only compare the following strings if no second list was given,
+	   the same sequence passed twice still gets all pairs */
+	offset = self_join ? 0 : len_a;
+	if (len_a > INT_MAX / 2 || len_b > INT_MAX / 2)
+	{
+		PyErr_SetString(PyExc_OverflowError, "too many strings");
+		goto done;
+	}
+
+	strings = malloc(sizeof(Py_UNICODE *) * (len_a + len_b + 1));
+	lengths = malloc(sizeof(int) * (len_a + len_b + 1));
+	if (strings == NULL || lengths == NULL)
+	{
+		PyErr_NoMemory();
+		goto done;
+	}
+	for (i = 0; i < len_a + (self_join ? 0 : len_b); i++)
+	{
+		item = (i < len_a) ? PyTuple_GET_ITEM(seq_a, i) : PyTuple_GET_ITEM(seq_b, i - len_a);
+		if (!PyUnicode_Check(item))
+		{
+			PyErr_SetString(PyExc_TypeError, "similarity_matrix() requires unicode strings");
+			goto done;
+		}
+		strings[i] = PyUnicode_AS_UNICODE(item);
+		lengths[i] = PyUnicode_GET_SIZE(item);
+	}
+
+	Py_UNBLOCK_THREADS
+	if (min_similarity > 0.0)
+		ok = match_indexed(strings, lengths, len_a, strings + offset, lengths + offset,
+		                   len_b, self_join, min_similarity, &matches);
+	else
+		ok = match_all(strings, lengths, len_a, strings + offset, lengths + offset,
+		               len_b, self_join, min_similarity, &matches);
+	Py_BLOCK_THREADS
+
+	if (!ok)
+	{
+		PyErr_NoMemory();
+		goto done;
+	}
+
+	result = PyList_New(matches.count);
+	if (result == NULL)
+		goto done;
+	for (i = 0; i < matches.count; i++)
+	{
+		item = Py_BuildValue("(iif)", matches.matches[i].index1, matches.matches[i].index2,
+		                     matches.matches[i].similarity);
+		if (item == NULL)
+		{
+			Py_CLEAR(result);
+			goto done;
+		}
+		PyList_SET_ITEM(result, i, item);
+	}
+
+done:
+	free(matches.matches);
+	free(strings);
+	free(lengths);
+	Py_XDECREF(seq_a);
+	Py_XDECREF(seq_b);
+	return result;
 }
 
 static PyMethodDef AstrcmpMethods[] = {
     {"astrcmp", astrcmp, METH_VARARGS, "Compute Levenshtein distance"},
+    {"astrcmp_bounded", astrcmp_bounded, METH_VARARGS,
+     "Compute Levenshtein distance, results below the given minimum similarity are returned as 0.0"},
+    {"astrcmp_matrix", astrcmp_matrix, METH_VARARGS,
+     "Compute Levenshtein distances of all pairs, returns the (index1, index2, similarity) tuples of at least the given minimum similarity"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Handles for the image data in `Metadata.images`.
+
+Images are identified by the SHA-1 digest of their bytes, handles of the
+same bytes are equal no matter where the bytes are kept.
+"""
+
+import hashlib
+import threading
+import weakref
+
+
+class ImageHandle(object):
+    """Base class of the image handles."""
+
+    __slots__ = ('sha1', 'size')
+
+    def __init__(self, sha1, size):
+        self.sha1 = sha1
+        self.size = size
+
+    def read(self):
+        """Return the bytes of the image."""
+        raise NotImplementedError
+
+    def matches(self, data):
+        return len(data) == self.size and hashlib.sha1(data).hexdigest() == self.sha1
+
+    def __len__(self):
+        return self.size
+
+    def __eq__(self, other):
+        if isinstance(other, ImageHandle):
+            return self.size == other.size and self.sha1 == other.sha1
+        if isinstance(other, str):
+            return self.matches(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self.sha1)
+
+
+class StoredImage(ImageHandle):
+    """Image held in memory by an `ImageStore`."""
+
+    __slots__ = ('_data', '__weakref__')
+
+    def __init__(self, sha1, data):
+        ImageHandle.__init__(self, sha1, len(data))
+        self._data = data
+
+    def read(self):
+        return self._data
+
+    def __repr__(self):
+        return '<StoredImage %s, %d bytes>' % (self.sha1, self.size)
+
+
+class ImageStore(object):
+    """
+    Process-wide store of image bytes by SHA-1 digest.
+
+    Adding the same bytes again returns the handle already in the store, so
+    an image is kept in memory only once however many metadata objects refer
+    to it. Entries are dropped as soon as no handle to them is left.
+    """
+
+    def __init__(self):
+        self._images = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def add(self, data):
+        """Return the handle for the image bytes `data`."""
+        if isinstance(data, ImageHandle):
+            return data
+        sha1 = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            image = self._images.get(sha1)
+            if image is None:
+                image = self._images[sha1] = StoredImage(sha1, data)
+            return image
+
+    def __len__(self):
+        return len(self._images)
+
+    def size(self):
+        """Total size of the images in the store in bytes."""
+        return sum(image.size for image in self._images.values())
+
+
+image_store = ImageStore()
+
+
+class ImageRef(ImageHandle):
+    """
+    Image embedded in a file, whose bytes are only read when needed.
+
+    Records the file and the position of the image among the images of the
+    file besides the digest and size. `reader` is called with the reference
+    and returns the bytes or None, they are verified against the digest
+    before they are used.
+    """
+
+    __slots__ = ('filename', 'index', '_reader', '_data')
+
+    def __init__(self, filename, index, sha1, size, reader, data=None):
+        ImageHandle.__init__(self, sha1, size)
+        self.filename = filename
+        self.index = index
+        self._reader = reader
+        self._data = data
+
+    @classmethod
+    def from_data(cls, filename, index, data, reader):
+        """Reference the image `data`, which stays pinned until `unpin`."""
+        if isinstance(data, ImageHandle):
+            return cls(filename, index, data.sha1, data.size, reader, data.read())
+        return cls(filename, index, hashlib.sha1(data).hexdigest(), len(data),
+                   reader, data)
+
+    def read(self):
+        """Return the bytes of the image, raises IOError if they are gone."""
+        data = self._data
+        if data is not None:
+            return data
+        data = self._reader(self)
+        if data is None or not self.matches(data):
+            raise IOError("Image %d of %r has changed" % (self.index, self.filename))
+        return data
+
+    def pin(self):
+        """Keep the bytes in memory, e.g. while the file is rewritten."""
+        if self._data is None:
+            self._data = self.read()
+
+    def unpin(self):
+        self._data = None
+
+    @property
+    def pinned(self):
+        return self._data is not None
+
+    def __repr__(self):
+        return '<ImageRef %d of %r, %d bytes>' % (self.index, self.filename, self.size)
+
+
+def image_data(image):
+    """Return the bytes of the image dict `image`."""
+    data = image["data"]
+    if isinstance(data, ImageHandle):
+        return data.read()
+    return data
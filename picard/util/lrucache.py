@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+from collections import namedtuple
+from threading import Lock
+
+
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+
+# Fields of the entries of the linked list
+PREV, NEXT, KEY, VALUE = 0, 1, 2, 3
+
+
+class LRUCache(object):
+    """
+    Mapping that holds at most `maxsize` items and evicts the least
+    recently used item first. Safe to use from several threads.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._entries = {}
+        # Circular doubly linked list, most recently used entry first
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                raise KeyError(key)
+            self.hits += 1
+            self._move_to_front(entry)
+            return entry[VALUE]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._move_to_front(entry)
+            return entry[VALUE]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[VALUE] = value
+                self._move_to_front(entry)
+                return
+            root = self._root
+            first = root[NEXT]
+            entry = [root, first, key, value]
+            first[PREV] = root[NEXT] = entry
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                last = root[PREV]
+                last[PREV][NEXT] = root
+                root[PREV] = last[PREV]
+                del self._entries[last[KEY]]
+
+    def __delitem__(self, key):
+        with self._lock:
+            entry = self._entries.pop(key)
+            entry[PREV][NEXT] = entry[NEXT]
+            entry[NEXT][PREV] = entry[PREV]
+
+    def info(self):
+        """Return the hit and miss counts and the size of the cache."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            root = self._root
+            root[:] = [root, root, None, None]
+            self.hits = self.misses = 0
+
+    def _move_to_front(self, entry):
+        root = self._root
+        if root[NEXT] is entry:
+            return
+        entry[PREV][NEXT] = entry[NEXT]
+        entry[NEXT][PREV] = entry[PREV]
+        first = root[NEXT]
+        entry[PREV] = root
+        entry[NEXT] = first
+        first[PREV] = root[NEXT] = entry
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Locks for the files and directories touched while saving files.
+
+Files are saved from several threads at once, only operations on the same
+path have to wait for each other. To avoid deadlocks, locks are taken in
+this order: the file being saved, then the directories, then the tree lock.
+"""
+
+import os.path
+import threading
+from contextlib import contextmanager
+from picard.util import decode_filename
+
+
+class PathLocks(object):
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        # Lock and number of users by path, dropped when unused
+        self._locks = {}
+        # Serializes creating and removing directories, which affects the
+        # parents of the directories involved as well
+        self.tree = threading.RLock()
+
+    @staticmethod
+    def make_key(path):
+        return os.path.normcase(os.path.abspath(decode_filename(path)))
+
+    @contextmanager
+    def locked(self, *paths):
+        """Hold the locks of all `paths` for the duration of the block."""
+        # A fixed order prevents deadlocks between threads locking the same paths
+        keys = sorted(set(self.make_key(path) for path in paths))
+        entries = []
+        with self._mutex:
+            for key in keys:
+                entry = self._locks.get(key)
+                if entry is None:
+                    entry = self._locks[key] = [threading.RLock(), 0]
+                entry[1] += 1
+                entries.append(entry)
+        acquired = []
+        try:
+            for entry in entries:
+                entry[0].acquire()
+                acquired.append(entry)
+            yield
+        finally:
+            for entry in reversed(acquired):
+                entry[0].release()
+            with self._mutex:
+                for key, entry in zip(keys, entries):
+                    entry[1] -= 1
+                    if not entry[1]:
+                        del self._locks[key]
+
+    def makedirs(self, path):
+        """Create the directory `path` and its parents if they don't exist."""
+        with self.tree:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def __len__(self):
+        return len(self._locks)
+
+
+path_locks = PathLocks()
@@ -27,18 +27,28 @@ import sys
 import re
 import time
 import os.path
+import traceback
 from collections import deque, defaultdict
 from functools import partial
+from xml.parsers import expat
 from PyQt4 import QtCore, QtNetwork
 from PyQt4.QtGui import QDesktopServices
-from PyQt4.QtCore import QUrl, QXmlStreamReader
+from PyQt4.QtCore import QUrl
 from picard import PICARD_VERSION_STR, config, log
 from picard.const import ACOUSTID_KEY, ACOUSTID_HOST
+from picard.ratecontrol import TokenBucket, parse_retry_after
+from picard.serverpool import ServerPool, parse_servers
+from picard.webservicecache import ResponseCache
 
 
+# Average delay between two requests to a host in milliseconds
 REQUEST_DELAY = defaultdict(lambda: 1000)
 REQUEST_DELAY[(ACOUSTID_HOST, 80)] = 333
 REQUEST_DELAY[("coverartarchive.org", 80)] = 0
+# Number of requests that can be started at once after an idle period
+REQUEST_BURST = defaultdict(lambda: 1)
+# Maximum number of requests running at the same time, 0 means unlimited
+REQUEST_CONCURRENCY = defaultdict(lambda: 6)
 USER_AGENT_STRING = 'MusicBrainz%%20Picard-%s' % PICARD_VERSION_STR
 
 
@@ -52,65 +62,156 @@ def _wrap_xml_metadata(data):
 
 
 class XmlNode(object):
+    """A node of a parsed XML document.
+
+    Child elements are available as lists in `children` and attributes in
+    `attribs`, both can also be accessed as attributes of the node. Nodes
+    are kept small because whole release documents stay in memory while
+    albums are loading: the dicts are only created when they are needed.
+    """
+
+    __slots__ = ('text', '_children', '_attribs')
 
     def __init__(self):
         self.text = u''
-        self.children = {}
-        self.attribs = {}
+        self._children = None
+        self._attribs = None
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = {}
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+    @property
+    def attribs(self):
+        if self._attribs is None:
+            self._attribs = {}
+        return self._attribs
+
+    @attribs.setter
+    def attribs(self, attribs):
+        self._attribs = attribs
 
     def __repr__(self):
-        return repr(self.__dict__)
+        return repr({'text': self.text, 'children': self.children, 'attribs': self.attribs})
 
     def append_child(self, name, node=None):
         if node is None:
             node = XmlNode()
-        self.children.setdefault(name, []).append(node)
+        if self._children is None:
+            self._children = {name: [node]}
+        else:
+            self._children.setdefault(name, []).append(node)
         return node
 
     def __getattr__(self, name):
-        try:
-            return self.children[name]
-        except KeyError:
-            try:
-                return self.attribs[name]
-            except KeyError:
-                raise AttributeError(name)
+        # Only called if there is no slot or property with that name
+        if name[:1] != '_':
+            children = self._children
+            if children is not None and name in children:
+                return children[name]
+            attribs = self._attribs
+            if attribs is not None and name in attribs:
+                return attribs[name]
+        raise AttributeError(name)
 
 
 _node_name_re = re.compile('[^a-zA-Z0-9]')
+_node_names = {}
 
 
 def _node_name(n):
-    return _node_name_re.sub('_', unicode(n))
-
-
-def _read_xml(stream):
-    document = XmlNode()
-    current_node = document
-    path = []
-
-    while not stream.atEnd():
-        stream.readNext()
-
-        if stream.isStartElement():
-            node = XmlNode()
-            attrs = stream.attributes()
+    try:
+        return _node_names[n]
+    except KeyError:
+        # Drop the namespace, expat reports names as "uri localname". The
+        # result is plain ASCII, so it can be interned and shared by all
+        # nodes.
+        name = intern(str(_node_name_re.sub('_', unicode(n).rpartition(' ')[2])))
+        _node_names[n] = name
+        return name
+
+
+class XmlTreeBuilder(object):
+    """Build a tree of XmlNode objects from XML data.
+
+    The data can be fed in chunks as it arrives from the network, the tree
+    is returned by close(). Malformed data is logged and results in the
+    tree parsed up to the error.
+
+    Attribute values and short texts repeat a lot in web service replies
+    (types, positions, language codes, ...), a single copy of each is kept
+    per document.
+    """
 
-            for i in xrange(attrs.count()):
-                attr = attrs.at(i)
-                node.attribs[_node_name(attr.name())] = unicode(attr.value())
+    def __init__(self):
+        self.document = XmlNode()
+        self._nodes = [self.document]
+        self._texts = [[]]
+        self._values = {}
+        self._failed = False
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.buffer_text = True
+        parser.StartElementHandler = self._start_element
+        parser.EndElementHandler = self._end_element
+        parser.CharacterDataHandler = self._characters
+        self._parser = parser
+
+    def _start_element(self, name, attrs):
+        node = XmlNode()
+        if attrs:
+            values = self._values
+            node.attribs = dict((_node_name(attr), values.setdefault(value, value))
+                                for attr, value in attrs.iteritems())
+        self._nodes[-1].append_child(_node_name(name), node)
+        self._nodes.append(node)
+        self._texts.append([])
+
+    def _end_element(self, name):
+        node = self._nodes.pop()
+        text = self._texts.pop()
+        if text:
+            text = u''.join(text)
+            if len(text) <= 32:
+                text = self._values.setdefault(text, text)
+            node.text = text
+
+    def _characters(self, data):
+        self._texts[-1].append(data)
+
+    def _parse(self, data, final):
+        if self._failed:
+            return
+        try:
+            self._parser.Parse(data, final)
+        except expat.ExpatError as e:
+            log.error("Error parsing XML: %s", e)
+            self._failed = True
 
-            current_node.append_child(_node_name(stream.name()), node)
-            path.append(current_node)
-            current_node = node
+    def feed(self, data):
+        self._parse(data, False)
 
-        elif stream.isEndElement():
-            current_node = path.pop()
+    def close(self):
+        self._parse('', True)
+        # Only left over if the document was incomplete
+        while len(self._nodes) > 1:
+            self._end_element(None)
+        text = self._texts[0]
+        if text:
+            self.document.text = u''.join(text)
+        self._parser = None
+        return self.document
 
-        elif stream.isCharacters():
-            current_node.text += unicode(stream.text())
 
-    return document
+def _read_xml(data):
+    builder = XmlTreeBuilder()
+    builder.feed(data)
+    return builder.close()
 
 
 class XmlWebService(QtCore.QObject):
@@ -119,14 +220,27 @@ class XmlWebService(QtCore.QObject):
       - authentication_required
     """
 
+    options = [
+        config.BoolOption("setting", "ws_cache_enabled", True),
+        config.IntOption("setting", "ws_cache_size_in_mb", 100),
+        config.IntOption("setting", "ws_cache_max_age", 7 * 24 * 60 * 60),
+        config.TextOption("setting", "server_pool", ""),
+        config.TextOption("setting", "server_pool_routing", "round-robin"),
+        config.IntOption("setting", "server_pool_request_delay", 1000),
+        config.IntOption("setting", "server_pool_max_requests", 6),
+    ]
+
     def __init__(self, parent=None):
         QtCore.QObject.__init__(self, parent)
         self.manager = QtNetwork.QNetworkAccessManager()
         self.set_cache()
         self.setup_proxy()
         self.manager.finished.connect(self._process_reply)
-        self._last_request_times = {}
+        self._rate_limiters = {}
+        self._server_pool = None
+        self._server_pool_config = None
         self._active_requests = {}
+        self._xml_builders = {}
         self._high_priority_queues = {}
         self._low_priority_queues = {}
         self._hosts = []
@@ -141,6 +255,16 @@ class XmlWebService(QtCore.QObject):
         }
         self.num_pending_web_requests = 0
         self.num_active_requests = 0
+        # Coalesced GET requests by their key and the keys by task
+        self._pending_gets = {}
+        self._get_waiters = {}
+        self._cached_replies = deque()
+        self._cache_timer = QtCore.QTimer(self)
+        self._cache_timer.setSingleShot(True)
+        self._cache_timer.timeout.connect(self._run_cached_replies)
+        self.response_cache = None
+        if config.setting["ws_cache_enabled"]:
+            self.setup_response_cache()
 
     def set_cache(self, cache_size_in_mb=100):
         cache = QtNetwork.QNetworkDiskCache()
@@ -152,6 +276,20 @@ class XmlWebService(QtCore.QObject):
         log.debug("NetworkDiskCache size: %s / %s", cache.cacheSize(),
                        cache.maximumCacheSize())
 
+    def setup_response_cache(self):
+        location = QDesktopServices.storageLocation(QDesktopServices.CacheLocation)
+        filename = os.path.join(unicode(location), u'ws_cache.sqlite')
+        try:
+            self.response_cache = ResponseCache(
+                filename,
+                max_size=config.setting["ws_cache_size_in_mb"] * 1024 * 1024,
+                max_age=config.setting["ws_cache_max_age"])
+        except Exception as e:
+            log.error("Unable to open web service response cache %s: %s", filename, e)
+            self.response_cache = None
+        else:
+            log.debug("Response cache: %s", filename)
+
     def setup_proxy(self):
         proxy = QtNetwork.QNetworkProxy()
         if config.setting["use_proxy"]:
@@ -163,7 +301,7 @@ class XmlWebService(QtCore.QObject):
         self.manager.setProxy(proxy)
 
     def _start_request(self, method, host, port, path, data, handler, xml,
-                       mblogin=False, cacheloadcontrol=None):
+                       mblogin=False, cacheloadcontrol=None, cachekey=None):
         log.debug("%s http://%s:%d%s", method, host, port, path)
         url = QUrl.fromEncoded("http://%s:%d%s" % (host, port, path))
         if mblogin:
@@ -181,9 +319,11 @@ class XmlWebService(QtCore.QObject):
                 request.setHeader(QtNetwork.QNetworkRequest.ContentTypeHeader, "application/x-www-form-urlencoded")
         send = self._request_methods[method]
         reply = send(request, data) if data is not None else send(request)
-        key = (host, port)
-        self._last_request_times[key] = time.time()
-        self._active_requests[reply] = (request, handler, xml)
+        self._active_requests[reply] = (request, handler, xml, cachekey, (host, port))
+        if xml:
+            # Parse the XML while it arrives instead of all at once at the end
+            self._xml_builders[reply] = (XmlTreeBuilder(), [] if cachekey is not None else None)
+            reply.readyRead.connect(partial(self._read_reply_data, reply))
         self.num_active_requests += 1
         return True
 
@@ -197,13 +337,26 @@ class XmlWebService(QtCore.QObject):
         return leftUrl.port(80) == rightUrl.port(80) and \
             leftUrl.toString(QUrl.RemovePort) == rightUrl.toString(QUrl.RemovePort)
 
+    def _read_reply_data(self, reply):
+        try:
+            builder, chunks = self._xml_builders[reply]
+        except KeyError:
+            return
+        data = str(reply.readAll())
+        if chunks is not None:
+            chunks.append(data)
+        builder.feed(data)
+
     def _process_reply(self, reply):
         self.num_active_requests -= 1
+        self._read_reply_data(reply)
+        builder, chunks = self._xml_builders.pop(reply, (None, None))
         try:
-            request, handler, xml = self._active_requests.pop(reply)
+            request, handler, xml, cachekey, key = self._active_requests.pop(reply)
         except KeyError:
             log.error("Error: Request not found for %s" % str(reply.request().url().toString()))
             return
+        self._release_rate_limiter(key, reply)
         error = int(reply.error())
         redirect = reply.attribute(QtNetwork.QNetworkRequest.RedirectionTargetAttribute).toUrl()
         fromCache = reply.attribute(QtNetwork.QNetworkRequest.SourceIsFromCacheAttribute).toBool()
@@ -245,19 +398,100 @@ class XmlWebService(QtCore.QObject):
                          # retain path, query string and anchors from redirect URL
                          redirect.toString(QUrl.RemoveAuthority | QUrl.RemoveScheme),
                          handler, xml, priority=True, important=True,
-                         cacheloadcontrol=request.attribute(QtNetwork.QNetworkRequest.CacheLoadControlAttribute))
+                         cacheloadcontrol=request.attribute(QtNetwork.QNetworkRequest.CacheLoadControlAttribute),
+                         cachekey=cachekey, refresh=True)
             elif xml:
-                document = _read_xml(QXmlStreamReader(reply))
+                document = builder.close()
+                if chunks is not None and not error:
+                    self._store_response(cachekey, ''.join(chunks))
                 handler(document, reply, error)
             else:
                 handler(str(reply.readAll()), reply, error)
         reply.close()
 
+    def _store_response(self, cachekey, data):
+        if self.response_cache is None:
+            return
+        try:
+            self.response_cache.put(cachekey, data)
+        except Exception as e:
+            log.error("Unable to store response in cache: %s", e)
+
+    def _lookup_response(self, cachekey):
+        if self.response_cache is None:
+            return None
+        try:
+            return self.response_cache.get(cachekey)
+        except Exception as e:
+            log.error("Unable to read response from cache: %s", e)
+            return None
+
+    def _run_cached_replies(self):
+        while self._cached_replies:
+            try:
+                self._cached_replies.popleft()()
+            except:
+                log.error(traceback.format_exc())
+        self.tagger.tagger_stats_changed.emit()
+
+    def _process_cached_reply(self, data, handler):
+        document = _read_xml(data)
+        handler(document, None, 0)
+
     def get(self, host, port, path, handler, xml=True, priority=False,
-            important=False, mblogin=False, cacheloadcontrol=None):
+            important=False, mblogin=False, cacheloadcontrol=None,
+            cachekey=None, refresh=False):
+        if cachekey is not None and xml and not refresh:
+            data = self._lookup_response(cachekey)
+            if data is not None:
+                log.debug("GET http://%s:%d%s (response cache)", host, port, path)
+                func = partial(self._process_cached_reply, data, handler)
+                self._cached_replies.append(func)
+                if not self._cache_timer.isActive():
+                    self._cache_timer.start(0)
+                return (None, func, priority)
+        if not xml:
+            # Downloads are not coalesced
+            func = partial(self._start_request, "GET", host, port, path, None,
+                           handler, xml, mblogin, cacheloadcontrol=cacheloadcontrol,
+                           cachekey=cachekey)
+            return self.add_task(func, host, port, priority, important=important)
+        # Identical requests that are still queued or running are coalesced,
+        # the reply is then dispatched to all of their handlers
+        reqkey = (host, port, path, mblogin, cacheloadcontrol)
+        pending = self._pending_gets.get(reqkey)
+        if pending is not None:
+            task, waiters = pending
+            log.debug("GET http://%s:%d%s is already pending", host, port, path)
+            # A task of its own, to detach only this handler in remove_task
+            token = partial(task[1])
+            waiters.append((token, handler))
+            self._get_waiters[token] = reqkey
+            return (task[0], token, task[2])
+        waiters = []
         func = partial(self._start_request, "GET", host, port, path, None,
-                       handler, xml, mblogin, cacheloadcontrol=cacheloadcontrol)
-        return self.add_task(func, host, port, priority, important=important)
+                       partial(self._coalesced_reply, reqkey, waiters), xml,
+                       mblogin, cacheloadcontrol=cacheloadcontrol,
+                       cachekey=cachekey)
+        task = self.add_task(func, host, port, priority, important=important)
+        waiters.append((func, handler))
+        self._pending_gets[reqkey] = (task, waiters)
+        self._get_waiters[func] = reqkey
+        return task
+
+    def _coalesced_reply(self, reqkey, waiters, document, reply, error):
+        pending = self._pending_gets.get(reqkey)
+        if pending is not None and pending[1] is waiters:
+            del self._pending_gets[reqkey]
+        for token, handler in waiters:
+            self._get_waiters.pop(token, None)
+        for token, handler in waiters:
+            if handler is None:
+                continue
+            try:
+                handler(document, reply, error)
+            except:
+                log.error(traceback.format_exc())
 
     def post(self, host, port, path, data, handler, xml=True, priority=True, important=True, mblogin=True):
         log.debug("POST-DATA %r", data)
@@ -275,29 +509,52 @@ class XmlWebService(QtCore.QObject):
     def stop(self):
         self._high_priority_queues = {}
         self._low_priority_queues = {}
+        self._pending_gets = {}
+        self._get_waiters = {}
+        self._cached_replies.clear()
         for reply in self._active_requests.keys():
             reply.abort()
 
+    def _get_rate_limiter(self, key):
+        try:
+            return self._rate_limiters[key]
+        except KeyError:
+            limiter = TokenBucket(REQUEST_DELAY[key], REQUEST_BURST[key],
+                                  REQUEST_CONCURRENCY[key])
+            self._rate_limiters[key] = limiter
+            return limiter
+
+    def _release_rate_limiter(self, key, reply):
+        status = reply.attribute(QtNetwork.QNetworkRequest.HttpStatusCodeAttribute).toInt()[0]
+        retry_after = None
+        if status in (429, 503):
+            retry_after = parse_retry_after(str(reply.rawHeader("Retry-After")))
+            log.warning("%s:%d is overloaded (HTTP %d), slowing down", key[0], key[1], status)
+        self._get_rate_limiter(key).release(status, retry_after)
+        # A request slot is free again, give queued requests a chance
+        self._timer.start(0)
+
     def _run_next_task(self):
         delay = sys.maxint
+        now = time.time()
         for key in self._hosts:
-            queue = self._high_priority_queues.get(key) or self._low_priority_queues.get(key)
-            if not queue:
-                continue
-            now = time.time()
-            last = self._last_request_times.get(key)
-            request_delay = REQUEST_DELAY[key]
-            last_ms = (now - last) * 1000 if last is not None else request_delay
-            if last_ms >= request_delay:
-                log.debug("Last request to %s was %d ms ago, starting another one", key, last_ms)
-                d = request_delay
-                queue.popleft()()
-                self.num_pending_web_requests -= 1
-            else:
-                d = request_delay - last_ms
-                log.debug("Waiting %d ms before starting another request to %s", d, key)
-            if d < delay:
-                delay = d
+            limiter = self._get_rate_limiter(key)
+            while True:
+                queue = self._high_priority_queues.get(key) or self._low_priority_queues.get(key)
+                if not queue:
+                    break
+                d = limiter.acquire(now)
+                if d == 0:
+                    queue.popleft()()
+                    self.num_pending_web_requests -= 1
+                    continue
+                if d is None:
+                    log.debug("Too many active requests to %s, waiting for one to finish", key)
+                else:
+                    log.debug("Waiting %d ms before starting another request to %s", d, key)
+                    if d < delay:
+                        delay = d
+                break
         self.tagger.tagger_stats_changed.emit()
         if delay < sys.maxint:
             self._timer.start(delay)
@@ -323,6 +580,22 @@ class XmlWebService(QtCore.QObject):
 
     def remove_task(self, task):
         key, func, priority = task
+        if key is None:
+            try:
+                self._cached_replies.remove(func)
+            except ValueError:
+                pass
+            return
+        reqkey = self._get_waiters.pop(func, None)
+        if reqkey is not None:
+            # Detach the handler of a coalesced request
+            queued, waiters = self._pending_gets[reqkey]
+            waiters[:] = [waiter for waiter in waiters if waiter[0] is not func]
+            if waiters:
+                # Other callers are still interested in the reply
+                return
+            del self._pending_gets[reqkey]
+            func = queued[1]
         if priority:
             queue = self._high_priority_queues[key]
         else:
@@ -335,27 +608,113 @@ class XmlWebService(QtCore.QObject):
             self.num_pending_web_requests -= 1
         self.tagger.tagger_stats_changed.emit()
 
-    def _get_by_id(self, entitytype, entityid, handler, inc=[], params=[], priority=False, important=False, mblogin=False):
-        host = config.setting["server_host"]
-        port = config.setting["server_port"]
+    def _get_server_pool(self):
+        """Return the configured server pool or None if there is none."""
+        pool_config = (config.setting["server_pool"],
+                       config.setting["server_pool_routing"],
+                       config.setting["server_pool_request_delay"],
+                       config.setting["server_pool_max_requests"])
+        if pool_config != self._server_pool_config:
+            self._server_pool_config = pool_config
+            text, routing, delay, max_requests = pool_config
+            servers = parse_servers(text)
+            if servers:
+                self._server_pool = ServerPool(servers, routing)
+                for server in servers:
+                    REQUEST_DELAY[server.key] = delay
+                    REQUEST_CONCURRENCY[server.key] = max_requests
+                    self._rate_limiters.pop(server.key, None)
+                log.debug("Using server pool %r (%s)", servers, routing)
+            else:
+                self._server_pool = None
+        return self._server_pool
+
+    def _count_outstanding(self, server):
+        key = server.key
+        count = len(self._high_priority_queues.get(key, ()))
+        count += len(self._low_priority_queues.get(key, ()))
+        limiter = self._rate_limiters.get(key)
+        if limiter is not None:
+            count += limiter.active
+        return count
+
+    def _mb_get(self, path, handler, **kwargs):
+        """Send a GET request to the MusicBrainz server or the server pool."""
+        pool = self._get_server_pool()
+        if pool is None:
+            host = config.setting["server_host"]
+            port = config.setting["server_port"]
+            return self.get(host, port, path, handler, **kwargs)
+        return self._pool_get(pool, path, handler, (), kwargs)
+
+    def _pool_get(self, pool, path, handler, tried, kwargs):
+        server = None
+        # Prefer a server that already handles the same request, so that
+        # identical requests still get coalesced
+        for s in pool.servers:
+            reqkey = (s.host, s.port, path, kwargs.get("mblogin", False),
+                      kwargs.get("cacheloadcontrol"))
+            if reqkey in self._pending_gets:
+                server = s
+                break
+        if server is None:
+            server = pool.choose(self._count_outstanding, exclude=tried)
+        return self.get(server.host, server.port, path,
+                        partial(self._pool_reply, pool, server, path, handler, tried, kwargs),
+                        **kwargs)
+
+    def _pool_reply(self, pool, server, path, handler, tried, kwargs, document, reply, error):
+        if reply is None:
+            # Served from the response cache
+            handler(document, reply, error)
+            return
+        status = reply.attribute(QtNetwork.QNetworkRequest.HttpStatusCodeAttribute).toInt()[0]
+        failed = (error and error != QtNetwork.QNetworkReply.OperationCanceledError
+                  and (status == 0 or status >= 500))
+        if not failed:
+            pool.mark_ok(server)
+            handler(document, reply, error)
+            return
+        pool.mark_failed(server)
+        tried += (server,)
+        if len(tried) < len(pool):
+            log.warning("Request to %s:%d failed, retrying with another server",
+                        server.host, server.port)
+            kwargs = dict(kwargs, priority=True, important=True)
+            self._pool_get(pool, path, handler, tried, kwargs)
+        else:
+            handler(document, reply, error)
+
+    def _cache_key(self, entitytype, entityid=None, inc=(), params=(), mblogin=False):
+        if self.response_cache is None:
+            return None
+        if "user-ratings" in inc:
+            # Would be stale as soon as the user submits a rating
+            return None
+        user = config.setting["username"] if mblogin else None
+        server = u"%s:%d" % (config.setting["server_host"], config.setting["server_port"])
+        return ResponseCache.make_key(entitytype, entityid, inc, params,
+                                      server=server, user=user)
+
+    def _get_by_id(self, entitytype, entityid, handler, inc=[], params=[], priority=False, important=False, mblogin=False, refresh=False):
         path = "/ws/2/%s/%s?inc=%s" % (entitytype, entityid, "+".join(inc))
         if params:
             path += "&" + "&".join(params)
-        return self.get(host, port, path, handler, priority=priority, important=important, mblogin=mblogin)
+        cachekey = self._cache_key(entitytype, entityid, inc, params, mblogin)
+        return self._mb_get(path, handler, priority=priority, important=important, mblogin=mblogin,
+                            cachekey=cachekey, refresh=refresh)
 
-    def get_release_by_id(self, releaseid, handler, inc=[], priority=True, important=False, mblogin=False):
-        return self._get_by_id('release', releaseid, handler, inc, priority=priority, important=important, mblogin=mblogin)
+    def get_release_by_id(self, releaseid, handler, inc=[], priority=True, important=False, mblogin=False, refresh=False):
+        return self._get_by_id('release', releaseid, handler, inc, priority=priority, important=important, mblogin=mblogin, refresh=refresh)
 
-    def get_track_by_id(self, trackid, handler, inc=[], priority=True, important=False, mblogin=False):
-        return self._get_by_id('recording', trackid, handler, inc, priority=priority, important=important, mblogin=mblogin)
+    def get_track_by_id(self, trackid, handler, inc=[], priority=True, important=False, mblogin=False, refresh=False):
+        return self._get_by_id('recording', trackid, handler, inc, priority=priority, important=important, mblogin=mblogin, refresh=refresh)
 
     def lookup_discid(self, discid, handler, priority=True, important=True):
         inc = ['artist-credits', 'labels']
         return self._get_by_id('discid', discid, handler, inc, params=["cdstubs=no"], priority=priority, important=important)
 
     def _find(self, entitytype, handler, kwargs):
-        host = config.setting["server_host"]
-        port = config.setting["server_port"]
         filters = []
         query = []
         for name, value in kwargs.items():
@@ -372,7 +731,8 @@ class XmlWebService(QtCore.QObject):
             value = str(QUrl.toPercentEncoding(QtCore.QString(value)))
             params.append('%s=%s' % (str(name), value))
         path = "/ws/2/%s/?%s" % (entitytype, "&".join(params))
-        return self.get(host, port, path, handler)
+        cachekey = self._cache_key(entitytype, params=params)
+        return self._mb_get(path, handler, cachekey=cachekey)
 
     def find_releases(self, handler, **kwargs):
         return self._find('release', handler, kwargs)
@@ -381,11 +741,9 @@ class XmlWebService(QtCore.QObject):
         return self._find('recording', handler, kwargs)
 
     def _browse(self, entitytype, handler, kwargs, inc=[], priority=False, important=False):
-        host = config.setting["server_host"]
-        port = config.setting["server_port"]
         params = "&".join(["%s=%s" % (k, v) for k, v in kwargs.items()])
         path = "/ws/2/%s?%s&inc=%s" % (entitytype, params, "+".join(inc))
-        return self.get(host, port, path, handler, priority=priority, important=important)
+        return self._mb_get(path, handler, priority=priority, important=important)
 
     def browse_releases(self, handler, priority=True, important=True, **kwargs):
         inc = ["media", "labels"]
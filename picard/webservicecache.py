@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+#
+# Picard, the next-generation MusicBrainz tagger
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""
+Persistent cache for MusicBrainz web service responses.
+
+Unlike QNetworkDiskCache, which caches raw HTTP responses and honours the
+server's cache headers, this cache is keyed by what was asked for (entity
+type, MBID, the set of includes and extra parameters) and keeps responses
+for a configurable time, so reloading an album does not have to touch the
+network at all.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+import zlib
+from picard import log
+
+
+class ResponseCache(object):
+
+    def __init__(self, filename, max_size=100 * 1024 * 1024, max_age=7 * 24 * 60 * 60):
+        self.filename = filename
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        try:
+            self._connect()
+        except sqlite3.DatabaseError as e:
+            # The cache is disposable, start from scratch if it got corrupted
+            log.warning("Response cache %s is unusable (%s), recreating it", filename, e)
+            if os.path.exists(filename):
+                os.remove(filename)
+            self._connect()
+
+    def _connect(self):
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._db = sqlite3.connect(self.filename)
+        self._db.text_factory = str
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS response (
+            key TEXT PRIMARY KEY,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS response_accessed ON response (accessed)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM response").fetchone()[0]
+
+    @staticmethod
+    def make_key(entitytype, entityid=None, inc=(), params=(), server=None, user=None):
+        """Build a cache key for a request.
+
+        The includes and parameters are normalized (deduplicated and sorted),
+        so requests asking for the same data in a different order share an
+        entry. The user name is part of the key for authenticated requests,
+        because those contain user specific data like ratings and tags.
+        """
+        parts = [
+            u"server=%s" % (server or u""),
+            u"entity=%s" % entitytype,
+            u"id=%s" % (entityid or u""),
+            u"inc=%s" % u"+".join(sorted(set(inc))),
+            u"params=%s" % u"&".join(sorted(set(params))),
+            u"user=%s" % (user or u""),
+        ]
+        return hashlib.sha1(u"\n".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Return the cached response data for `key` or None."""
+        row = self._db.execute("SELECT created, data FROM response WHERE key = ?",
+                               (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[0] > self.max_age:
+            self.misses += 1
+            return None
+        self._db.execute("UPDATE response SET accessed = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        self.hits += 1
+        return zlib.decompress(str(row[1]))
+
+    def put(self, key, data):
+        """Store the response data for `key`, evicting old entries if needed."""
+        compressed = zlib.compress(data)
+        size = len(compressed)
+        if size > self.max_size:
+            return
+        now = time.time()
+        self.remove(key, commit=False)
+        self._db.execute("INSERT INTO response (key, created, accessed, size, data) VALUES (?, ?, ?, ?, ?)",
+                         (key, now, now, size, sqlite3.Binary(compressed)))
+        self._size += size
+        if self._size > self.max_size:
+            self._evict(now)
+        self._db.commit()
+
+    def remove(self, key, commit=True):
+        row = self._db.execute("SELECT size FROM response WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM response WHERE key = ?", (key,))
+            self._size -= row[0]
+            if commit:
+                self._db.commit()
+
+    def clear(self):
+        self._db.execute("DELETE FROM response")
+        self._db.commit()
+        self._size = 0
+
+    def _evict(self, now):
+        self._db.execute("DELETE FROM response WHERE created < ?", (now - self.max_age,))
+        # Drop the least recently used entries until we are 10% below the limit
+        target = self.max_size * 9 // 10
+        size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM response").fetchone()[0]
+        if size > target:
+            removed = 0
+            cursor = self._db.execute("SELECT accessed, size FROM response ORDER BY accessed")
+            cutoff = None
+            for accessed, entry_size in cursor:
+                removed += entry_size
+                cutoff = accessed
+                if size - removed <= target:
+                    break
+            cursor.close()
+            if cutoff is not None:
+                self._db.execute("DELETE FROM response WHERE accessed <= ?", (cutoff,))
+            size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM response").fetchone()[0]
+        self._size = size
+        log.debug("Response cache size after eviction: %d bytes", size)
+
+    def close(self):
+        self._db.close()
@@ -104,6 +104,38 @@ class picard_test(Command):
         t.run(tests)
 
 
+class picard_bench(Command):
+    description = "run performance benchmarks"
+    user_options = [
+        ("benchmarks=", None, "list of benchmarks to run (default all)"),
+        ("scale=", "s", "multiply the corpus sizes (default 1.0)"),
+        ("save=", None, "save the results as JSON baseline"),
+        ("compare=", None, "compare the results to a JSON baseline"),
+        ]
+
+    def initialize_options(self):
+        self.benchmarks = []
+        self.scale = None
+        self.save = None
+        self.compare = None
+
+    def finalize_options(self):
+        if self.benchmarks:
+            self.benchmarks = self.benchmarks.split(",")
+
+    def run(self):
+        from benchmarks.harness import main
+        args = []
+        if self.scale:
+            args += ["--scale", self.scale]
+        if self.save:
+            args += ["--save", self.save]
+        if self.compare:
+            args += ["--compare", self.compare]
+        if main(args + self.benchmarks):
+            sys.exit(1)
+
+
 class picard_build_locales(Command):
     description = 'build locale files'
     user_options = [
@@ -333,6 +365,7 @@ args2 = {
     'data_files': [],
     'cmdclass': {
         'test': picard_test,
+        'bench': picard_bench,
         'build': picard_build,
         'build_locales': picard_build_locales,
         'build_ui': picard_build_ui,
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from picard import config
+from picard.album import Album, NatAlbum
+from picard.i18n import setup_gettext
+from picard.metadata import Metadata
+from picard.track import Track
+
+
+setup_gettext(".")
+
+
+class FakeFile(object):
+
+    REMOVED = 3
+
+    def __init__(self, title, tracknumber, trackid=u""):
+        self.metadata = Metadata()
+        self.metadata['title'] = title
+        self.metadata['tracknumber'] = tracknumber
+        self.metadata['discnumber'] = u"1"
+        self.metadata['musicbrainz_trackid'] = trackid
+        self.orig_metadata = self.metadata
+        self.parent = None
+        self.state = 0
+
+    def move(self, parent):
+        self.parent = parent
+
+
+def make_album(count, discnumber=u"1"):
+    album = Album("bd1a5066-ad9d-4c43-9d2e-eb6b5b9dc85d")
+    for i in xrange(count):
+        track = Track("0c6dd3f5-e6aa-4bc1-8ab1-%012d" % i, album)
+        track.metadata['title'] = u"Track title %d" % i
+        track.metadata['tracknumber'] = unicode(i + 1)
+        track.metadata['discnumber'] = discnumber
+        track.metadata['musicbrainz_trackid'] = track.id
+        album.tracks.append(track)
+    album._index_tracks()
+    return album
+
+
+class AlbumMatchFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        config.setting = {'track_matching_threshold': 0.4}
+
+    def test_match_files(self):
+        album = make_album(3)
+        files = [FakeFile(u"Track title 2", u"3"), FakeFile(u"Track title 0", u"1"),
+                 FakeFile(u"Something else entirely", u"")]
+        album.match_files(files)
+        self.assertEqual(files[0].parent, album.tracks[2])
+        self.assertEqual(files[1].parent, album.tracks[0])
+        self.assertEqual(files[2].parent, album.unmatched_files)
+
+    def test_match_trackid(self):
+        album = make_album(2)
+        tracks = album.tracks
+        files = [FakeFile(u"Track title 0", u"1", tracks[1].id)]
+        album.match_files(files)
+        self.assertEqual(files[0].parent, tracks[1])
+        files = [FakeFile(u"Track title 0", u"1", tracks[1].id)]
+        album.match_files(files, use_trackid=False)
+        self.assertEqual(files[0].parent, tracks[0])
+
+    def test_one_file_per_track(self):
+        # Both files have the same track number, the titles decide
+        album = make_album(2)
+        files = [FakeFile(u"Track title 0", u"1"), FakeFile(u"Track title 1", u"1")]
+        album.match_files(files)
+        self.assertEqual(files[0].parent, album.tracks[0])
+        self.assertEqual(files[1].parent, album.tracks[1])
+
+    def test_many_files(self):
+        album = make_album(20)
+        files = [FakeFile(u"Track title %d" % (i % 20), unicode(i % 20 + 1))
+                 for i in xrange(800)]
+        start = time.time()
+        album.match_files(files)
+        self.assertLess(time.time() - start, 10.0)
+        for i, file in enumerate(files):
+            self.assertEqual(file.parent, album.tracks[i % 20])
+
+
+class AlbumTrackIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        config.setting = {'track_matching_threshold': 0.4, 'nat_name': u'[non-album tracks]'}
+
+    def test_lookups(self):
+        album = make_album(3)
+        tracks = album.tracks
+        self.assertEqual(album.get_tracks_by_trackid(tracks[1].id), [tracks[1]])
+        self.assertEqual(album.get_tracks_by_trackid(u"unknown"), [])
+        file = FakeFile(u"Track title 2", u"3", tracks[2].id)
+        self.assertEqual(album._get_trackid_matches(file, tracks[2].id), [(4.0, tracks[2])])
+        # Same trackid, other track number
+        file = FakeFile(u"Track title 2", u"1", tracks[2].id)
+        self.assertEqual(album._get_trackid_matches(file, tracks[2].id), [(2.0, tracks[2])])
+
+    def test_edited_tracks(self):
+        album = make_album(3)
+        tracks = album.tracks
+        old_id = tracks[0].id
+        tracks[0].metadata['musicbrainz_trackid'] = u"edited"
+        album.invalidate_track_index()
+        self.assertEqual(album.get_tracks_by_trackid(old_id), [])
+        self.assertEqual(album.get_tracks_by_trackid(u"edited"), [tracks[0]])
+        # Tracks 1 and 2 swap their numbers
+        tracks[1].metadata['tracknumber'] = u"3"
+        tracks[2].metadata['tracknumber'] = u"2"
+        album.invalidate_track_index()
+        file = FakeFile(u"", u"3", tracks[1].id)
+        album.match_file(file, tracks[1].id)
+        self.assertEqual(file.parent, tracks[1])
+        self.assertEqual(album._get_trackid_matches(file, tracks[1].id), [(4.0, tracks[1])])
+
+    def test_match_files_finds_edits(self):
+        # Without invalidating, e.g. edited by a plugin
+        album = make_album(3)
+        tracks = album.tracks
+        tracks[0].metadata['musicbrainz_trackid'] = u"5e1e4e6c-0a6f-4c5b-9c4b-6a4d3f1f4f10"
+        files = [FakeFile(u"", u"1", u"5e1e4e6c-0a6f-4c5b-9c4b-6a4d3f1f4f10")]
+        album.match_files(files)
+        self.assertEqual(files[0].parent, tracks[0])
+
+    def test_no_rescan_per_file(self):
+        album = make_album(20)
+        calls = []
+
+        def track_key(track):
+            calls.append(track)
+            return Album._track_key(track)
+        album._track_key = track_key
+        for track in album.tracks:
+            album.match_file(FakeFile(u"", track.metadata['tracknumber'], track.id), track.id)
+        self.assertEqual(calls, [])
+
+    def test_duplicate_track_numbers(self):
+        album = make_album(3)
+        tracks = album.tracks
+        tracks[2].metadata['tracknumber'] = u"2"
+        album.invalidate_track_index()
+        for track in tracks[2], tracks[1]:
+            file = FakeFile(u"", u"2", track.id)
+            album.match_file(file, track.id)
+            self.assertEqual(file.parent, track)
+            self.assertEqual(album._get_trackid_matches(file, track.id), [(4.0, track)])
+
+    def test_added_tracks(self):
+        album = make_album(2)
+        track = Track("0c6dd3f5-e6aa-4bc1-8ab1-000000000099", album)
+        track.metadata['musicbrainz_trackid'] = track.id
+        album.tracks.append(track)
+        self.assertEqual(album.get_tracks_by_trackid(track.id), [track])
+
+    def test_nat_album(self):
+        nats = NatAlbum()
+        track = Track("0c6dd3f5-e6aa-4bc1-8ab1-000000000001", nats)
+        nats.add_track(track)
+        self.assertEqual(nats.get_tracks_by_trackid(track.id), [track])
+        other = Track("0c6dd3f5-e6aa-4bc1-8ab1-000000000002", nats)
+        nats.tracks.append(other)
+        self.assertEqual(nats.get_tracks_by_trackid(other.id), [other])
+        nats.add_track(Track(track.id, nats))
+        self.assertEqual(len(nats.get_tracks_by_trackid(track.id)), 2)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import random
+import time
+import unittest
+from picard.util.assignment import max_weight_assignment
+
+
+def total(scores, assignment):
+    return sum(scores[i][j] for i, j in enumerate(assignment) if j is not None)
+
+
+def best_total(scores):
+    # Try every assignment, None for unassigned rows
+    num_cols = len(scores[0])
+    best = 0.0
+    for columns in itertools.product(range(num_cols) + [None], repeat=len(scores)):
+        assigned = [j for j in columns if j is not None]
+        if len(assigned) != len(set(assigned)):
+            continue
+        if any(scores[i][j] is None or scores[i][j] <= 0
+               for i, j in enumerate(columns) if j is not None):
+            continue
+        best = max(best, total(scores, columns))
+    return best
+
+
+class AssignmentTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(max_weight_assignment([]), [])
+
+    def test_greedy_is_not_optimal(self):
+        # Greedy would give row 0 column 0 and leave row 1 without a column
+        scores = [[0.9, 0.8],
+                  [0.85, None]]
+        self.assertEqual(max_weight_assignment(scores), [1, 0])
+
+    def test_more_rows(self):
+        scores = [[0.5], [0.9], [0.7]]
+        self.assertEqual(max_weight_assignment(scores), [None, 0, None])
+
+    def test_more_columns(self):
+        scores = [[0.1, 0.2, 0.9, None]]
+        self.assertEqual(max_weight_assignment(scores), [2])
+
+    def test_not_assignable(self):
+        scores = [[None, 0.0], [None, None]]
+        self.assertEqual(max_weight_assignment(scores), [None, None])
+
+    def test_optimal(self):
+        rand = random.Random(0)
+        for n in xrange(100):
+            rows = rand.randint(1, 4)
+            cols = rand.randint(1, 4)
+            scores = [[rand.random() if rand.random() > 0.3 else None
+                       for j in xrange(cols)] for i in xrange(rows)]
+            assignment = max_weight_assignment(scores)
+            assigned = [j for j in assignment if j is not None]
+            self.assertEqual(len(assigned), len(set(assigned)))
+            self.assertAlmostEqual(total(scores, assignment), best_total(scores))
+
+    def test_components(self):
+        scores = [[0.9, None, None, None],
+                  [None, None, 0.5, 0.6],
+                  [None, None, 0.7, None],
+                  [None, None, None, None]]
+        self.assertEqual(max_weight_assignment(scores), [0, 3, 2, None])
+
+    def test_scaling(self):
+        rand = random.Random(0)
+        for rows, cols in ((2000, 100), (100, 2000)):
+            scores = [[rand.random() if rand.random() < 0.05 else None
+                       for j in xrange(cols)] for i in xrange(rows)]
+            start = time.time()
+            assignment = max_weight_assignment(scores)
+            self.assertLess(time.time() - start, 10.0)
+            assigned = [j for j in assignment if j is not None]
+            self.assertEqual(len(assigned), len(set(assigned)))
+            self.assertEqual(len(assigned), min(rows, cols))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from picard.cluster import Cluster, ClusterState, ClusterTask
+
+
+class FakeFile(object):
+
+    REMOVED = 3
+
+    def __init__(self, album, artist=u"Artist", tracknumber=0):
+        self.metadata = {"album": album, "artist": artist}
+        self.parent = None
+        self.state = 0
+        self.discnumber = 0
+        self.tracknumber = tracknumber
+        self.base_filename = u""
+
+
+def clusters(files, threshold, state=None):
+    return sorted((album, artist, [files.index(f) for f in cluster_files])
+                  for album, artist, cluster_files
+                  in Cluster.cluster(files, threshold, state))
+
+
+class ClusterTest(unittest.TestCase):
+
+    def test_cluster(self):
+        files = [FakeFile(u"Abbey Road"), FakeFile(u"Revolver"),
+                 FakeFile(u"abbey road!"), FakeFile(u"Abbey Road", u"Other"),
+                 FakeFile(u"Help", u"Other"), FakeFile(u"Help", u"Other")]
+        self.assertEqual(clusters(files, 1.0), [
+            (u"Abbey Road", u"Artist", [0, 2, 3]),
+            (u"Help", u"Other", [4, 5]),
+        ])
+
+    def test_title(self):
+        files = [FakeFile(u"abbey road", u"A"), FakeFile(u"Abbey Road", u"A")]
+        self.assertEqual(clusters(files, 1.0), [(u"Abbey Road", u"A", [0, 1])])
+
+    def test_title_tie(self):
+        # Equally common spellings, the first in sort order wins no matter
+        # in which order the files come
+        names = [u"Abbey Road!", u"abbey road", u"Abbey Road", u"abbey road!"]
+        for i in xrange(len(names)):
+            files = [FakeFile(name, u"A") for name in names[i:] + names[:i]]
+            self.assertEqual([(album, artist) for album, artist, f in clusters(files, 1.0)],
+                             [(u"Abbey Road", u"A")])
+        files = [FakeFile(u"abbey road"), FakeFile(u"Abbey Road"), FakeFile(u"abbey road")]
+        self.assertEqual(clusters(files, 1.0)[0][0], u"abbey road")
+
+    def test_threshold(self):
+        files = [FakeFile(u"abcdef"), FakeFile(u"abcdxf"), FakeFile(u"abcyxf")]
+        self.assertEqual(len(clusters(files, 0.8)), 1)
+        self.assertEqual(clusters(files, 1.0), [])
+
+
+class ClusterStateTest(unittest.TestCase):
+
+    def assertSameAsFresh(self, files, threshold, state):
+        result = clusters(files, threshold, state)
+        self.assertEqual(result, clusters(files, threshold))
+        return result
+
+    def test_add_files(self):
+        state = ClusterState()
+        files = [FakeFile(u"Abbey Road"), FakeFile(u"Revolver")]
+        self.assertEqual(self.assertSameAsFresh(files, 0.8, state), [])
+        files.append(FakeFile(u"Abbey Roads"))
+        self.assertEqual(len(self.assertSameAsFresh(files, 0.8, state)), 1)
+        files.append(FakeFile(u"Revolver!"))
+        self.assertEqual(len(self.assertSameAsFresh(files, 0.8, state)), 2)
+
+    def test_remove_files(self):
+        state = ClusterState()
+        # The middle word connects the other two
+        files = [FakeFile(u"abcdef"), FakeFile(u"abcdxf"), FakeFile(u"abcyxf")]
+        self.assertEqual(len(self.assertSameAsFresh(files, 0.8, state)), 1)
+        middle = files.pop(1)
+        self.assertEqual(self.assertSameAsFresh(files, 0.8, state), [])
+        files.append(middle)
+        self.assertEqual(len(self.assertSameAsFresh(files, 0.8, state)), 1)
+
+    def test_changed_tags(self):
+        state = ClusterState()
+        files = [FakeFile(u"Help"), FakeFile(u"Help"), FakeFile(u"Revolver")]
+        self.assertSameAsFresh(files, 1.0, state)
+        files[0].metadata["album"] = u"Revolver"
+        self.assertEqual(self.assertSameAsFresh(files, 1.0, state),
+                         [(u"Revolver", u"Artist", [0, 2])])
+
+    def test_threshold_change(self):
+        state = ClusterState()
+        files = [FakeFile(u"abcdef"), FakeFile(u"abcdxf")]
+        self.assertSameAsFresh(files, 1.0, state)
+        self.assertEqual(len(self.assertSameAsFresh(files, 0.8, state)), 1)
+
+
+class ClusterTaskTest(unittest.TestCase):
+
+    def test_run(self):
+        files = [FakeFile(u"Help", tracknumber=2), FakeFile(u"Revolver"),
+                 FakeFile(u"Help", tracknumber=1)]
+        task = ClusterTask(files, 1.0)
+        # Changes after the snapshot don't affect the result
+        files[1].metadata["album"] = u"Help"
+        task.set_result(task.run())
+        self.assertEqual(list(task.pending), [(u"Help", u"Artist", [files[2], files[0]])])
+        self.assertEqual(task.total, 2)
+
+    def test_moved_files(self):
+        files = [FakeFile(u"Help"), FakeFile(u"Help"), FakeFile(u"Help")]
+        task = ClusterTask(files, 1.0)
+        result = task.run()
+        files[0].parent = object()
+        files[1].state = FakeFile.REMOVED
+        task.set_result(result)
+        self.assertEqual(list(task.pending), [(u"Help", u"Artist", [files[2]])])
+
+    def test_cancel(self):
+        state = ClusterState()
+        files = [FakeFile(u"Help"), FakeFile(u"Help")]
+        task = ClusterTask(files, 1.0, state)
+        task.cancel()
+        self.assertEqual(task.run(), None)
+        # The state can still be used
+        self.assertEqual(clusters(files, 1.0, state), [(u"Help", u"Artist", [0, 1])])
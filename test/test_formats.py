@@ -1,9 +1,10 @@
 import os.path
 import unittest
 import shutil
-from tempfile import mkstemp
+from tempfile import mkdtemp, mkstemp
 from picard import config, log
 from picard.metadata import Metadata
+from picard.util.imageref import ImageRef, image_data
 import picard.formats
 from PyQt4 import QtCore
 
@@ -16,6 +17,7 @@ settings = {
     'id3v2_encoding': 'utf-8',
     'save_images_to_tags': True,
     'write_id3v23': False,
+    'id3v23_join_with': '/',
     'remove_ape_from_mp3': False,
     'remove_id3_from_flac': False,
     'rating_steps': 6,
@@ -27,6 +29,7 @@ settings = {
 class FakeTagger(QtCore.QObject):
 
     tagger_stats_changed = QtCore.pyqtSignal()
+    tag_cache = None
 
     def __init__(self):
         QtCore.QObject.__init__(self)
@@ -554,3 +557,139 @@ class TestCoverArt(unittest.TestCase):
                 self.assertEqual(image["data"], imgdata)
         finally:
             self._tear_down()
+
+
+class TestImageReferences(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = mkstemp(suffix='.mp3')
+        os.close(fd)
+        shutil.copy(os.path.join('test', 'data', 'test.mp3'), self.filename)
+        config.setting = dict(settings, dont_write_tags=False, preserve_timestamps=False,
+                              rename_files=False, move_files=False, delete_empty_dirs=False,
+                              save_images_to_files=False)
+        QtCore.QObject.tagger = FakeTagger()
+        self.imgdata = 'JFIF' + 'a' * 1024
+        metadata = Metadata()
+        metadata.add_image('image/jpeg', self.imgdata)
+        picard.formats.open(self.filename)._save(self.filename, metadata)
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def test_load(self):
+        f = picard.formats.open(self.filename)
+        image = f._load_cached(self.filename).images[0]
+        self.assertTrue(isinstance(image['data'], ImageRef))
+        self.assertFalse(image['data'].pinned)
+        self.assertEqual(image_data(image), self.imgdata)
+
+    def test_save(self):
+        f = picard.formats.open(self.filename)
+        metadata = f._load_cached(self.filename)
+        ref = metadata.images[0]['data']
+        f._save_and_rename(self.filename, metadata)
+        self.assertFalse(ref.pinned)
+        self.assertEqual(ref.read(), self.imgdata)
+
+    def test_save_without_images(self):
+        config.setting['clear_existing_tags'] = True
+        config.setting['save_images_to_tags'] = False
+        f = picard.formats.open(self.filename)
+        metadata = f._load_cached(self.filename)
+        ref = metadata.images[0]['data']
+        f._save_and_rename(self.filename, metadata)
+        self.assertEqual(f._load(self.filename).images, [])
+        # The image isn't in the file anymore and is kept in memory
+        self.assertTrue(ref.pinned)
+        self.assertEqual(ref.read(), self.imgdata)
+
+
+class SaveNeededTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = mkstemp(suffix='.mp3')
+        os.close(fd)
+        shutil.copy(os.path.join('test', 'data', 'test.mp3'), self.filename)
+        config.setting = dict(settings, dont_write_tags=False, preserve_timestamps=False,
+                              rename_files=False, move_files=False, delete_empty_dirs=False,
+                              save_images_to_files=False)
+        QtCore.QObject.tagger = FakeTagger()
+        metadata = Metadata()
+        metadata['title'] = u'Title'
+        metadata['artist'] = [u'A', u'B']
+        metadata.add_image('image/jpeg', 'JFIF' + 'a' * 1024)
+        picard.formats.open(self.filename)._save(self.filename, metadata)
+        self.file = picard.formats.open(self.filename)
+        self.file._copy_loaded_metadata(self.file._load_cached(self.filename))
+
+    def tearDown(self):
+        os.unlink(self.filename)
+
+    def metadata(self):
+        metadata = Metadata()
+        metadata.copy(self.file.metadata)
+        return metadata
+
+    def test_unchanged(self):
+        self.assertFalse(self.file._save_needed(self.filename, self.metadata()))
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        os.utime(self.filename, (0, 0))
+        self.file._save_and_rename(self.filename, self.metadata())
+        self.assertEqual(os.stat(self.filename).st_mtime, 0)
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_changed_tags(self):
+        metadata = self.metadata()
+        metadata['artist'] = [u'A']
+        self.assertTrue(self.file._save_needed(self.filename, metadata))
+        metadata = self.metadata()
+        metadata['date'] = u'2004'
+        self.assertTrue(self.file._save_needed(self.filename, metadata))
+        # Not written to the file
+        metadata = self.metadata()
+        metadata['~releasecomment'] = u'Comment'
+        self.assertFalse(self.file._save_needed(self.filename, metadata))
+        metadata['~rating'] = u'3'
+        self.assertTrue(self.file._save_needed(self.filename, metadata))
+        config.setting['clear_existing_tags'] = True
+        self.assertTrue(self.file._save_needed(self.filename, self.metadata()))
+
+    def test_changed_images(self):
+        metadata = self.metadata()
+        metadata.images = []
+        self.assertFalse(self.file._save_needed(self.filename, metadata))
+        metadata.add_image('image/jpeg', 'JFIF' + 'b' * 1024)
+        self.assertTrue(self.file._save_needed(self.filename, metadata))
+        metadata = self.metadata()
+        metadata.images[0] = dict(metadata.images[0], type='back')
+        self.assertTrue(self.file._save_needed(self.filename, metadata))
+        config.setting['save_images_to_tags'] = False
+        self.assertFalse(self.file._save_needed(self.filename, metadata))
+
+    def test_changed_settings(self):
+        config.setting['write_id3v23'] = True
+        self.assertTrue(self.file._save_needed(self.filename, self.metadata()))
+        config.setting['write_id3v23'] = False
+        config.setting['write_id3v1'] = False
+        self.assertTrue(self.file._save_needed(self.filename, self.metadata()))
+
+    def test_untagged_file(self):
+        # Title and track number taken from the filename aren't in the file
+        tmpdir = mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, '03 Song.ogg')
+            shutil.copy(os.path.join('test', 'data', 'test.ogg'), filename)
+            f = picard.formats.open(filename)
+            f._copy_loaded_metadata(f._load_cached(filename))
+            metadata = Metadata()
+            metadata.copy(f.metadata)
+            self.assertTrue(f._save_needed(filename, metadata))
+            f._save_and_rename(filename, metadata)
+            loaded = f._load(filename)
+            self.assertEqual(loaded['title'], u'03 Song')
+            self.assertEqual(loaded['tracknumber'], u'3')
+        finally:
+            shutil.rmtree(tmpdir)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import unittest
+from picard.util.imageref import ImageRef, ImageStore, image_data
+
+
+class ImageRefTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reads = 0
+        self.stored = 'JFIF' + 'a' * 1000
+
+    def reader(self, ref):
+        self.reads += 1
+        return self.stored
+
+    def test_read(self):
+        ref = ImageRef.from_data('a.mp3', 0, self.stored, self.reader)
+        self.assertTrue(ref.pinned)
+        self.assertEqual(ref.read(), self.stored)
+        self.assertEqual(self.reads, 0)
+        ref.unpin()
+        self.assertEqual(image_data({'data': ref}), self.stored)
+        self.assertEqual(self.reads, 1)
+        self.assertEqual(len(ref), len(self.stored))
+
+    def test_changed(self):
+        ref = ImageRef.from_data('a.mp3', 0, self.stored, self.reader)
+        ref.unpin()
+        self.stored = 'JFIF' + 'b' * 1000
+        self.assertRaises(IOError, ref.read)
+        self.stored = None
+        self.assertRaises(IOError, ref.read)
+        self.assertRaises(IOError, ref.pin)
+
+    def test_pin(self):
+        ref = ImageRef.from_data('a.mp3', 0, self.stored, self.reader)
+        ref.unpin()
+        ref.pin()
+        self.stored = None
+        self.assertEqual(ref.read(), 'JFIF' + 'a' * 1000)
+        self.assertEqual(self.reads, 1)
+
+    def test_equal(self):
+        ref = ImageRef.from_data('a.mp3', 0, self.stored, self.reader)
+        other = ImageRef.from_data('b.mp3', 2, self.stored, None)
+        self.assertEqual(ref, other)
+        self.assertEqual(ref, self.stored)
+        self.assertNotEqual(ref, 'JFIF')
+        self.assertEqual({'data': ref}, {'data': self.stored})
+        self.assertEqual(image_data({'data': 'PNG'}), 'PNG')
+
+
+class ImageStoreTest(unittest.TestCase):
+
+    def test_add(self):
+        store = ImageStore()
+        image = store.add('JFIF' + 'a' * 1000)
+        self.assertTrue(store.add('JFIF' + 'a' * 1000) is image)
+        self.assertTrue(store.add(image) is image)
+        self.assertEqual(image.read(), 'JFIF' + 'a' * 1000)
+        other = store.add('PNG')
+        self.assertNotEqual(image, other)
+        self.assertEqual((len(store), store.size()), (2, 1007))
+
+    def test_release(self):
+        store = ImageStore()
+        images = [store.add('JFIF'), store.add('JFIF')]
+        del images[0]
+        gc.collect()
+        self.assertEqual(len(store), 1)
+        del images[0]
+        gc.collect()
+        self.assertEqual(len(store), 0)
+
+    def test_equal_to_ref(self):
+        store = ImageStore()
+        ref = ImageRef.from_data('a.mp3', 0, 'JFIF', None)
+        self.assertEqual(store.add('JFIF'), ref)
+        self.assertEqual(len(set([store.add('JFIF'), ref])), 1)
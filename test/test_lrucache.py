@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from picard.util.lrucache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = LRUCache(2)
+        cache["a"] = 1
+        self.assertEqual(cache["a"], 1)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("b", 2), 2)
+        self.assertRaises(KeyError, cache.__getitem__, "b")
+        self.assertEqual(cache.info(), (1, 3, 2, 1))
+
+    def test_evict_least_recently_used(self):
+        cache = LRUCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache.get("a")
+        cache["c"] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertTrue("a" in cache)
+        self.assertFalse("b" in cache)
+        self.assertTrue("c" in cache)
+        cache["a"] = 4
+        cache["d"] = 5
+        self.assertFalse("c" in cache)
+        self.assertEqual(cache["a"], 4)
+
+    def test_delete_and_clear(self):
+        cache = LRUCache(3)
+        for i in range(3):
+            cache[i] = i
+        del cache[1]
+        cache[3] = 3
+        cache[4] = 4
+        self.assertEqual(sorted(cache._entries), [2, 3, 4])
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        cache[5] = 5
+        self.assertEqual(cache[5], 5)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from PyQt4 import QtCore
+from picard import config, log
+from picard.file import File
+from picard.metadata import Metadata
+from picard.util.pathlock import PathLocks, path_locks
+
+
+class PathLocksTest(unittest.TestCase):
+
+    def test_exclusive(self):
+        locks = PathLocks()
+        active = []
+        overlaps = []
+
+        def work(path):
+            for i in range(20):
+                with locks.locked(path, '/other/%d' % i):
+                    active.append(path)
+                    if active.count(path) > 1:
+                        overlaps.append(path)
+                    time.sleep(0.0001)
+                    active.remove(path)
+
+        threads = [threading.Thread(target=work, args=('/a/b' if i % 2 else '/a/b/../b',))
+                   for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(len(locks), 0)
+
+    def test_reentrant(self):
+        locks = PathLocks()
+        with locks.locked('/a', '/b'):
+            with locks.locked('/b', u'/c'):
+                self.assertEqual(len(locks), 3)
+        self.assertEqual(len(locks), 0)
+
+
+class FakeTagger(QtCore.QObject):
+
+    tagger_stats_changed = QtCore.pyqtSignal()
+    tag_cache = None
+    files = {}
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        QtCore.QObject.config = config
+        QtCore.QObject.log = log
+
+
+class FakeFile(File):
+
+    target = None
+
+    def _save(self, filename, metadata):
+        with open(filename, 'ab') as f:
+            f.write(' saved')
+
+    def _make_filename(self, filename, metadata, settings=None):
+        return os.path.join(self.target, metadata['album'], metadata['title'] + '.mp3')
+
+    def _make_image_filename(self, image_filename, dirname, metadata):
+        return os.path.join(dirname, image_filename)
+
+
+class SaveStressTest(unittest.TestCase):
+    """Saves many files with conflicting names in parallel."""
+
+    dirs = 10
+    files_per_dir = 20
+    threads = 8
+
+    def setUp(self):
+        config.setting = {
+            'dont_write_tags': False,
+            'clear_existing_tags': False,
+            'save_images_to_tags': True,
+            'save_only_front_images_to_tags': False,
+            'preserve_timestamps': False,
+            'rename_files': True,
+            'move_files': True,
+            'move_additional_files': True,
+            'move_additional_files_pattern': '*.jpg',
+            'delete_empty_dirs': True,
+            'save_images_to_files': True,
+            'save_images_overwrite': False,
+            'cover_image_filename': 'cover',
+        }
+        QtCore.QObject.tagger = FakeTagger()
+        self.tmpdir = tempfile.mkdtemp()
+        FakeFile.target = os.path.join(self.tmpdir, 'dst')
+        self.files = []
+        for d in range(self.dirs):
+            dirname = os.path.join(self.tmpdir, 'src', str(d))
+            os.makedirs(dirname)
+            with open(os.path.join(dirname, 'booklet%d.jpg' % d), 'wb') as f:
+                f.write('booklet %d' % d)
+            for i in range(self.files_per_dir):
+                filename = os.path.join(dirname, '%d.mp3' % i)
+                with open(filename, 'wb') as f:
+                    f.write('%d/%d' % (d, i))
+                metadata = Metadata()
+                # Few distinct names, most files need collision resolution
+                metadata['album'] = u'Album %d' % (d % 3)
+                metadata['title'] = u'Title %d' % (i % 4)
+                metadata.add_image('image/jpeg', 'JFIF album %d' % (d % 3))
+                self.files.append((FakeFile(filename), filename, metadata))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_save(self):
+        results = []
+        errors = []
+        queue = list(self.files)
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    f, filename, metadata = queue.pop()
+                try:
+                    results.append(f._save_and_rename(filename, metadata))
+                except Exception as e:
+                    errors.append(e)
+
+        threads = [threading.Thread(target=work) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        # Every file ends up under its own name, with its own content
+        self.assertEqual(len(set(results)), len(self.files))
+        contents = []
+        covers = []
+        booklets = []
+        for dirpath, dirnames, filenames in os.walk(self.tmpdir):
+            for name in filenames:
+                with open(os.path.join(dirpath, name), 'rb') as f:
+                    data = f.read()
+                if name.endswith('.mp3'):
+                    self.assertTrue(os.path.join(dirpath, name) in results)
+                    contents.append(data)
+                elif name.startswith('cover'):
+                    covers.append(name)
+                else:
+                    booklets.append(data)
+        self.assertEqual(sorted(contents), sorted('%d/%d saved' % (d, i)
+                                                  for d in range(self.dirs)
+                                                  for i in range(self.files_per_dir)))
+        # One cover per album, and every booklet moved once
+        self.assertEqual(covers, ['cover.jpg'] * 3)
+        self.assertEqual(sorted(booklets), sorted('booklet %d' % d for d in range(self.dirs)))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'src')))
+        self.assertEqual(len(path_locks), 0)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from picard.ratecontrol import TokenBucket, parse_retry_after
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_delay(self):
+        bucket = TokenBucket(1000, now=0.0)
+        self.assertEqual(bucket.acquire(now=0.0), 0)
+        self.assertEqual(bucket.acquire(now=0.5), 501)
+        self.assertEqual(bucket.acquire(now=1.0), 0)
+
+    def test_burst(self):
+        bucket = TokenBucket(1000, burst=3, now=0.0)
+        for i in range(3):
+            self.assertEqual(bucket.acquire(now=0.0), 0)
+        self.assertTrue(bucket.acquire(now=0.0) > 0)
+        self.assertEqual(bucket.acquire(now=1.0), 0)
+
+    def test_no_delay(self):
+        bucket = TokenBucket(0, now=0.0)
+        for i in range(100):
+            self.assertEqual(bucket.acquire(now=0.0), 0)
+
+    def test_concurrency(self):
+        bucket = TokenBucket(0, concurrency=2, now=0.0)
+        self.assertEqual(bucket.acquire(now=0.0), 0)
+        self.assertEqual(bucket.acquire(now=0.0), 0)
+        self.assertEqual(bucket.acquire(now=0.0), None)
+        bucket.release(200, now=0.1)
+        self.assertEqual(bucket.acquire(now=0.1), 0)
+
+    def test_backoff(self):
+        bucket = TokenBucket(1000, now=0.0)
+        self.assertEqual(bucket.acquire(now=0.0), 0)
+        bucket.release(503, now=0.1)
+        self.assertEqual(bucket.interval, 2000)
+        self.assertTrue(bucket.acquire(now=1.5) > 0)
+        self.assertEqual(bucket.acquire(now=2.1), 0)
+
+    def test_retry_after(self):
+        bucket = TokenBucket(0, now=0.0)
+        self.assertEqual(bucket.acquire(now=0.0), 0)
+        bucket.release(429, retry_after=10, now=0.0)
+        self.assertTrue(bucket.acquire(now=9.0) > 0)
+        self.assertEqual(bucket.acquire(now=10.0), 0)
+
+    def test_recovery(self):
+        bucket = TokenBucket(1000, now=0.0)
+        bucket.acquire(now=0.0)
+        bucket.release(503, now=0.0)
+        bucket.release(503, now=0.0)
+        self.assertEqual(bucket.interval, 4000)
+        for i in range(10):
+            bucket.release(200, now=0.0)
+        self.assertEqual(bucket.interval, 1000)
+
+
+class RetryAfterTest(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+
+    def test_date(self):
+        self.assertEqual(parse_retry_after("Thu, 01 Jan 1970 00:01:00 GMT", now=0), 60)
+
+    def test_invalid(self):
+        self.assertEqual(parse_retry_after(""), None)
+        self.assertEqual(parse_retry_after("soon"), None)
@@ -2,7 +2,8 @@ import unittest
 import picard
 from PyQt4 import QtCore
 from picard import config
-from picard.script import ScriptParser
+from picard.plugin import set_enabled_plugins
+from picard.script import ScriptParser, ScriptProfile, UnknownFunction, register_script_function
 from picard.metadata import Metadata
 
 
@@ -12,6 +13,7 @@ class ScriptParserTest(unittest.TestCase):
         config.setting = {
             'enabled_plugins': '',
         }
+        set_enabled_plugins([])
         self.parser = ScriptParser()
 
     def test_cmd_noop(self):
@@ -254,3 +256,96 @@ class ScriptParserTest(unittest.TestCase):
         context["target"] = "targetval"
         context["source"] = "sourceval"
         self._eval_and_check_copymerge(context, ["targetval", "sourceval"])
+
+    def test_compiled_script_cached(self):
+        script = "$if(%title%,$upper(%title%),$noop(%artist%)) - %_length%"
+        compiled = self.parser.compile(script)
+        info = ScriptParser.cache_info()
+        self.assertTrue(ScriptParser().compile(script) is compiled)
+        self.assertEqual(ScriptParser.cache_info().hits, info.hits + 1)
+        context = Metadata()
+        context["title"] = "abc"
+        context["~length"] = "1:00"
+        self.assertEqual(self.parser.eval(script, context), "ABC - 1:00")
+        self.assertEqual(self.parser.eval(script), " - ")
+
+    def test_registered_function(self):
+        self.assertRaises(UnknownFunction, self.parser.eval, "$test_reverse(abc)")
+
+        def func_test_reverse(parser, text):
+            return text[::-1]
+        register_script_function(func_test_reverse, "test_reverse")
+        self.assertEqual(self.parser.eval("$test_reverse(abc)"), "cba")
+
+    def test_plugin_function(self):
+        def func_test_plugin(parser, text):
+            return text[::-1]
+        ScriptParser._function_registry.register("picard.plugins.test_plugin",
+            ("test_plugin", func_test_plugin, True, (1,)))
+        self.assertRaises(UnknownFunction, self.parser.eval, "$test_plugin(abc)")
+        set_enabled_plugins(["test_plugin"])
+        self.assertEqual(self.parser.eval("$test_plugin(abc)"), "cba")
+        self.assertEqual(config.setting["enabled_plugins"], "test_plugin")
+        set_enabled_plugins([])
+        self.assertRaises(UnknownFunction, self.parser.eval, "$test_plugin(abc)")
+
+    def test_eval_without_settings(self):
+        self.parser.eval("$noop()")
+        config.setting = {}
+        self.assertEqual(self.parser.eval("$upper(abc)"), "ABC")
+        self.assertEqual(ScriptParser().eval("$lower(ABC)"), "abc")
+
+    def test_eval_many(self):
+        contexts = [Metadata(), Metadata()]
+        contexts[0]["title"] = "a"
+        contexts[1]["title"] = "b"
+        self.assertEqual(self.parser.eval_many("$set(x,%title%)%x%", contexts), ["a", "b"])
+        self.assertEqual([c["x"] for c in contexts], ["a", "b"])
+
+    def test_eval_many_error(self):
+        def func_test_fail(parser, text):
+            if text == "b":
+                raise ValueError(text)
+            return text
+        register_script_function(func_test_fail, "test_fail")
+        contexts = [Metadata(), Metadata()]
+        contexts[1]["title"] = "b"
+        failed = []
+        self.assertEqual(self.parser.eval_many("$test_fail(%title%)", contexts, error=failed.append),
+                         ["", None])
+        self.assertEqual(failed, [contexts[1]])
+        self.assertRaises(ValueError, self.parser.eval_many, "$test_fail(%title%)", contexts)
+
+    def test_writes_context(self):
+        self.assertFalse(self.parser.compile("$if(%title%,$upper(%title%))").writes_context)
+        self.assertTrue(self.parser.compile("$if(%title%,$set(title,a))").writes_context)
+
+    def test_reads_writes(self):
+        script = self.parser.compile("%a%$get(b)$set(c,1)$if(%_x%,$copy(d,e))")
+        self.assertEqual(script.reads, set(["a", "b", "~x", "e"]))
+        self.assertEqual(script.writes, set(["c", "d"]))
+        self.assertEqual(script.functions, set(["get", "set", "if", "copy"]))
+
+    def test_reads_writes_unknown(self):
+        self.assertEqual(self.parser.compile("$get(%a%)").reads, None)
+        self.assertEqual(self.parser.compile("$performer()").reads, None)
+        script = self.parser.compile("$set(%a%,1)")
+        self.assertEqual(script.writes, None)
+        self.assertTrue(script.writes_context)
+
+    def test_profile(self):
+        self.parser.profile = ScriptProfile()
+        script = "$upper(a)\n$if(1,$lower($upper(b)))"
+        self.assertEqual(self.parser.eval(script), "A\nb")
+        self.assertEqual(self.parser.eval(script), "A\nb")
+        profile = self.parser.profile
+        calls = dict((name, calls) for name, calls, time in profile.top_functions())
+        self.assertEqual(calls, {"upper": 4, "lower": 2, "if": 2})
+        calls = dict((line, calls) for line, calls, time in profile.top_lines())
+        self.assertEqual(calls, {1: 2, 2: 6})
+        self.assertEqual(len(profile.top_functions(2)), 2)
+        total = sum(time for name, calls, time in profile.top_functions())
+        self.assertAlmostEqual(total, sum(time for line, calls, time in profile.top_lines()))
+        # Not profiled unless asked for
+        self.assertEqual(ScriptParser().eval(script), "A\nb")
+        self.assertEqual(profile.functions["upper"][0], 4)
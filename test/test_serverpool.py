@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from picard.serverpool import (
+    ServerPool,
+    parse_servers,
+    ROUTING_LEAST_OUTSTANDING,
+    )
+
+
+class ParseServersTest(unittest.TestCase):
+
+    def test_parse(self):
+        servers = parse_servers("mb1.local, mb2.local:5000/3\nmb3.local/2")
+        self.assertEqual([s.key for s in servers],
+                         [("mb1.local", 80), ("mb2.local", 5000), ("mb3.local", 80)])
+        self.assertEqual([s.weight for s in servers], [1, 3, 2])
+
+    def test_invalid(self):
+        self.assertEqual(parse_servers(""), [])
+        self.assertEqual(len(parse_servers("mb1.local:abc mb2.local/0 mb3.local")), 1)
+
+
+class ServerPoolTest(unittest.TestCase):
+
+    def test_round_robin(self):
+        pool = ServerPool(parse_servers("a b"))
+        chosen = [pool.choose(now=0).host for i in range(4)]
+        self.assertEqual(chosen, ["a", "b", "a", "b"])
+
+    def test_weighted_round_robin(self):
+        pool = ServerPool(parse_servers("a/3 b"))
+        chosen = [pool.choose(now=0).host for i in range(8)]
+        self.assertEqual(chosen.count("a"), 6)
+        self.assertEqual(chosen.count("b"), 2)
+        # Smooth: the light server is not starved for a whole cycle
+        self.assertTrue("b" in chosen[:4])
+
+    def test_least_outstanding(self):
+        pool = ServerPool(parse_servers("a b c"), ROUTING_LEAST_OUTSTANDING)
+        load = {"a": 3, "b": 1, "c": 2}
+        self.assertEqual(pool.choose(lambda s: load[s.host], now=0).host, "b")
+
+    def test_failover(self):
+        pool = ServerPool(parse_servers("a b"))
+        a, b = pool.servers
+        pool.mark_failed(a, now=0)
+        self.assertEqual([pool.choose(now=1).host for i in range(3)], ["b", "b", "b"])
+        # a is retried after the cooldown
+        self.assertTrue("a" in [pool.choose(now=10).host for i in range(2)])
+
+    def test_cooldown_grows(self):
+        pool = ServerPool(parse_servers("a"))
+        a = pool.servers[0]
+        pool.mark_failed(a, now=0)
+        first = a.down_until
+        pool.mark_failed(a, now=1)
+        self.assertEqual(a.down_until, first)
+        pool.mark_failed(a, now=first)
+        self.assertTrue(a.down_until - first > first)
+        pool.mark_ok(a)
+        self.assertEqual(a.failures, 0)
+
+    def test_all_down(self):
+        pool = ServerPool(parse_servers("a b"))
+        a, b = pool.servers
+        pool.mark_failed(a, now=0)
+        pool.mark_failed(b, now=1)
+        self.assertEqual(pool.choose(now=2).host, "a")
+
+    def test_exclude(self):
+        pool = ServerPool(parse_servers("a b"))
+        a, b = pool.servers
+        self.assertEqual(pool.choose(exclude=(a,), now=0).host, "b")
+        self.assertTrue(pool.choose(exclude=(a, b), now=0).host in ("a", "b"))
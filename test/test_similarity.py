@@ -1,5 +1,7 @@
+import random
 import unittest
-from picard.similarity import similarity
+from picard.similarity import similarity, similarity2, similarity_matrix, split_words
+from picard.util.astrcmp import astrcmp, astrcmp_bounded, astrcmp_matrix
 
 
 class SimilarityTest(unittest.TestCase):
@@ -8,3 +10,109 @@ class SimilarityTest(unittest.TestCase):
         self.assertEqual(similarity(u"K!", u"K!"), 1.0)
         self.assertEqual(similarity(u"BBB", u"AAA"), 0.0)
         self.assertAlmostEqual(similarity(u"ABC", u"ABB"), 0.7, 1)
+
+    def test_threshold(self):
+        self.assertEqual(similarity(u"ABC", u"ABB", 0.5), similarity(u"ABC", u"ABB"))
+        self.assertEqual(similarity(u"ABC", u"ABB", 0.9), 0.0)
+        self.assertEqual(similarity(u"K!", u"k", 1.0), 1.0)
+        self.assertEqual(similarity(u"", u"", 0.5), 0.0)
+
+    def test_similarity2(self):
+        self.assertEqual(similarity2(u"The Wall", u"the wall"), 1.0)
+        self.assertEqual(similarity2(u"", u"foo"), 0.0)
+        self.assertAlmostEqual(similarity2(u"Abbey Road", u"Road Abbey"), 1.0)
+        self.assertAlmostEqual(similarity2(u"Dark Side of the Moon", u"Dark Side"), 2 / 3.2)
+        # Cached words are not changed by matching
+        self.assertAlmostEqual(similarity2(u"Dark Side", u"Dark Side of the Moon"), 2 / 3.2)
+
+    def test_split_words(self):
+        self.assertEqual(split_words(u"Don't Stop!"), (u"don", u"t", u"stop"))
+        self.assertEqual(split_words(u"Don't Stop!"), (u"don", u"t", u"stop"))
+        self.assertEqual(split_words(u""), ())
+
+
+class SimilarityMatrixTest(unittest.TestCase):
+
+    words = [u"Abbey Road", u"abbey road!", u"Abbey Rd", u"Revolver", u"", u"Revolver (Remastered)"]
+
+    def expected(self, pairs, threshold):
+        result = []
+        for i, j in pairs:
+            s = similarity(self.words[i], self.words[j])
+            if s >= threshold:
+                result.append((i, j, s))
+        return result
+
+    def test_self(self):
+        n = len(self.words)
+        for threshold in (0.0, 0.5, 0.8, 1.0):
+            pairs = [(i, j) for i in range(n) for j in range(i + 1, n)]
+            self.assertEqual(similarity_matrix(self.words, None, threshold),
+                             self.expected(pairs, threshold))
+
+    def test_two_lists(self):
+        result = similarity_matrix([u"Revolver"], [u"revolver", u"Help!", u"Revolver 2"], 0.7)
+        self.assertEqual([(i, j) for i, j, s in result], [(0, 0), (0, 2)])
+        self.assertEqual(result[0][2], 1.0)
+
+    def test_same_as_all_pairs(self):
+        # Pairs found through the q-gram index are the same as with
+        # comparing all pairs
+        rand = random.Random(42)
+        base = [u"".join(rand.choice(u"abcde") for i in xrange(rand.randint(0, 16)))
+                for j in xrange(20)]
+        words = base + [w[:3] + w[4:] + rand.choice(u"ab") for w in base]
+        words += [w[1:2] + w[0:1] + w[2:] for w in base]
+        for threshold in (0.3, 0.6, 0.7, 0.8, 0.9, 1.0):
+            expected = []
+            for i in xrange(len(words)):
+                for j in xrange(i + 1, len(words)):
+                    s = astrcmp(words[i], words[j])
+                    if s >= threshold:
+                        expected.append((i, j, s))
+            self.assertEqual(astrcmp_matrix(words, None, threshold), expected)
+            self.assertEqual([m for m in astrcmp_matrix(words, words, threshold) if m[0] < m[1]],
+                             expected)
+
+    def test_empty(self):
+        for threshold in (0.0, 0.7):
+            self.assertEqual(astrcmp_matrix([], [u"b", u"d"], threshold), [])
+            self.assertEqual(astrcmp_matrix([u"b", u"d"], [], threshold), [])
+            self.assertEqual(astrcmp_matrix([], None, threshold), [])
+
+    def test_same_sequence(self):
+        # Passing the same sequence twice compares all pairs, not only i < j
+        words = (u"abc", u"abd", u"xyz")
+        for threshold in (0.0, 0.5):
+            expected = [(i, j, astrcmp(a, b)) for i, a in enumerate(words)
+                        for j, b in enumerate(words) if astrcmp(a, b) >= threshold]
+            self.assertEqual(sorted(astrcmp_matrix(words, words, threshold)), expected)
+        self.assertEqual(astrcmp_matrix(words, None, 0.5), [(0, 1, astrcmp(u"abc", u"abd"))])
+
+    def test_invalid(self):
+        self.assertEqual(similarity_matrix([], None, 0.5), [])
+        self.assertRaises(TypeError, astrcmp_matrix, [u"a", "b"], None, 0.5)
+
+
+class AstrcmpBoundedTest(unittest.TestCase):
+
+    words = [u"", u"a", u"ab", u"abc", u"acb", u"bca", u"abcd", u"abdc",
+             u"kitten", u"sitting", u"mitten", u"flaw", u"lawn",
+             u"ab" * 150, u"ba" * 150, u"ab" * 149 + u"aa"]
+
+    def test_same_as_astrcmp(self):
+        for a in self.words:
+            for b in self.words:
+                full = astrcmp(a, b)
+                for threshold in (0.0, 0.1, 0.5, 0.6, 0.75, 0.9, 1.0):
+                    expected = full if full >= threshold else 0.0
+                    self.assertEqual(astrcmp_bounded(a, b, threshold), expected,
+                                     (a, b, threshold))
+
+    def test_symmetric(self):
+        self.assertEqual(astrcmp_bounded(u"abc", u"abcdef", 0.4),
+                         astrcmp_bounded(u"abcdef", u"abc", 0.4))
+
+    def test_length_difference(self):
+        self.assertEqual(astrcmp_bounded(u"a", u"a" * 100, 0.5), 0.0)
+        self.assertEqual(astrcmp_bounded(u"a", u"a" * 100, 0.0), astrcmp(u"a", u"a" * 100))
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import zlib
+from picard import config
+from picard.metadata import Metadata
+from picard.tagcache import TagCache
+from picard.util.imageref import ImageRef
+
+
+class TagCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        config.setting = {
+            'rating_steps': 6,
+            'rating_user_email': 'users@musicbrainz.org',
+        }
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = TagCache(os.path.join(self.tmpdir, 'tag_cache.sqlite'))
+        self.filename = os.path.join(self.tmpdir, 'test.mp3')
+        with open(self.filename, 'w') as f:
+            f.write('audio')
+        self.stat = os.stat(self.filename)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def metadata(self):
+        metadata = Metadata()
+        metadata['title'] = u'Title'
+        metadata['artist'] = [u'A', u'B']
+        metadata['~bitrate'] = 192.0
+        metadata.length = 1234
+        metadata.add_image('image/jpeg', 'jpegdata', extras={'type': 'back', 'desc': u'Back'})
+        return metadata
+
+    def assertSameMetadata(self, metadata, other):
+        self.assertEqual(sorted(metadata.rawitems()), sorted(other.rawitems()))
+        self.assertEqual(metadata.length, other.length)
+        self.assertEqual(metadata.images, other.images)
+        for image in metadata.images:
+            self.assertTrue(isinstance(image['data'], ImageRef))
+            self.assertEqual(image['data'].read(), 'jpegdata')
+
+    def test_put_get(self):
+        self.assertEqual(self.cache.get(self.filename, self.stat), None)
+        metadata = self.metadata()
+        self.cache.put(self.filename, self.stat, metadata)
+        self.assertSameMetadata(self.cache.get(self.filename, self.stat), metadata)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_changed_file(self):
+        self.cache.put(self.filename, self.stat, self.metadata())
+        with open(self.filename, 'a') as f:
+            f.write('more audio')
+        self.assertEqual(self.cache.get(self.filename, os.stat(self.filename)), None)
+        os.utime(self.filename, (self.stat.st_atime, self.stat.st_mtime + 10))
+        stat = os.stat(self.filename)
+        self.cache.put(self.filename, stat, self.metadata())
+        os.utime(self.filename, (self.stat.st_atime, self.stat.st_mtime + 20))
+        self.assertEqual(self.cache.get(self.filename, os.stat(self.filename)), None)
+
+    def test_changed_settings(self):
+        self.cache.put(self.filename, self.stat, self.metadata())
+        config.setting['rating_steps'] = 11
+        self.assertEqual(self.cache.get(self.filename, self.stat), None)
+
+    def test_remove(self):
+        self.cache.put(self.filename, self.stat, self.metadata())
+        self.cache.remove(self.filename)
+        self.assertEqual(self.cache.get(self.filename, self.stat), None)
+
+    def test_persistent(self):
+        metadata = self.metadata()
+        self.cache.put(self.filename, self.stat, metadata)
+        self.cache.close()
+        self.cache = TagCache(self.cache.filename)
+        self.assertSameMetadata(self.cache.get(self.filename, self.stat), metadata)
+
+    def test_images_stored_once(self):
+        other = os.path.join(self.tmpdir, 'other.mp3')
+        self.cache.put(self.filename, self.stat, self.metadata())
+        self.cache.put(other, self.stat, self.metadata())
+        self.cache.flush()
+        db = self.cache._db
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM image").fetchone()[0], 1)
+        self.cache.remove(self.filename)
+        self.assertEqual(len(self.cache.get(other, self.stat).images), 1)
+
+    def test_evicted_image(self):
+        self.cache.put(self.filename, self.stat, self.metadata())
+        metadata = self.cache.get(self.filename, self.stat, lambda ref: 'jpegdata')
+        self.cache._db.execute("DELETE FROM image")
+        self.assertEqual(metadata.images[0]['data'].read(), 'jpegdata')
+        metadata = self.cache.get(self.filename, self.stat)
+        self.assertRaises(IOError, metadata.images[0]['data'].read)
+
+    def test_evict(self):
+        self.cache.max_size = 2000
+        for i in range(50):
+            metadata = self.metadata()
+            metadata['comment'] = os.urandom(50).encode('hex')
+            metadata.images = []
+            self.cache.put(os.path.join(self.tmpdir, '%d.mp3' % i), self.stat, metadata)
+        self.assertTrue(self.cache._size <= 2000)
+        self.assertNotEqual(self.cache.get(os.path.join(self.tmpdir, '49.mp3'), self.stat), None)
+        self.assertEqual(self.cache.get(os.path.join(self.tmpdir, '0.mp3'), self.stat), None)
+
+    def test_locked_database(self):
+        self.cache.put(self.filename, self.stat, self.metadata())
+        self.cache.flush()
+        self.cache._db.execute("PRAGMA busy_timeout = 0")
+        other = sqlite3.connect(self.cache.filename)
+        other.execute("BEGIN EXCLUSIVE")
+        try:
+            self.assertEqual(self.cache.get(self.filename, self.stat), None)
+            self.assertEqual(self.cache.read_image('0' * 40), None)
+            self.cache.put(self.filename, self.stat, self.metadata())
+            self.cache.remove(self.filename)
+            self.cache.flush()
+        finally:
+            other.rollback()
+            other.close()
+        self.assertSameMetadata(self.cache.get(self.filename, self.stat), self.metadata())
+
+    def test_closed_database(self):
+        self.cache.put(self.filename, self.stat, self.metadata())
+        self.cache._db.close()
+        self.assertEqual(self.cache.get(self.filename, self.stat), None)
+        self.assertEqual(self.cache.read_image('0' * 40), None)
+        self.cache.put(self.filename, self.stat, self.metadata())
+        self.cache.remove(self.filename)
+        self.cache.flush()
+        self.cache.clear()
+
+    def test_corrupt_entry(self):
+        for data in ('garbage', zlib.compress('{"tags": 1'), zlib.compress('{"tags": []}'),
+                     zlib.compress('{"tags": [], "length": 0, "images": [{"size": 1}]}')):
+            self.cache.put(self.filename, self.stat, self.metadata())
+            self.cache._db.execute("UPDATE file SET data = ?", (sqlite3.Binary(data),))
+            self.assertEqual(self.cache.get(self.filename, self.stat), None)
+            count = self.cache._db.execute("SELECT COUNT(*) FROM file").fetchone()[0]
+            self.assertEqual(count, 0)
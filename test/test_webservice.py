@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from collections import deque
+from PyQt4 import QtCore, QtNetwork
+from picard import config
+from picard.webservice import XmlNode, XmlTreeBuilder, XmlWebService, _read_xml
+from picard.webservicecache import ResponseCache
+
+
+RELEASE_XML = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#" '
+    'xmlns:ext="http://musicbrainz.org/ns/ext#-2.0">'
+    '<release id="123" ext:score="100">'
+    '<title>Caf\xc3\xa9 &amp; Bar</title>'
+    '<medium-list count="1"><medium><position>1</position></medium></medium-list>'
+    '</release></metadata>')
+
+
+class XmlTreeBuilderTest(unittest.TestCase):
+
+    def check_release(self, document):
+        release = document.metadata[0].release[0]
+        self.assertEqual(release.id, u'123')
+        self.assertEqual(release.score, u'100')
+        self.assertEqual(release.title[0].text, u'Caf\xe9 & Bar')
+        self.assertEqual(release.medium_list[0].count, u'1')
+        self.assertEqual(release.medium_list[0].medium[0].position[0].text, u'1')
+
+    def test_read_xml(self):
+        self.check_release(_read_xml(RELEASE_XML))
+
+    def test_chunked(self):
+        builder = XmlTreeBuilder()
+        for i in range(0, len(RELEASE_XML), 5):
+            builder.feed(RELEASE_XML[i:i + 5])
+        self.check_release(builder.close())
+
+    def test_malformed(self):
+        document = _read_xml('<metadata><title>Foo</title><release')
+        self.assertEqual(document.metadata[0].title[0].text, u'Foo')
+        self.assertFalse('release' in document.metadata[0].children)
+
+
+class XmlNodeTest(unittest.TestCase):
+
+    def test_attribute_access(self):
+        node = XmlNode()
+        child = node.append_child('title')
+        child.text = u'Foo'
+        node.attribs['id'] = u'123'
+        self.assertEqual(node.title, [child])
+        self.assertEqual(node.id, u'123')
+        self.assertEqual(node.children, {'title': [child]})
+        self.assertRaises(AttributeError, getattr, node, 'foo')
+
+    def test_lazy(self):
+        node = XmlNode()
+        self.assertEqual(node._children, None)
+        self.assertEqual(node._attribs, None)
+        self.assertRaises(AttributeError, getattr, node, 'foo')
+        self.assertFalse('foo' in node.children)
+        self.assertEqual(node.attribs.get('foo'), None)
+
+    def test_shared_names(self):
+        document = _read_xml('<a><b x="1"/><b x="1"/></a>')
+        b1, b2 = document.a[0].b
+        self.assertTrue(b1.attribs.keys()[0] is b2.attribs.keys()[0])
+        self.assertTrue(b1.x is b2.x)
+
+
+class FakeSignal(object):
+
+    def emit(self, *args):
+        pass
+
+
+class FakeTimer(object):
+
+    def start(self, msec):
+        pass
+
+    def isActive(self):
+        return False
+
+
+class FakeUrl(object):
+
+    def __init__(self, host=u"", port=80, path=u""):
+        self._host = host
+        self._port = port
+        self._path = path
+
+    def isEmpty(self):
+        return not self._host
+
+    def host(self):
+        return self._host
+
+    def port(self, default=-1):
+        return self._port
+
+    def toString(self, options=None):
+        return self._path
+
+
+class FakeVariant(object):
+
+    def __init__(self, value):
+        self.value = value
+
+    def toUrl(self):
+        return self.value
+
+    def toBool(self):
+        return bool(self.value)
+
+    def toInt(self):
+        return (self.value or 0, True)
+
+    def toString(self):
+        return unicode(self.value or u"")
+
+
+class FakeRequest(object):
+
+    def __init__(self, url):
+        self._url = url
+
+    def url(self):
+        return self._url
+
+    def attribute(self, attribute):
+        return None
+
+
+class FakeReply(object):
+
+    def __init__(self, url, data="", redirect=None):
+        self._request = FakeRequest(url)
+        self.data = data
+        self.redirect = redirect or FakeUrl()
+
+    def request(self):
+        return self._request
+
+    def attribute(self, attribute):
+        if attribute == QtNetwork.QNetworkRequest.RedirectionTargetAttribute:
+            return FakeVariant(self.redirect)
+        if attribute == QtNetwork.QNetworkRequest.HttpStatusCodeAttribute:
+            return FakeVariant(200)
+        return FakeVariant(None)
+
+    def error(self):
+        return 0
+
+    def readAll(self):
+        data, self.data = self.data, ""
+        return data
+
+    def close(self):
+        pass
+
+
+class FakeWebService(XmlWebService):
+
+    def __init__(self):
+        QtCore.QObject.__init__(self)
+        self.tagger = self
+        self.tagger_stats_changed = FakeSignal()
+        self.response_cache = None
+        self.num_pending_web_requests = 0
+        self.num_active_requests = 0
+        self._pending_gets = {}
+        self._get_waiters = {}
+        self._high_priority_queues = {}
+        self._low_priority_queues = {}
+        self._active_requests = {}
+        self._xml_builders = {}
+        self._rate_limiters = {}
+        self._server_pool = None
+        self._server_pool_config = None
+        self._timer = FakeTimer()
+        self._cached_replies = deque()
+        self._cache_timer = FakeTimer()
+        self.started = []
+
+    def add_task(self, func, host, port, priority, important=False):
+        queues = self._high_priority_queues if priority else self._low_priority_queues
+        queues.setdefault((host, port), deque()).append(func)
+        self.num_pending_web_requests += 1
+        return ((host, port), func, priority)
+
+    def run_tasks(self):
+        for queues in (self._high_priority_queues, self._low_priority_queues):
+            for queue in queues.values():
+                while queue:
+                    queue.popleft()()
+
+    def _start_request(self, method, host, port, path, data, handler, xml,
+                       mblogin=False, cacheloadcontrol=None, cachekey=None):
+        url = FakeUrl(host, port, path)
+        self.started.append((url, handler, xml, cachekey))
+        return True
+
+    def reply(self, index, data="", redirect=None):
+        url, handler, xml, cachekey = self.started[index]
+        reply = FakeReply(url, data, redirect)
+        self._active_requests[reply] = (FakeRequest(url), handler, xml, cachekey,
+                                        (url.host(), url.port()))
+        if xml:
+            self._xml_builders[reply] = (XmlTreeBuilder(), [] if cachekey is not None else None)
+        self.num_active_requests += 1
+        self._process_reply(reply)
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ws = FakeWebService()
+        self.results = []
+
+    def handler(self, name):
+        def handler(document, reply, error):
+            self.results.append((name, document.metadata[0].release[0].id, error))
+        return handler
+
+    def test_coalesced(self):
+        ws = self.ws
+        task1 = ws.get("mb.org", 80, "/ws/2/release/123", self.handler("a"))
+        task2 = ws.get("mb.org", 80, "/ws/2/release/123", self.handler("b"))
+        ws.get("mb.org", 80, "/ws/2/release/456", self.handler("c"))
+        ws.get("mb.org", 80, "/ws/2/release/123", self.handler("d"), mblogin=True)
+        self.assertEqual(len(task1), 3)
+        self.assertEqual(len(task2), 3)
+        self.assertEqual(ws.num_pending_web_requests, 3)
+        ws.run_tasks()
+        self.assertEqual([started[0].toString() for started in ws.started],
+                         ["/ws/2/release/123", "/ws/2/release/456", "/ws/2/release/123"])
+        ws.reply(0, RELEASE_XML)
+        self.assertEqual(self.results, [("a", u"123", 0), ("b", u"123", 0)])
+        self.assertEqual(sorted(ws._pending_gets), [
+            ("mb.org", 80, "/ws/2/release/123", True, None),
+            ("mb.org", 80, "/ws/2/release/456", False, None),
+        ])
+        # A new request once the reply was delivered
+        ws.get("mb.org", 80, "/ws/2/release/123", self.handler("e"))
+        self.assertEqual(ws.num_pending_web_requests, 4)
+
+    def test_remove_task(self):
+        ws = self.ws
+        task1 = ws.get("mb.org", 80, "/ws/2/release/123", self.handler("a"))
+        task2 = ws.get("mb.org", 80, "/ws/2/release/123", self.handler("b"))
+        # The request stays queued while another handler waits for it
+        ws.remove_task(task1)
+        self.assertEqual(ws.num_pending_web_requests, 1)
+        ws.remove_task(task2)
+        self.assertEqual(ws.num_pending_web_requests, 0)
+        self.assertEqual(ws._pending_gets, {})
+        self.assertEqual(ws._get_waiters, {})
+
+    def test_remove_running_task(self):
+        ws = self.ws
+        task1 = ws.get("mb.org", 80, "/ws/2/release/123", self.handler("a"))
+        ws.get("mb.org", 80, "/ws/2/release/123", self.handler("b"))
+        ws.run_tasks()
+        ws.remove_task(task1)
+        ws.reply(0, RELEASE_XML)
+        self.assertEqual(self.results, [("b", u"123", 0)])
+
+    def test_redirect(self):
+        ws = self.ws
+        ws.get("mb.org", 80, "/ws/2/release/123", self.handler("a"))
+        ws.run_tasks()
+        ws.reply(0, redirect=FakeUrl("mirror.mb.org", 8080, "/ws/2/release/123"))
+        # Attaches to the original request, which is still pending
+        ws.get("mb.org", 80, "/ws/2/release/123", self.handler("b"))
+        ws.run_tasks()
+        self.assertEqual(len(ws.started), 2)
+        url = ws.started[1][0]
+        self.assertEqual((url.host(), url.port()), ("mirror.mb.org", 8080))
+        ws.reply(1, RELEASE_XML)
+        self.assertEqual(self.results, [("a", u"123", 0), ("b", u"123", 0)])
+        self.assertEqual(ws._pending_gets, {})
+
+    def test_download_not_coalesced(self):
+        ws = self.ws
+        ws.download("coverartarchive.org", 80, "/release/123/front", self.handler("a"))
+        ws.download("coverartarchive.org", 80, "/release/123/front", self.handler("b"))
+        self.assertEqual(ws.num_pending_web_requests, 2)
+        self.assertEqual(ws._pending_gets, {})
+
+    def test_cacheloadcontrol(self):
+        ws = self.ws
+        ws.get("mb.org", 80, "/ws/2/release/123", self.handler("a"))
+        ws.get("mb.org", 80, "/ws/2/release/123", self.handler("b"),
+               cacheloadcontrol=QtNetwork.QNetworkRequest.AlwaysNetwork)
+        self.assertEqual(ws.num_pending_web_requests, 2)
+
+    def test_server_pool(self):
+        config.setting = {
+            'server_pool': u'a.mb.org b.mb.org',
+            'server_pool_routing': u'round-robin',
+            'server_pool_request_delay': 1000,
+            'server_pool_max_requests': 6,
+        }
+        ws = self.ws
+        ws._mb_get("/ws/2/release/123", self.handler("a"))
+        ws._mb_get("/ws/2/release/123", self.handler("b"))
+        self.assertEqual(ws.num_pending_web_requests, 1)
+        ws.run_tasks()
+        ws.reply(0, RELEASE_XML)
+        self.assertEqual(self.results, [("a", u"123", 0), ("b", u"123", 0)])
+
+
+class ResponseCacheIntegrationTest(unittest.TestCase):
+
+    def setUp(self):
+        config.setting = {
+            'server_host': u'musicbrainz.org',
+            'server_port': 80,
+            'server_pool': u'',
+            'server_pool_routing': u'round-robin',
+            'server_pool_request_delay': 1000,
+            'server_pool_max_requests': 6,
+            'username': u'user',
+        }
+        self.tmpdir = tempfile.mkdtemp()
+        self.ws = FakeWebService()
+        self.ws.response_cache = ResponseCache(os.path.join(self.tmpdir, 'ws_cache.sqlite'))
+        self.results = []
+
+    def tearDown(self):
+        self.ws.response_cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def handler(self, document, reply, error):
+        self.results.append((document.metadata[0].release[0].id, reply is None))
+
+    def load(self, **kwargs):
+        # Returns if the release was served from the cache
+        ws = self.ws
+        started = len(ws.started)
+        ws.get_release_by_id(u"123", self.handler, **kwargs)
+        ws.run_tasks()
+        if len(ws.started) > started:
+            ws.reply(started, RELEASE_XML)
+        ws._run_cached_replies()
+        self.assertEqual(self.results.pop(), (u"123", len(ws.started) == started))
+        return len(ws.started) == started
+
+    def test_cached(self):
+        self.assertFalse(self.load(inc=['media']))
+        self.assertTrue(self.load(inc=['media']))
+        self.assertFalse(self.load(inc=['media'], refresh=True))
+        self.assertFalse(self.load(inc=['media'], mblogin=True))
+        self.assertTrue(self.load(inc=['media'], mblogin=True))
+
+    def test_port(self):
+        self.assertFalse(self.load(inc=['media']))
+        config.setting['server_port'] = 5000
+        self.assertFalse(self.load(inc=['media']))
+        self.assertTrue(self.load(inc=['media']))
+
+    def test_user_ratings(self):
+        self.assertFalse(self.load(inc=['media', 'user-ratings'], mblogin=True))
+        self.assertFalse(self.load(inc=['media', 'user-ratings'], mblogin=True))
+
+    def test_failing_handler(self):
+        self.assertFalse(self.load(inc=['media']))
+        ws = self.ws
+
+        def fail(document, reply, error):
+            raise ValueError("handler failed")
+        ws.get_release_by_id(u"123", fail, inc=['media'])
+        ws.get_release_by_id(u"123", self.handler, inc=['media'])
+        ws._run_cached_replies()
+        self.assertEqual(self.results, [(u"123", True)])
+        self.assertEqual(len(ws._cached_replies), 0)
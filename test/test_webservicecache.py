@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from picard.webservicecache import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'ws_cache.sqlite')
+        self.cache = ResponseCache(self.filename)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_key_normalizes_includes(self):
+        key1 = ResponseCache.make_key('release', 'abc', ['media', 'labels', 'media'])
+        key2 = ResponseCache.make_key('release', 'abc', ['labels', 'media'])
+        self.assertEqual(key1, key2)
+
+    def test_key_differs(self):
+        key = ResponseCache.make_key('release', 'abc', ['media'])
+        self.assertNotEqual(key, ResponseCache.make_key('recording', 'abc', ['media']))
+        self.assertNotEqual(key, ResponseCache.make_key('release', 'abd', ['media']))
+        self.assertNotEqual(key, ResponseCache.make_key('release', 'abc', ['labels']))
+        self.assertNotEqual(key, ResponseCache.make_key('release', 'abc', ['media'], user='bob'))
+
+    def test_put_get(self):
+        self.assertEqual(self.cache.get('key'), None)
+        self.cache.put('key', '<metadata/>')
+        self.assertEqual(self.cache.get('key'), '<metadata/>')
+        self.cache.put('key', '<metadata></metadata>')
+        self.assertEqual(self.cache.get('key'), '<metadata></metadata>')
+        self.assertEqual(self.cache.hits, 2)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_persistent(self):
+        self.cache.put('key', 'data')
+        self.cache.close()
+        self.cache = ResponseCache(self.filename)
+        self.assertEqual(self.cache.get('key'), 'data')
+
+    def test_expired(self):
+        self.cache.max_age = 0
+        self.cache.put('key', 'data')
+        time.sleep(0.01)
+        self.assertEqual(self.cache.get('key'), None)
+
+    def test_remove(self):
+        self.cache.put('key', 'data')
+        self.cache.remove('key')
+        self.assertEqual(self.cache.get('key'), None)
+
+    def test_lru_eviction(self):
+        data = os.urandom(1000)
+        self.cache.max_size = 3500
+        self.cache.put('a', data)
+        self.cache.put('b', data)
+        self.cache.put('c', data)
+        self.cache.get('a')
+        self.cache.put('d', data)
+        self.assertEqual(self.cache.get('a'), data)
+        self.assertEqual(self.cache.get('b'), None)
+        self.assertEqual(self.cache.get('d'), data)